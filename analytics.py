@@ -0,0 +1,238 @@
+import numpy as np
+
+from columnar import load_columns, read_meta, save_node_columns
+
+# --- CONFIGURAZIONE ---
+INPUT_PATH = 'dataset_hashtag.cols'   # Dataset a colonne da analizzare
+BETWEENNESS_SAMPLES = 256             # Sorgenti campionate per la betweenness approssimata
+
+
+class CSRGraph:
+    """Grafo diretto su ID interi in formato CSR (indptr / indices / weights).
+    Gli archi multipli (stesso utente che risponde più volte allo stesso autore)
+    diventano un solo arco con peso = numero di risposte."""
+
+    def __init__(self, handles, indptr, indices, weights):
+        self.handles = np.asarray(handles, dtype=object)
+        self.n = len(self.handles)
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        # Riga (nodo sorgente) di ogni elemento non nullo
+        self.rows = np.repeat(np.arange(self.n, dtype=np.int64), np.diff(indptr))
+
+    # --- COSTRUZIONE ---
+    @classmethod
+    def from_ids(cls, sources, targets, handles):
+        n = len(handles)
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        keys, counts = np.unique(sources * n + targets, return_counts=True)
+        rows, indices = keys // n, keys % n
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+        return cls(handles, indptr, indices, counts.astype(np.float64))
+
+    @classmethod
+    def from_edges(cls, edges):
+        """Da una lista di (source_handle, target_handle[, attr]), come all_edges."""
+        handle_ids = {}
+        sources = [handle_ids.setdefault(edge[0], len(handle_ids)) for edge in edges]
+        targets = [handle_ids.setdefault(edge[1], len(handle_ids)) for edge in edges]
+        return cls.from_ids(sources, targets, list(handle_ids))
+
+    @classmethod
+    def from_columnar(cls, path):
+        cols = load_columns(path, mmap=True)
+        return cls.from_ids(cols['edges.source'], cols['edges.target'], cols['nodes.handle'])
+
+    @classmethod
+    def from_networkx(cls, G):
+        return cls.from_edges(list(G.edges()))
+
+    # --- GRADI ---
+    def out_degree(self, weighted=True):
+        if weighted:
+            return np.bincount(self.rows, weights=self.weights, minlength=self.n)
+        return np.diff(self.indptr).astype(np.float64)
+
+    def in_degree(self, weighted=True):
+        return np.bincount(self.indices, weights=self.weights if weighted else None, minlength=self.n)
+
+    # --- CENTRALITÀ ---
+    def pagerank(self, alpha=0.85, tol=1e-10, max_iter=200):
+        """PageRank pesato (stessa convenzione di nx.pagerank: i nodi senza uscite
+        distribuiscono il proprio rank in modo uniforme)."""
+        out_w = self.out_degree()
+        dangling = out_w == 0
+        share = np.divide(self.weights, out_w[self.rows])
+        p = np.full(self.n, 1.0 / self.n)
+        for _ in range(max_iter):
+            spread = np.bincount(self.indices, weights=p[self.rows] * share, minlength=self.n)
+            new = alpha * spread + (alpha * p[dangling].sum() + (1.0 - alpha)) / self.n
+            err = np.abs(new - p).sum()
+            p = new
+            if err < self.n * tol:
+                break
+        return p
+
+    def hits(self, tol=1e-10, max_iter=200):
+        """Restituisce (hub, authority), normalizzati a somma 1."""
+        h = np.full(self.n, 1.0 / self.n)
+        a = h
+        for _ in range(max_iter):
+            a = np.bincount(self.indices, weights=h[self.rows] * self.weights, minlength=self.n)
+            new_h = np.bincount(self.rows, weights=a[self.indices] * self.weights, minlength=self.n)
+            if new_h.max() > 0:
+                new_h /= new_h.max()
+            if a.max() > 0:
+                a /= a.max()
+            err = np.abs(new_h - h).sum()
+            h = new_h
+            if err < self.n * tol:
+                break
+        h_sum, a_sum = h.sum(), a.sum()
+        return (h / h_sum if h_sum else h), (a / a_sum if a_sum else a)
+
+    def core_number(self):
+        """k-core del grafo non orientato semplice (senza self-loop), per "sbucciatura" a blocchi."""
+        mask = self.rows != self.indices
+        u = np.minimum(self.rows[mask], self.indices[mask])
+        v = np.maximum(self.rows[mask], self.indices[mask])
+        pairs = np.unique(u * self.n + v)
+        u, v = pairs // self.n, pairs % self.n
+        degree = np.bincount(u, minlength=self.n) + np.bincount(v, minlength=self.n)
+
+        core = np.zeros(self.n, dtype=np.int64)
+        alive = np.ones(self.n, dtype=bool)
+        k = 0
+        while alive.any():
+            k = max(k, degree[alive].min())
+            while True:
+                remove = alive & (degree <= k)
+                if not remove.any():
+                    break
+                core[remove] = k
+                alive[remove] = False
+                # Ogni arco tra un nodo rimosso e uno vivo toglie 1 al grado del vivo
+                hit_v = remove[u] & alive[v]
+                hit_u = remove[v] & alive[u]
+                degree -= (np.bincount(v[hit_v], minlength=self.n)
+                           + np.bincount(u[hit_u], minlength=self.n))
+                keep = alive[u] & alive[v]
+                u, v = u[keep], v[keep]
+        return core
+
+    def approx_betweenness(self, k=BETWEENNESS_SAMPLES, seed=0, normalized=True):
+        """Betweenness approssimata (Brandes su k sorgenti campionate, BFS non pesata
+        per livelli: ogni livello è una sola operazione vettoriale)."""
+        rng = np.random.default_rng(seed)
+        k = min(k, self.n)
+        bc = np.zeros(self.n)
+        for s in rng.choice(self.n, size=k, replace=False):
+            dist = np.full(self.n, -1, dtype=np.int64)
+            sigma = np.zeros(self.n)
+            dist[s], sigma[s] = 0, 1.0
+            frontier = np.array([s])
+            path_edges = []     # per livello: (sorgenti, destinazioni) sui cammini minimi
+            level = 0
+            while frontier.size:
+                src, dst = self._expand(frontier)
+                unseen = dst[dist[dst] == -1]
+                frontier = np.unique(unseen)
+                dist[frontier] = level + 1
+                on_path = dist[dst] == level + 1
+                src, dst = src[on_path], dst[on_path]
+                np.add.at(sigma, dst, sigma[src])
+                path_edges.append((src, dst))
+                level += 1
+
+            delta = np.zeros(self.n)
+            for src, dst in reversed(path_edges):
+                np.add.at(delta, src, sigma[src] / sigma[dst] * (1.0 + delta[dst]))
+            delta[s] = 0.0
+            bc += delta
+
+        if k:
+            bc *= self.n / k
+        if normalized and self.n > 2:
+            bc /= (self.n - 1) * (self.n - 2)
+        return bc
+
+    # --- COMUNITÀ ---
+    def undirected_edges(self):
+        """Archi (u, v, peso) del grafo non orientato, in entrambe le direzioni e senza self-loop."""
+        mask = self.rows != self.indices
+        u, v, w = self.rows[mask], self.indices[mask], self.weights[mask]
+        return np.concatenate([u, v]), np.concatenate([v, u]), np.concatenate([w, w])
+
+    def label_propagation(self, seed=0, max_iter=100):
+        """Comunità per propagazione delle etichette sul grafo non orientato pesato:
+        ogni nodo prende l'etichetta più pesante tra i vicini (a parità tiene la sua).
+        A ogni giro si aggiorna metà dei nodi, a caso, per evitare le oscillazioni
+        della versione sincrona. Etichette 0..k-1, dalla comunità più grande."""
+        rng = np.random.default_rng(seed)
+        u, v, w = self.undirected_edges()
+        labels = np.arange(self.n, dtype=np.int64)
+        for _ in range(max_iter):
+            keys, inverse = np.unique(u * self.n + labels[v], return_inverse=True)
+            score = np.bincount(inverse, weights=w)
+            node, label = keys // self.n, keys % self.n
+            # Per ogni nodo: peso massimo, poi l'etichetta attuale, poi a caso
+            order = np.lexsort((rng.random(len(keys)), label != labels[node], -score, node))
+            first = order[np.r_[True, node[order][1:] != node[order][:-1]]]
+            best = labels.copy()
+            best[node[first]] = label[first]
+            if (best == labels).all():
+                break
+            labels = np.where(rng.random(self.n) < 0.5, best, labels)
+        _, inverse, counts = np.unique(labels, return_inverse=True, return_counts=True)
+        rank = np.empty(len(counts), dtype=np.int64)
+        rank[np.argsort(-counts, kind='stable')] = np.arange(len(counts))
+        return rank[inverse]
+
+    def _expand(self, frontier):
+        # Tutti gli archi uscenti dai nodi della frontiera, senza cicli Python
+        starts = self.indptr[frontier]
+        counts = self.indptr[frontier + 1] - starts
+        total = counts.sum()
+        src = np.repeat(frontier, counts)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        dst = self.indices[np.repeat(starts, counts) + offsets]
+        return src, dst
+
+    # --- RISULTATI ---
+    def to_dict(self, values):
+        return dict(zip(self.handles.tolist(), np.asarray(values).tolist()))
+
+    def set_node_attributes(self, G, name, values):
+        """Scrive i valori come attributo dei nodi di un grafo NetworkX."""
+        import networkx as nx
+        nx.set_node_attributes(G, self.to_dict(values), name)
+
+
+def compute_all(graph, betweenness_samples=BETWEENNESS_SAMPLES):
+    hub, authority = graph.hits()
+    return {
+        'in_degree': graph.in_degree(),
+        'out_degree': graph.out_degree(),
+        'pagerank': graph.pagerank(),
+        'hub': hub,
+        'authority': authority,
+        'core': graph.core_number(),
+        'betweenness': graph.approx_betweenness(k=betweenness_samples),
+    }
+
+
+if __name__ == "__main__":
+    meta = read_meta(INPUT_PATH)
+    print(f"📈 Analisi di {INPUT_PATH}: {meta['n_nodes']} nodi, {meta['n_edges']} archi")
+    graph = CSRGraph.from_columnar(INPUT_PATH)
+    results = compute_all(graph)
+    save_node_columns(INPUT_PATH, results)
+
+    top = np.argsort(results['pagerank'])[::-1][:10]
+    print("🏆 Top 10 per PageRank:")
+    for i in top:
+        print(f"   {graph.handles[i]}: {results['pagerank'][i]:.4f} (risposte ricevute: {results['in_degree'][i]:.0f})")
+    print(f"✅ Metriche scritte come colonne dei nodi in {INPUT_PATH}")
@@ -0,0 +1,546 @@
+import base64
+import contextlib
+import importlib
+import io
+import json
+import os
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from multiprocessing import get_context
+
+import httpx
+from atproto_client.request import Request
+
+import ratelimit
+
+# --- CONFIGURAZIONE ---
+# Quali misure eseguire: 'script33' (get_thread_data), 'script2' (process_single_thread
+# dentro il crawler a valanga) e 'serialization' (GEXF contro gli altri formati)
+SCENARIOS = ('script33', 'script2', 'serialization')
+
+# Server finto
+SEED = 42
+N_USERS = 20000            # Utenti sintetici (pochi molto attivi, molti occasionali)
+THREAD_SCALE = 10          # Scala della distribuzione di Pareto delle risposte per thread
+THREAD_ALPHA = 1.2         # Coda della Pareto (più basso = thread enormi più frequenti)
+MAX_THREAD_SIZE = 5000     # Tetto alle risposte di un singolo thread
+LATENCY_MS = 60            # Latenza media di ogni richiesta
+LATENCY_JITTER = 0.5       # Dispersione (lognormale) della latenza
+ERROR_RATE_429 = 0.02      # Frazione di richieste rifiutate con 429
+RETRY_AFTER = 0.5          # Secondi fino al ratelimit-reset comunicato col 429
+SERVER_QUOTA = 0           # Richieste per finestra di 5 minuti (0 = illimitate, 3000 = quota reale)
+
+# Raccolta
+N_THREADS = 200            # Thread radice scaricati per scenario
+MAX_WORKERS = 4            # Thread scaricati in parallelo (come negli script)
+REQUESTS_PER_SECOND = 0    # Tetto del fetcher (0 = nessun tetto: misuriamo il codice, non la quota)
+BASE_BACKOFF = 0.1         # Backoff dopo un 429 (ridotto rispetto al default per tenere brevi i run)
+SNOWBALL_MAX_NODES = 2000  # Budget di utenti per lo scenario a valanga
+
+# Serializzazione
+SERIALIZATION_SIZES = (10_000, 100_000, 1_000_000)
+NX_MAX_EDGES = 1_000_000   # Oltre questa soglia saltiamo il GEXF di networkx (lento e pesante in RAM)
+
+# Risultati: una riga JSON per esecuzione, confrontata con la precedente
+RESULTS_PATH = 'benchmark_results.jsonl'
+REGRESSION_THRESHOLD = 0.10   # Peggioramento relativo oltre il quale segnaliamo una regressione
+MIN_SECONDS_DELTA = 0.05      # Sotto questa differenza assoluta i tempi sono solo rumore
+
+_URI = re.compile(r'/r(\d+)x(\d+)$')
+_CID = 'bafyreig2fjxi3qbp5jvyqx2i4djxs3ttrmvhyqxdbaqf3zkm7ypj4s5ymy'
+_BASE_TIME = 1_700_000_000
+_WORDS = ('il', 'la', 'che', 'non', 'per', 'una', 'sono', 'the', 'and', 'this', 'is', 'not', 'vote',
+          'climate', 'government', 'people', 'really', 'great', 'terrible', 'why', 'true', 'fake',
+          'news', 'election', 'policy', 'war', 'economy', 'love', 'hate', 'agree', 'wrong', '#politics',
+          '#trump', '#climate', '🔥', '😂', '👏', '🤔', 'lol', 'wow', 'never', 'always', 'again')
+
+
+# --- SERVER BLUESKY SINTETICO ---
+class _Thread:
+    __slots__ = ('authors', 'children', 'texts', 'times', 'likes')
+
+
+class FakeBluesky:
+    """Server XRPC sintetico da montare sotto l'atproto Client vero (httpx.MockTransport):
+    risponde a searchPosts, getAuthorFeed, getPostThread, getProfiles e al login, con
+    thread di dimensione a coda pesante, latenza configurabile e 429 iniettati.
+
+    Tutto è deterministico: lo stesso URI restituisce sempre lo stesso albero, così i
+    rifetch dei sottoalberi di walk_thread vedono gli stessi post."""
+
+    def __init__(self, seed=SEED, n_users=N_USERS, scale=THREAD_SCALE, alpha=THREAD_ALPHA,
+                 max_size=MAX_THREAD_SIZE, latency_ms=LATENCY_MS, jitter=LATENCY_JITTER,
+                 error_rate=ERROR_RATE_429, retry_after=RETRY_AFTER, quota=SERVER_QUOTA):
+        self.seed = seed
+        self.n_users = n_users
+        self.scale = scale
+        self.alpha = alpha
+        self.max_size = max_size
+        self.latency = latency_ms / 1000
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.quota = quota
+        self.requests = Counter()
+        self.throttled = 0
+        self._window_start = time.time()
+        self._window_count = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.thread = lru_cache(maxsize=1024)(self._build_thread)
+
+    # --- CONTENUTI ---
+    def _user(self, rng):
+        # Attività a coda pesante: gli id bassi scrivono molto più spesso
+        return int(self.n_users * rng.random() ** 4)
+
+    def _build_thread(self, root):
+        rng = random.Random(self.seed * 1_000_003 + root)
+        size = min(self.max_size, int(self.scale * (rng.paretovariate(self.alpha) - 1)))
+        t = _Thread()
+        t.authors = [self._user(rng) for _ in range(size + 1)]
+        t.children = [[] for _ in range(size + 1)]
+        for k in range(1, size + 1):
+            # Metà delle risposte va al post radice, il resto a una risposta precedente
+            t.children[0 if rng.random() < 0.5 else rng.randrange(k)].append(k)
+        t.texts = [' '.join(rng.choices(_WORDS, k=rng.randint(5, 40))) for _ in range(size + 1)]
+        start = _BASE_TIME + root % 10_000_000
+        t.times = [start + k * rng.randint(1, 60) for k in range(size + 1)]
+        t.likes = [int(rng.paretovariate(1.5)) - 1 for _ in range(size + 1)]
+        return t
+
+    def handle(self, root, k, t=None):
+        return f'u{(t or self.thread(root)).authors[k]}.bsky.social'
+
+    def uri(self, root, k, t=None):
+        return f'at://did:plc:u{(t or self.thread(root)).authors[k]}/app.bsky.feed.post/r{root}x{k}'
+
+    def _roots(self, key, offset, limit):
+        # Post radice "trovati" da una ricerca o nel feed di un utente
+        base = zlib.crc32(key.encode()) * 100_000
+        return [base + i for i in range(offset, min(offset + limit, 100_000))]
+
+    def _time(self, seconds):
+        return time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(seconds))
+
+    def post_view(self, root, k, t=None):
+        t = t or self.thread(root)
+        author = t.authors[k]
+        return {
+            'uri': self.uri(root, k, t), 'cid': _CID,
+            'author': {'did': f'did:plc:u{author}', 'handle': f'u{author}.bsky.social'},
+            'record': {'$type': 'app.bsky.feed.post', 'text': t.texts[k], 'createdAt': self._time(t.times[k])},
+            'indexedAt': self._time(t.times[k] + 1),
+            'replyCount': len(t.children[k]), 'likeCount': t.likes[k], 'repostCount': t.likes[k] // 4,
+        }
+
+    def thread_view(self, root, k, depth):
+        t = self.thread(root)
+        view = {'$type': 'app.bsky.feed.defs#threadViewPost', 'post': self.post_view(root, k, t)}
+        if depth > 0:
+            view['replies'] = [self.thread_view(root, child, depth - 1) for child in t.children[k]]
+        return view
+
+    def iter_threads(self, n_edges, key='#benchmark'):
+        """Thread già normalizzati (come nel journal) fino a n_edges archi, senza passare dall'HTTP:
+        servono per misurare la serializzazione su dataset grandi."""
+        from dataset import normalize_edges
+        produced = 0
+        for root in self._roots(key, 0, 100_000):
+            t = self._build_thread(root)
+            if len(t.authors) == 1:
+                continue
+            edges = []
+            users = {}
+            depth = [0] * len(t.authors)
+            for parent, children in enumerate(t.children):
+                for k in children:
+                    depth[k] = depth[parent] + 1
+                    edges.append((self.handle(root, k, t)[:-12], self.handle(root, parent, t)[:-12], {
+                        'trigger_uri': self.uri(root, parent, t), 'trigger_text': t.texts[parent],
+                        'reply_uri': self.uri(root, k, t), 'reply_content': t.texts[k],
+                        'root_uri': self.uri(root, 0, t), 'depth': depth[k],
+                        'timestamp': self._time(t.times[k]), 'like_count': t.likes[k],
+                        'repost_count': t.likes[k] // 4,
+                    }))
+                    users[edges[-1][0]] = {'followers': 0, 'posts': 0}
+            users.setdefault(self.handle(root, 0, t)[:-12], {'followers': 0, 'posts': 0})
+            edges = edges[:n_edges - produced]
+            posts, slim = normalize_edges(edges)
+            yield self.uri(root, 0, t), posts, slim, users
+            produced += len(edges)
+            if produced >= n_edges:
+                return
+
+    # --- XRPC ---
+    def handle_request(self, request):
+        method = request.url.path.rsplit('/', 1)[-1]
+        now = time.time()
+        with self._lock:
+            self.requests[method] += 1
+            if now - self._window_start >= 300:
+                self._window_start, self._window_count = now, 0
+            self._window_count += 1
+            over_quota = self.quota and self._window_count > self.quota
+            throttle = over_quota or self._rng.random() < self.error_rate
+            if throttle:
+                self.throttled += 1
+        time.sleep(self.latency * random.lognormvariate(0, self.jitter))
+
+        headers = {}
+        if self.quota:
+            headers = {'ratelimit-limit': str(self.quota),
+                       'ratelimit-remaining': str(max(0, self.quota - self._window_count)),
+                       'ratelimit-reset': str(int(self._window_start + 300)),
+                       'ratelimit-policy': f'{self.quota};w=300'}
+        if throttle:
+            reset = self._window_start + 300 if over_quota else now + self.retry_after
+            headers.update({'ratelimit-remaining': '0', 'ratelimit-reset': str(reset)})
+            return httpx.Response(429, headers=headers,
+                                  json={'error': 'RateLimitExceeded', 'message': 'Rate Limit Exceeded'})
+
+        params = request.url.params
+        handler = getattr(self, '_' + method.replace('.', '_'), None)
+        if handler is None:
+            return httpx.Response(501, json={'error': 'MethodNotImplemented', 'message': method})
+        status, body = handler(params)
+        return httpx.Response(status, headers=headers, json=body)
+
+    def _com_atproto_server_createSession(self, params):
+        payload = base64.urlsafe_b64encode(json.dumps(
+            {'sub': 'did:plc:bench', 'exp': int(time.time()) + 86400}).encode()).decode().rstrip('=')
+        jwt = f'eyJhbGciOiJub25lIn0.{payload}.sig'
+        return 200, {'accessJwt': jwt, 'refreshJwt': jwt, 'did': 'did:plc:bench', 'handle': 'bench.bsky.social'}
+
+    def _com_atproto_server_refreshSession(self, params):
+        return self._com_atproto_server_createSession(params)
+
+    def _app_bsky_actor_getProfile(self, params):
+        return 200, {'did': 'did:plc:bench', 'handle': params.get('actor', 'bench.bsky.social')}
+
+    def _page(self, key, params):
+        offset = int(params.get('cursor') or 0)
+        limit = int(params.get('limit') or 25)
+        roots = self._roots(key, offset, limit)
+        cursor = str(offset + len(roots)) if roots else None
+        return roots, cursor
+
+    def _app_bsky_feed_searchPosts(self, params):
+        roots, cursor = self._page(params.get('q', ''), params)
+        return 200, {'posts': [self.post_view(root, 0) for root in roots], 'cursor': cursor}
+
+    def _app_bsky_feed_getAuthorFeed(self, params):
+        roots, cursor = self._page('from:' + params.get('actor', ''), params)
+        return 200, {'feed': [{'post': self.post_view(root, 0)} for root in roots], 'cursor': cursor}
+
+    def _app_bsky_feed_getPostThread(self, params):
+        match = _URI.search(params.get('uri', ''))
+        if not match or int(match.group(2)) >= len(self.thread(int(match.group(1))).authors):
+            return 400, {'error': 'NotFound', 'message': f"Post not found: {params.get('uri')}"}
+        depth = int(params.get('depth') or 6)
+        return 200, {'thread': self.thread_view(int(match.group(1)), int(match.group(2)), depth)}
+
+    def _app_bsky_actor_getProfiles(self, params):
+        profiles = []
+        for actor in params.get_list('actors'):
+            uid = int(re.sub(r'\D', '', actor.split('.')[0]) or 0)
+            rng = random.Random(uid)
+            profiles.append({'did': f'did:plc:u{uid}', 'handle': actor,
+                             'followersCount': int(rng.paretovariate(1.1)) - 1,
+                             'followsCount': rng.randint(0, 2000), 'postsCount': rng.randint(0, 20000)})
+        return 200, {'profiles': profiles}
+
+
+# --- MISURE ---
+def peak_rss_mb():
+    # ru_maxrss è in KB su Linux, in byte su macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def fake_client(server=None, requests_per_second=0):
+    """RateLimitedClient vero, già autenticato, che parla con un FakeBluesky invece che con la rete."""
+    server = server or FakeBluesky()
+    limiter = ratelimit.AdaptiveRateLimiter(base_backoff=BASE_BACKOFF, requests_per_second=requests_per_second)
+    client = ratelimit.RateLimitedClient(request=Request(transport=httpx.MockTransport(server.handle_request)),
+                                         limiter=limiter)
+    client.login('bench.bsky.social', 'benchmark')
+    return client
+
+
+def load_script(name, server):
+    """Importa uno script di raccolta con il client collegato al server finto.
+    Va chiamata dentro una cartella temporanea (password, cache e journal finiscono lì)."""
+    class BenchClient(ratelimit.RateLimitedClient):
+        def __init__(self, *args, **kwargs):
+            kwargs.setdefault('request', Request(transport=httpx.MockTransport(server.handle_request)))
+            kwargs.setdefault('limiter', ratelimit.AdaptiveRateLimiter(base_backoff=BASE_BACKOFF))
+            super().__init__(*args, **kwargs)
+
+    with open('my_password.txt', 'w') as f:
+        f.write('benchmark')
+    ratelimit.RateLimitedClient = BenchClient
+    with contextlib.redirect_stdout(io.StringIO()):
+        return importlib.import_module(name)
+
+
+def search_roots(client, query, n):
+    uris, cursor = [], None
+    while len(uris) < n:
+        res = client.app.bsky.feed.search_posts(params={'q': query, 'limit': min(100, n - len(uris)),
+                                                        'cursor': cursor})
+        uris.extend(post.uri for post in res.posts)
+        cursor = res.cursor
+        if not cursor:
+            break
+    return uris
+
+
+def _collector_stats(server, client, seconds, posts, threads):
+    limiter = client._client.limiter
+    n_requests = sum(server.requests.values())
+    return {
+        'seconds': round(seconds, 3),
+        'threads': threads,
+        'posts': posts,
+        'requests': n_requests,
+        'requests_by_endpoint': dict(server.requests),
+        'throttled': server.throttled,
+        'retries': limiter.retries,
+        'backoff_seconds': round(limiter.slept, 3),
+        'posts_per_sec': round(posts / seconds, 1),
+        'requests_per_sec': round(n_requests / seconds, 1),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def bench_script33(n_threads=N_THREADS):
+    """get_thread_data di script33 su n_threads radici trovate con search_posts,
+    poi le pagine di get_author_feed e i profili (get_profiles) degli utenti trovati."""
+    from enrich import fetch_profiles
+    from cache import ResponseCache
+    from fetcher import fetch_all
+
+    server = FakeBluesky()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        module = load_script('script33', server)
+        client = module.client
+        start = time.perf_counter()
+        uris = search_roots(client, '#benchmark', n_threads)
+        posts = len(uris)
+        handles = set()
+        kept = 0
+        for uri, result in fetch_all(module.get_thread_data, uris, max_workers=MAX_WORKERS,
+                                     requests_per_second=REQUESTS_PER_SECOND):
+            if isinstance(result, Exception):
+                continue
+            edges, users = result
+            kept += bool(edges)
+            posts += len(edges)
+            handles.update(users)
+        # Modalità USER: una pagina di feed per alcuni degli autori trovati
+        for handle in sorted(handles)[:20]:
+            posts += len(client.get_author_feed(actor=f'{handle}.bsky.social', limit=50).feed)
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            fetch_profiles(client, sorted(handles), ResponseCache(os.path.join(tmp, 'profiles.sqlite')),
+                           max_workers=MAX_WORKERS, requests_per_second=REQUESTS_PER_SECOND)
+        stats = _collector_stats(server, client, time.perf_counter() - start, posts, len(uris))
+        stats.update(threads_kept=kept, users=len(handles))
+        client.cache.close()
+    return stats
+
+
+def bench_script2(n_threads=N_THREADS):
+    """process_single_thread di script2 dentro lo SnowballCrawler (un livello di espansione)."""
+    from crawler import SnowballCrawler
+
+    server = FakeBluesky()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        module = load_script('script2', server)
+        client = module.client
+        start = time.perf_counter()
+        seeds = search_roots(client, 'venezuela', min(n_threads, 25))
+        crawler = SnowballCrawler(module.process_single_thread, module.find_user_posts,
+                                  max_depth=1, max_nodes=SNOWBALL_MAX_NODES, max_edges=10 ** 9,
+                                  max_workers=MAX_WORKERS, requests_per_second=REQUESTS_PER_SECOND)
+        with contextlib.redirect_stdout(io.StringIO()):
+            crawler.process_uris(seeds, depth=0)
+            crawler.run()
+        stats = _collector_stats(server, client, time.perf_counter() - start,
+                                 crawler.n_edges + len(seeds), len(crawler.visited_uris))
+        stats.update(users=len(crawler.nodes), expanded=len(crawler.expanded))
+        client.cache.close()
+    return stats
+
+
+def _disk_mb(path):
+    if os.path.isdir(path):
+        size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    else:
+        size = os.path.getsize(path)
+    return round(size / 2 ** 20, 2)
+
+
+def bench_format(fmt, n_edges):
+    """Scrive (e rilegge) n_edges archi sintetici in un formato:
+    'columnar' (save_columnar_stream), 'gexf_stream' (colonne + gexf.write_gexf),
+    'json_gz' (Dataset.save) oppure 'gexf_networkx' (nx.write_gexf come negli script originali)."""
+    from columnar import load_edges_frame, save_columnar_stream
+    from dataset import Dataset
+
+    server = FakeBluesky()
+    threads = lambda: server.iter_threads(n_edges)
+    with tempfile.TemporaryDirectory() as tmp:
+        cols, out = os.path.join(tmp, 'bench.cols'), os.path.join(tmp, 'bench.out')
+        start = time.perf_counter()
+        if fmt in ('columnar', 'gexf_stream'):
+            save_columnar_stream(threads, cols)
+            out = cols
+            if fmt == 'gexf_stream':
+                from gexf import write_gexf
+                out = os.path.join(tmp, 'bench.gexf')
+                write_gexf(cols, out, multigraph=True)
+        else:
+            dataset = Dataset()
+            for _, posts, edges, users in threads():
+                dataset.add_thread(posts, edges, users)
+            if fmt == 'json_gz':
+                dataset.save(out)
+            else:
+                import networkx as nx
+                G = dataset.to_networkx()
+                del dataset
+                nx.write_gexf(G, out)
+                del G
+        write_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if fmt == 'columnar':
+            load_edges_frame(out)
+        elif fmt == 'json_gz':
+            Dataset.load(out)
+        else:
+            import networkx as nx
+            nx.read_gexf(out)
+        read_seconds = time.perf_counter() - start
+        return {'edges': n_edges, 'write_seconds': round(write_seconds, 3), 'read_seconds': round(read_seconds, 3),
+                'disk_mb': _disk_mb(out), 'peak_rss_mb': peak_rss_mb()}
+
+
+def isolated(fn, *args):
+    """Esegue una misura in un processo nuovo, così il picco di RSS è solo suo."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+        return pool.submit(fn, *args).result()
+
+
+# --- RISULTATI ---
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results, prefix=''):
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)):
+            flat[prefix + key] = value
+    return flat
+
+
+# Metriche in cui un valore più alto è un miglioramento (per le altre vale il contrario)
+_HIGHER_IS_BETTER = ('posts_per_sec', 'requests_per_sec')
+_COMPARED = _HIGHER_IS_BETTER + ('seconds', 'peak_rss_mb', 'disk_mb')
+
+
+def compare(previous, current):
+    """Confronta con l'esecuzione precedente e restituisce le metriche peggiorate oltre soglia."""
+    old, new = flatten(previous), flatten(current)
+    regressions = []
+    for key, value in new.items():
+        if not key.endswith(_COMPARED) or not old.get(key) or not value:
+            continue
+        if key.endswith('seconds') and abs(value - old[key]) < MIN_SECONDS_DELTA:
+            continue
+        change = value / old[key] - 1
+        if key.endswith(_HIGHER_IS_BETTER):
+            change = -change
+        if change > REGRESSION_THRESHOLD:
+            regressions.append((key, old[key], value, change))
+    return regressions
+
+
+def load_previous(path, config):
+    if not os.path.exists(path):
+        return None
+    previous = None
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            run = json.loads(line)
+            # Confrontiamo solo esecuzioni con la stessa configurazione
+            if run.get('config') == config:
+                previous = run
+    return previous
+
+
+if __name__ == "__main__":
+    config = {
+        'seed': SEED, 'n_users': N_USERS, 'thread_scale': THREAD_SCALE, 'thread_alpha': THREAD_ALPHA,
+        'max_thread_size': MAX_THREAD_SIZE, 'latency_ms': LATENCY_MS, 'error_rate_429': ERROR_RATE_429,
+        'server_quota': SERVER_QUOTA, 'n_threads': N_THREADS, 'max_workers': MAX_WORKERS,
+        'requests_per_second': REQUESTS_PER_SECOND, 'sizes': list(SERIALIZATION_SIZES),
+    }
+    results = {}
+
+    for script, bench in (('script33', bench_script33), ('script2', bench_script2)):
+        if script in SCENARIOS:
+            print(f"🚀 Raccolta con {script} ({N_THREADS} thread, {LATENCY_MS} ms, {ERROR_RATE_429:.0%} di 429)...")
+            stats = results[script] = isolated(bench)
+            print(f"   {stats['posts_per_sec']} post/s, {stats['requests_per_sec']} richieste/s, "
+                  f"{stats['throttled']} 429 ({stats['retries']} retry), picco RSS {stats['peak_rss_mb']} MB")
+
+    if 'serialization' in SCENARIOS:
+        results['serialization'] = {}
+        for n_edges in SERIALIZATION_SIZES:
+            print(f"💾 Serializzazione di {n_edges} archi...")
+            row = results['serialization'][str(n_edges)] = {}
+            for fmt in ('columnar', 'gexf_stream', 'json_gz', 'gexf_networkx'):
+                if fmt == 'gexf_networkx' and n_edges > NX_MAX_EDGES:
+                    continue
+                stats = row[fmt] = isolated(bench_format, fmt, n_edges)
+                print(f"   {fmt:14s} scrittura {stats['write_seconds']:8.2f}s  lettura {stats['read_seconds']:8.2f}s  "
+                      f"{stats['disk_mb']:8.1f} MB  picco RSS {stats['peak_rss_mb']} MB")
+
+    run = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': git_commit(),
+           'python': sys.version.split()[0], 'config': config, 'results': results}
+    previous = load_previous(RESULTS_PATH, config)
+    with open(RESULTS_PATH, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(run) + '\n')
+    print(f"📝 Risultati aggiunti a '{RESULTS_PATH}'")
+
+    if previous:
+        regressions = compare(previous['results'], results)
+        label = previous.get('commit') or "l'esecuzione precedente"
+        print(f"📊 Confronto con {label} ({previous['time']}):")
+        for key, old, new, change in regressions:
+            print(f"   ⚠️ {key}: {old} → {new} ({change:+.0%} peggio)")
+        if not regressions:
+            print(f"   ✅ Nessuna regressione oltre il {REGRESSION_THRESHOLD:.0%}")
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import pickle
+import sqlite3
+import threading
+import time
+
+# --- CONFIGURAZIONE DI DEFAULT ---
+CACHE_PATH = 'bsky_cache.sqlite'
+CACHE_TTL = 7 * 24 * 3600      # Secondi di validità di una risposta
+CACHE_MAX_MB = 500             # Oltre questa dimensione eliminiamo le voci meno usate (LRU)
+
+
+class CacheMiss(Exception):
+    """Sollevata in modalità solo-cache quando la risposta non è in cache."""
+
+
+class ResponseCache:
+    """Cache su disco (SQLite) delle risposte API, indicizzata per hash di endpoint + parametri.
+    Il file si apre al primo uso: importare uno script (es. i worker di distributed.py,
+    che usano un client proprio) non tocca la sua cache."""
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_mb=CACHE_MAX_MB, offline=False):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._total_bytes = 0
+
+    @property
+    def _db(self):
+        # Da usare con il lock
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                ' key TEXT PRIMARY KEY, value BLOB, size INTEGER, created REAL, accessed REAL)'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_accessed ON responses (accessed)')
+            self._conn.commit()
+            self._total_bytes = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        return self._conn
+
+    @staticmethod
+    def make_key(endpoint, params):
+        raw = json.dumps([endpoint, params], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute('SELECT value, created FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            now = time.time()
+            if self.ttl and now - created > self.ttl:
+                return None
+            self._db.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+            self._db.commit()
+        return pickle.loads(value)
+
+    def put(self, key, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        with self._lock:
+            old = self._db.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            if old:
+                self._total_bytes -= old[0]
+            self._db.execute(
+                'INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)',
+                (key, blob, len(blob), now, now),
+            )
+            self._total_bytes += len(blob)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        # Eliminiamo le voci usate meno di recente fino a scendere al 90% del limite
+        target = self.max_bytes * 0.9
+        rows = self._db.execute('SELECT key, size FROM responses ORDER BY accessed ASC').fetchall()
+        for key, size in rows:
+            if self._total_bytes <= target:
+                break
+            self._db.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self._total_bytes -= size
+            self.evicted += 1
+
+    def fetch(self, endpoint, params, call, refresh=False):
+        """Restituisce la risposta in cache oppure esegue call() e la salva.
+        Con refresh=True la cache viene solo aggiornata, mai letta."""
+        key = self.make_key(endpoint, params)
+        value = None if refresh and not self.offline else self.get(key)
+        # fetch arriva dai thread dei worker: i contatori si aggiornano sotto lock
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            return value
+        with self._lock:
+            self.misses += 1
+        if self.offline:
+            raise CacheMiss(f'{endpoint} {params}')
+        value = call()
+        self.put(key, value)
+        return value
+
+    def report(self):
+        total = self.hits + self.misses
+        ratio = (self.hits / total * 100) if total else 0.0
+        print(f"🗄️ Cache: {self.hits} hit, {self.misses} miss ({ratio:.1f}% hit), "
+              f"{self.evicted} voci eliminate, {self._total_bytes / 1024 / 1024:.1f} MB su disco")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class _Proxy:
+    """Inoltra gli attributi all'oggetto originale, tranne quelli sovrascritti."""
+
+    def __init__(self, target, **overrides):
+        self._target = target
+        self.__dict__.update(overrides)
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+
+class CachedClient:
+    """Avvolge un atproto Client mettendo in cache get_post_thread, get_author_feed e search_posts.
+    Tutti gli altri metodi (login, get_profile, ...) passano direttamente al client originale.
+    Gli endpoint in refresh vengono sempre richiesti al server (es. le liste di post
+    in modalità aggiornamento, che altrimenti restituirebbero le pagine della volta prima)."""
+
+    def __init__(self, client, cache, refresh=()):
+        self._client = client
+        self.cache = cache
+        self.refresh = set(refresh)
+        self._app = None
+
+    @property
+    def app(self):
+        # Costruito al primo uso: con un client pigro (session.LazyClient) non forza il login
+        if self._app is None:
+            client = self._client
+            self._app = _Proxy(client.app, bsky=_Proxy(client.app.bsky, feed=_Proxy(
+                client.app.bsky.feed, search_posts=self.search_posts)))
+        return self._app
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def get_post_thread(self, uri, depth=None, parent_height=None):
+        params = {'uri': uri, 'depth': depth, 'parent_height': parent_height}
+        return self.cache.fetch('get_post_thread', params, lambda: self._client.get_post_thread(
+            uri=uri, depth=depth, parent_height=parent_height), 'get_post_thread' in self.refresh)
+
+    def get_author_feed(self, actor, cursor=None, filter=None, limit=None, **kwargs):
+        params = {'actor': actor, 'cursor': cursor, 'filter': filter, 'limit': limit, **kwargs}
+        return self.cache.fetch('get_author_feed', params, lambda: self._client.get_author_feed(
+            actor=actor, cursor=cursor, filter=filter, limit=limit, **kwargs), 'get_author_feed' in self.refresh)
+
+    def search_posts(self, params=None, **kwargs):
+        return self.cache.fetch('search_posts', params, lambda: self._client.app.bsky.feed.search_posts(
+            params=params, **kwargs), 'search_posts' in self.refresh)
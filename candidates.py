@@ -0,0 +1,62 @@
+from collections import Counter
+
+from metrics import registry
+
+
+class CandidateSelector:
+    """Filtra i post restituiti da search_posts / get_author_feed PRIMA di scaricarne il thread,
+    usando i metadati già presenti nel PostView (reply_count e testo del record).
+    Tiene un insieme globale di URI, così lo stesso post trovato sotto più target
+    (es. #politics e #trump) viene scaricato una volta sola."""
+
+    def __init__(self, text_fn, min_replies=0, min_chars=1):
+        self.text_fn = text_fn
+        self.min_replies = min_replies
+        self.min_chars = min_chars
+        self.seen = set()
+        self.stats = Counter()
+
+    def score(self, post):
+        # Più risposte = thread più utile per la rete
+        return getattr(post, 'reply_count', None) or 0
+
+    def reject_reason(self, post):
+        if post.uri in self.seen:
+            return 'duplicati'
+        reply_count = getattr(post, 'reply_count', None)
+        if reply_count is not None and reply_count < self.min_replies:
+            return 'poche_risposte'
+        text = self.text_fn(post.record) if hasattr(post, 'record') else ''
+        if not text.strip():
+            return 'testo_vuoto'
+        if len(text) < self.min_chars:
+            return 'testo_corto'
+        return None
+
+    def select(self, posts, sort=False):
+        """Restituisce i post da scaricare (nell'ordine originale, o per punteggio se sort=True)."""
+        kept = []
+        for post in posts:
+            self.stats['visti'] += 1
+            reason = self.reject_reason(post)
+            self.seen.add(post.uri)
+            if reason:
+                self.stats[reason] += 1
+                registry.inc('posts_rejected', reason=reason)
+                continue
+            kept.append(post)
+        self.stats['selezionati'] += len(kept)
+        if sort:
+            kept.sort(key=self.score, reverse=True)
+        return kept
+
+    def mark_seen(self, uris):
+        # Per la ripresa da journal: URI già selezionati in una esecuzione precedente
+        self.seen.update(uris)
+
+    def report(self):
+        saved = self.stats['visti'] - self.stats['selezionati']
+        print(f"🧹 Pre-filtro: {self.stats['selezionati']}/{self.stats['visti']} post selezionati, "
+              f"{saved} chiamate get_post_thread risparmiate "
+              f"(duplicati: {self.stats['duplicati']}, poche risposte: {self.stats['poche_risposte']}, "
+              f"testo vuoto/corto: {self.stats['testo_vuoto'] + self.stats['testo_corto']})")
@@ -0,0 +1,543 @@
+import hashlib
+import json
+import os
+from array import array
+
+import numpy as np
+import pandas as pd
+
+from dataset import Dataset
+
+# Formato a colonne: una cartella con un file .npy per colonna (leggibile in memory-map)
+# e un meta.json con il tipo di ogni colonna. I testi sono un unico buffer UTF-8 + offset.
+FORMAT_VERSION = 1
+CHUNK_SIZE = 50000   # Righe tenute in memoria prima di scriverle su disco (scrittura in streaming)
+
+_DTYPES = {'int': np.int64, 'float': np.float64, 'datetime': 'datetime64[ms]'}
+
+
+# --- CODIFICA DELLE COLONNE ---
+def _pack_strings(strings):
+    encoded = [s.encode('utf-8') if s is not None else b'' for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return data, offsets
+
+
+def _unpack_strings(data, offsets):
+    raw = data.tobytes()
+    bounds = offsets.tolist()
+    return np.array([raw[bounds[i]:bounds[i + 1]].decode('utf-8') for i in range(len(bounds) - 1)],
+                    dtype=object)
+
+
+def _infer_kind(name, values):
+    if name == 'timestamp':
+        return 'datetime'
+    non_null = [v for v in values if v is not None]
+    if not non_null:
+        return 'str'   # Solo valori mancanti: nessuna informazione sul tipo
+    if all(isinstance(v, (bool, int)) for v in non_null):
+        return 'int'
+    if all(isinstance(v, (bool, int, float)) for v in non_null):
+        return 'float'
+    return 'str'
+
+
+def _encode(kind, values):
+    if kind == 'int':
+        return np.array([0 if v is None else v for v in values], dtype=np.int64)
+    if kind == 'float':
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    if kind == 'datetime':
+        parsed = pd.to_datetime(pd.Series(values, dtype=object), utc=True, errors='coerce', format='ISO8601')
+        return parsed.dt.tz_localize(None).to_numpy(dtype='datetime64[ms]')
+    return _pack_strings(['' if v is None else str(v) for v in values])
+
+
+def _value_kind(key, value):
+    # Come _infer_kind, ma un valore alla volta (per la scrittura in streaming).
+    # None non dice niente sul tipo: _merge_kind lo ignora
+    if key == 'timestamp':
+        return 'datetime'
+    if value is None:
+        return None
+    if isinstance(value, (bool, int)):
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    return 'str'
+
+
+def _merge_kind(current, kind):
+    if kind is None:
+        return current
+    if current is None or kind == 'datetime':
+        return kind
+    return max(current, kind, key=('int', 'float', 'str').index)
+
+
+def _save_column(path, name, kind, array):
+    if kind == 'str':
+        data, offsets = array
+        np.save(os.path.join(path, f'{name}.data.npy'), data)
+        np.save(os.path.join(path, f'{name}.offsets.npy'), offsets)
+    else:
+        np.save(os.path.join(path, f'{name}.npy'), array)
+
+
+class StringColumn:
+    """Colonna di testo letta su richiesta dal buffer UTF-8 memory-mapped,
+    senza decodificare tutta la colonna (per le esportazioni in streaming)."""
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf-8')
+
+
+def _load_column(path, name, kind, mmap, lazy_strings=False):
+    mode = 'r' if mmap else None
+    if kind == 'str':
+        data = np.load(os.path.join(path, f'{name}.data.npy'), mmap_mode=mode)
+        offsets = np.load(os.path.join(path, f'{name}.offsets.npy'), mmap_mode=mode)
+        if lazy_strings:
+            return StringColumn(data, offsets)
+        return _unpack_strings(data, offsets)
+    return np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mode)
+
+
+# --- SCRITTURA ---
+def save_columnar(dataset, path, handles=None):
+    """Salva un Dataset come cartella di colonne tipizzate (.npy).
+    handles: nomi dei nodi da scrivere al posto di dataset.handles (es. DID -> handle)."""
+    os.makedirs(path, exist_ok=True)
+    columns = {}
+
+    def add(name, kind, array):
+        _save_column(path, name, kind, array)
+        columns[name] = kind
+
+    # Nodi
+    add('nodes.handle', 'str', _pack_strings(dataset.handles if handles is None else handles))
+    for key in sorted({key for attrs in dataset.users for key in attrs}):
+        values = [attrs.get(key) for attrs in dataset.users]
+        kind = _infer_kind(key, values)
+        add(f'nodes.{key}', kind, _encode(kind, values))
+
+    # Post
+    add('posts.uri', 'str', _pack_strings(dataset.post_uris))
+    add('posts.author', 'int', np.asarray(dataset.post_authors, dtype=np.int64))
+    add('posts.text', 'str', _pack_strings(dataset.post_texts))
+
+    # Archi
+    add('edges.source', 'int', np.asarray(dataset.edge_source, dtype=np.int64))
+    add('edges.target', 'int', np.asarray(dataset.edge_target, dtype=np.int64))
+    add('edges.reply', 'int', np.asarray(dataset.edge_reply, dtype=np.int64))
+    add('edges.trigger', 'int', np.asarray(dataset.edge_trigger, dtype=np.int64))
+    for key, values in dataset.edge_attrs.items():
+        kind = _infer_kind(key, values)
+        add(f'edges.{key}', kind, _encode(kind, values))
+
+    return _write_meta(path, len(dataset.handles), len(dataset.post_uris), len(dataset), columns)
+
+
+def _write_meta(path, n_nodes, n_posts, n_edges, columns):
+    meta = {
+        'version': FORMAT_VERSION,
+        'n_nodes': n_nodes,
+        'n_posts': n_posts,
+        'n_edges': n_edges,
+        'columns': columns,
+    }
+    with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+# --- SCRITTURA IN STREAMING ---
+class _ColumnWriter:
+    """Riempie a blocchi una colonna .npy preallocata su disco (memory-map):
+    in memoria resta al massimo un blocco di chunk_size valori."""
+
+    def __init__(self, path, name, kind, n_rows, n_bytes=0, chunk_size=CHUNK_SIZE):
+        self.kind = kind
+        self.chunk_size = chunk_size
+        self.buffer = []
+        self.row = 0
+        self.byte = 0
+        base = os.path.join(path, name)
+        if kind == 'str':
+            self.data = np.lib.format.open_memmap(f'{base}.data.npy', mode='w+', dtype=np.uint8, shape=(n_bytes,))
+            self.offsets = np.lib.format.open_memmap(f'{base}.offsets.npy', mode='w+', dtype=np.int64,
+                                                     shape=(n_rows + 1,))
+            self.offsets[0] = 0
+        else:
+            self.array = np.lib.format.open_memmap(f'{base}.npy', mode='w+', dtype=_DTYPES[kind], shape=(n_rows,))
+
+    def append(self, value):
+        self.buffer.append(value)
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        n = len(self.buffer)
+        encoded = _encode(self.kind, self.buffer)
+        if self.kind == 'str':
+            data, offsets = encoded
+            self.data[self.byte:self.byte + len(data)] = data
+            self.offsets[self.row + 1:self.row + 1 + n] = offsets[1:] + self.byte
+            self.byte += len(data)
+        else:
+            self.array[self.row:self.row + n] = encoded
+        self.row += n
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        for array in (getattr(self, 'data', None), getattr(self, 'offsets', None), getattr(self, 'array', None)):
+            if array is not None:
+                array.flush()
+
+
+def _thread_posts(posts, edges):
+    # Post del thread, più quelli citati dagli archi ma assenti dalla tabella (journal vecchi)
+    posts = dict(posts)
+    for source, target, attr in edges:
+        for uri_key, author in (('reply_uri', source), ('trigger_uri', target)):
+            uri = attr.get(uri_key)
+            if uri is not None and uri not in posts:
+                posts[uri] = [author, '']
+    return posts
+
+
+def _text_bytes(value):
+    return 0 if value is None else len(str(value).encode('utf-8'))
+
+
+def uri_hash(uri):
+    # Impronta a 64 bit di un URI: 8 byte per riga invece della stringa intera
+    return int.from_bytes(hashlib.blake2b(uri.encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
+
+
+def _first_occurrences(hashes, valid=None):
+    """Maschera della prima occorrenza di ogni hash (le righe non valide si tengono sempre)."""
+    hashes = np.frombuffer(hashes, dtype=np.int64)
+    keep = np.ones(len(hashes), dtype=bool)
+    rows = np.arange(len(hashes)) if valid is None else np.flatnonzero(np.frombuffer(valid, dtype=np.int8))
+    order = rows[np.argsort(hashes[rows], kind='stable')]
+    keep[order[1:][hashes[order[1:]] == hashes[order[:-1]]]] = False
+    return keep
+
+
+def save_columnar_stream(iter_threads, path, chunk_size=CHUNK_SIZE, rename=None):
+    """Come save_columnar, ma legge i thread in streaming (ad es. RunJournal.iter_threads)
+    invece di un Dataset in memoria. iter_threads() viene chiamata due volte:
+    1. conteggio di righe, byte di testo e tipi delle colonne;
+    2. scrittura a blocchi nelle colonne preallocate.
+    In memoria restano solo gli utenti (handle e attributi) e pochi byte per riga
+    (hash dell'URI, lunghezza dei testi): post e archi non vengono mai accumulati.
+
+    Post e archi sono deduplicati per URI (per gli archi: reply_uri), tenendo la prima
+    occorrenza: la stessa risposta raggiunta da due thread o da due esecuzioni diventa
+    un solo arco, mentre più risposte tra gli stessi due utenti restano archi distinti.
+
+    rename: funzione che riceve la lista dei nodi e restituisce i nomi da scrivere
+    (es. DID -> handle), come il parametro handles di save_columnar."""
+    os.makedirs(path, exist_ok=True)
+
+    # Passo 1: scansione
+    handle_ids = {}
+    users = []
+    post_hashes, post_uri_bytes, post_text_bytes = array('q'), array('q'), array('q')
+    edge_hashes, edge_has_reply = array('q'), array('b')
+    edge_kinds = {}
+    edge_bytes = {}
+
+    def intern(handle):
+        hid = handle_ids.get(handle)
+        if hid is None:
+            hid = handle_ids[handle] = len(handle_ids)
+            users.append({})
+        return hid
+
+    for _, posts, edges, thread_users in iter_threads():
+        for uri, (author, text) in _thread_posts(posts, edges).items():
+            intern(author)
+            post_hashes.append(uri_hash(uri))
+            post_uri_bytes.append(_text_bytes(uri))
+            post_text_bytes.append(_text_bytes(text))
+        for handle, attrs in thread_users.items():
+            users[intern(handle)].update(attrs)
+        for source, target, attr in edges:
+            intern(source)
+            intern(target)
+            reply_uri = attr.get('reply_uri')
+            edge_hashes.append(uri_hash(reply_uri) if reply_uri is not None else 0)
+            edge_has_reply.append(reply_uri is not None)
+            for key, value in attr.items():
+                if key in ('reply_uri', 'trigger_uri'):
+                    continue
+                edge_kinds[key] = _merge_kind(edge_kinds.get(key), _value_kind(key, value))
+                if key not in edge_bytes:
+                    edge_bytes[key] = array('q', bytes(8 * (len(edge_hashes) - 1)))
+            for key, sizes in edge_bytes.items():
+                sizes.append(_text_bytes(attr.get(key)))
+
+    # Colonne sempre None: stringhe mancanti, come in _infer_kind
+    edge_kinds = {key: kind or 'str' for key, kind in edge_kinds.items()}
+    keep_posts = _first_occurrences(post_hashes)
+    keep_edges = _first_occurrences(edge_hashes, edge_has_reply)
+    n_posts, n_edges = int(keep_posts.sum()), int(keep_edges.sum())
+    # Post ripetuti: le occorrenze successive riusano l'ID della prima
+    repeated = set(np.frombuffer(post_hashes, dtype=np.int64)[~keep_posts].tolist())
+
+    # Nodi: restano in memoria (sono molti meno degli archi)
+    columns = {}
+    names = list(handle_ids)
+    _save_column(path, 'nodes.handle', 'str', _pack_strings(names if rename is None else rename(names)))
+    columns['nodes.handle'] = 'str'
+    for key in sorted({key for attrs in users for key in attrs}):
+        values = [attrs.get(key) for attrs in users]
+        kind = _infer_kind(key, values)
+        _save_column(path, f'nodes.{key}', kind, _encode(kind, values))
+        columns[f'nodes.{key}'] = kind
+
+    # Passo 2: post e archi scritti a blocchi
+    def writer(name, kind, n_rows, sizes=None, keep=None):
+        columns[name] = kind
+        n_bytes = int(np.frombuffer(sizes, dtype=np.int64)[keep].sum()) if sizes is not None else 0
+        return _ColumnWriter(path, name, kind, n_rows, n_bytes, chunk_size)
+
+    post_uri = writer('posts.uri', 'str', n_posts, post_uri_bytes, keep_posts)
+    post_author = writer('posts.author', 'int', n_posts)
+    post_text = writer('posts.text', 'str', n_posts, post_text_bytes, keep_posts)
+    edge_source = writer('edges.source', 'int', n_edges)
+    edge_target = writer('edges.target', 'int', n_edges)
+    edge_reply = writer('edges.reply', 'int', n_edges)
+    edge_trigger = writer('edges.trigger', 'int', n_edges)
+    edge_attrs = {key: writer(f'edges.{key}', kind, n_edges, edge_bytes[key], keep_edges)
+                  for key, kind in edge_kinds.items()}
+    del edge_bytes, post_uri_bytes, post_text_bytes
+
+    keep_posts, keep_edges = keep_posts.tolist(), keep_edges.tolist()
+    first_ids = {}
+    next_post = post_row = edge_row = 0
+    for _, posts, edges, _ in iter_threads():
+        post_ids = {}
+        for uri, (author, text) in _thread_posts(posts, edges).items():
+            digest = post_hashes[post_row]
+            if keep_posts[post_row]:
+                post_ids[uri] = next_post
+                if digest in repeated:
+                    first_ids[digest] = next_post
+                next_post += 1
+                post_uri.append(uri)
+                post_author.append(handle_ids[author])
+                post_text.append(text)
+            else:
+                post_ids[uri] = first_ids[digest]
+            post_row += 1
+        for source, target, attr in edges:
+            edge_row += 1
+            if not keep_edges[edge_row - 1]:
+                continue
+            edge_source.append(handle_ids[source])
+            edge_target.append(handle_ids[target])
+            edge_reply.append(post_ids.get(attr.get('reply_uri'), -1))
+            edge_trigger.append(post_ids.get(attr.get('trigger_uri'), -1))
+            for key, column in edge_attrs.items():
+                column.append(attr.get(key))
+
+    for column in (post_uri, post_author, post_text, edge_source, edge_target, edge_reply, edge_trigger,
+                   *edge_attrs.values()):
+        column.close()
+    return _write_meta(path, len(handle_ids), n_posts, n_edges, columns)
+
+
+def save_columns(path, table, columns):
+    """Aggiunge o sostituisce colonne di una tabella ('nodes', 'posts' o 'edges') senza
+    riscrivere il resto del dataset. I valori devono essere allineati alle righe della tabella
+    (liste, array NumPy o Series; columns può essere anche un DataFrame, come quello di
+    load_edges_frame). Le colonne numeriche e datetime vengono salvate in blocco, così come sono."""
+    meta = read_meta(path)
+    n_rows = meta[f'n_{table}']
+    for key, values in columns.items():
+        values = _as_array(values)
+        if len(values) != n_rows:
+            raise ValueError(f"La colonna '{key}' ha {len(values)} valori, attesi {n_rows}")
+        if isinstance(values, np.ndarray) and values.dtype.kind in 'iufbM':
+            kind = {'i': 'int', 'u': 'int', 'b': 'int', 'f': 'float', 'M': 'datetime'}[values.dtype.kind]
+            array = values.astype({'int': np.int64, 'float': np.float64, 'datetime': 'datetime64[ms]'}[kind])
+        else:
+            values = list(values)
+            kind = _infer_kind(key, values)
+            array = _encode(kind, values)
+        _save_column(path, f'{table}.{key}', kind, array)
+        meta['columns'][f'{table}.{key}'] = kind
+    with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+
+def _as_array(values):
+    # Series pandas -> array NumPy (timestamp con fuso -> UTC senza fuso, come _encode; NaN -> None)
+    if isinstance(values, pd.Series):
+        if isinstance(values.dtype, pd.DatetimeTZDtype):
+            values = values.dt.tz_convert('UTC').dt.tz_localize(None)
+        elif values.dtype == object or isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype(object).where(values.notna(), None)   # NaN -> valore mancante
+        values = values.to_numpy()
+    return values
+
+
+def save_node_columns(path, columns):
+    save_columns(path, 'nodes', columns)
+
+
+def save_edge_columns(path, columns):
+    save_columns(path, 'edges', columns)
+
+
+# --- AGGIORNAMENTO INCREMENTALE ---
+def snapshot_nodes(path):
+    """Copia in memoria le colonne dei nodi di un dataset esistente (None se non esiste),
+    da passare a carry_node_columns dopo averlo riscritto."""
+    if not os.path.exists(os.path.join(path, 'meta.json')):
+        return None
+    kinds = {name[6:]: kind for name, kind in read_meta(path)['columns'].items() if name.startswith('nodes.')}
+    return kinds, load_nodes_frame(path, mmap=False)
+
+
+def carry_node_columns(path, snapshot):
+    """Riporta sui nodi di un dataset riscritto le colonne della versione precedente
+    (profili di enrich.py, metriche, ...), allineate per handle: gli utenti già presenti
+    tengono i loro valori, quelli nuovi i valori appena scritti (o i default).
+    Restituisce il numero di utenti ritrovati."""
+    if snapshot is None or not len(snapshot[1]):
+        return 0
+    kinds, previous = snapshot
+    current = load_nodes_frame(path, mmap=False)
+    index = pd.Index(previous['handle']).get_indexer(current['handle'])
+    found = index >= 0
+    defaults = {'int': 0, 'float': np.nan, 'datetime': np.datetime64('NaT', 'ms'), 'str': ''}
+    columns = {}
+    for key, kind in kinds.items():
+        if key == 'handle':
+            continue
+        old = previous[key].to_numpy()[np.where(found, index, 0)]
+        fresh = current[key].to_numpy() if key in current else np.full(len(current), defaults[kind],
+                                                                         dtype=old.dtype)
+        columns[key] = np.where(found, old, fresh)
+    save_node_columns(path, columns)
+    return int(found.sum())
+
+
+# --- LETTURA ---
+def read_meta(path):
+    with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_columns(path, mmap=True, prefix=None, lazy_strings=False, names=None):
+    """Restituisce {nome: array}. Le colonne numeriche sono memory-mapped (mmap=True),
+    le colonne di testo vengono decodificate in array di oggetti str
+    (con lazy_strings=True restano su disco come StringColumn).
+    names: carica solo le colonne indicate (quelle assenti dal dataset si ignorano)."""
+    meta = read_meta(path)
+    return {name: _load_column(path, name, kind, mmap, lazy_strings)
+            for name, kind in meta['columns'].items()
+            if (prefix is None or name.startswith(prefix)) and (names is None or name in names)}
+
+
+def load_edges_frame(path, mmap=True, texts=True, categorical=True):
+    """Carica gli archi in un DataFrame a colonne tipizzate, senza cicli Python per arco:
+    testi e URI sono presi dalla tabella dei post tramite indicizzazione NumPy.
+
+    Con categorical=True handle, URI e colonne di testo degli archi (es. root_uri) sono
+    Categorical: un codice intero per arco invece di un oggetto str, e gli handle restano
+    quelli del dataset (codici = ID dei nodi). Conteggi e profondità restano int64,
+    timestamp datetime64. Un URI mancante diventa NaN (con categorical=False: stringa vuota).
+    Con texts=False i testi dei post non vengono nemmeno decodificati."""
+    meta = read_meta(path)
+    cols = load_columns(path, mmap=mmap, lazy_strings=True)
+    decode = lambda name: _unpack_strings(cols[name].data, cols[name].offsets)
+    handles = decode('nodes.handle')
+    source, target = cols['edges.source'], cols['edges.target']
+    trigger, reply = cols['edges.trigger'], cols['edges.reply']
+    uris = decode('posts.uri')
+
+    if categorical:
+        handle_index = pd.Index(handles)
+        uri_index = pd.Index(uris)
+        frame = pd.DataFrame({
+            'source': pd.Categorical.from_codes(source, categories=handle_index),
+            'target': pd.Categorical.from_codes(target, categories=handle_index),
+            'trigger_uri': pd.Categorical.from_codes(trigger, categories=uri_index),
+            'reply_uri': pd.Categorical.from_codes(reply, categories=uri_index),
+        })
+    else:
+        uris = np.append(uris, '')     # indice -1 -> stringa vuota
+        frame = pd.DataFrame({
+            'source': handles[source],
+            'target': handles[target],
+            'trigger_uri': uris[trigger],
+            'reply_uri': uris[reply],
+        })
+    if texts:
+        post_texts = np.append(decode('posts.text'), '')   # indice -1 -> testo vuoto
+        frame['trigger_text'] = post_texts[trigger]
+        frame['reply_content'] = post_texts[reply]
+        frame = frame[['source', 'target', 'trigger_uri', 'trigger_text', 'reply_uri', 'reply_content']]
+    for name, kind in meta['columns'].items():
+        if name.startswith('edges.') and name[6:] not in ('source', 'target', 'reply', 'trigger'):
+            array = decode(name) if kind == 'str' else cols[name]
+            frame[name[6:]] = pd.Categorical(array) if kind == 'str' and categorical else array
+    return frame
+
+
+def load_nodes_frame(path, mmap=True):
+    cols = load_columns(path, mmap=mmap, prefix='nodes.')
+    return pd.DataFrame({name[6:]: array for name, array in cols.items()})
+
+
+def load_dataset(path):
+    """Ricostruisce un Dataset (ad es. per esportarlo in GEXF con to_networkx)."""
+    meta = read_meta(path)
+    cols = load_columns(path, mmap=False)
+    ds = Dataset()
+    ds.handles = cols['nodes.handle'].tolist()
+    ds.handle_ids = {handle: hid for hid, handle in enumerate(ds.handles)}
+    node_keys = [name for name in cols if name.startswith('nodes.') and name != 'nodes.handle']
+    ds.users = [{} for _ in ds.handles]
+    for name in node_keys:
+        for attrs, value in zip(ds.users, _to_python(meta['columns'][name], cols[name])):
+            attrs[name[6:]] = value
+    ds.post_uris = cols['posts.uri'].tolist()
+    ds.post_ids = {uri: pid for pid, uri in enumerate(ds.post_uris)}
+    ds.post_authors = cols['posts.author'].tolist()
+    ds.post_texts = cols['posts.text'].tolist()
+    ds.edge_source = cols['edges.source'].tolist()
+    ds.edge_target = cols['edges.target'].tolist()
+    ds.edge_reply = cols['edges.reply'].tolist()
+    ds.edge_trigger = cols['edges.trigger'].tolist()
+    for name, kind in meta['columns'].items():
+        if name.startswith('edges.') and name[6:] not in ('source', 'target', 'reply', 'trigger'):
+            ds.edge_attrs[name[6:]] = _to_python(kind, cols[name])
+    return ds
+
+
+def _to_python(kind, array):
+    if kind == 'datetime':
+        return [None if pd.isna(v) else pd.Timestamp(v).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+                for v in array]
+    if kind == 'float':
+        return [None if np.isnan(v) else v for v in array.tolist()]
+    return array.tolist()
@@ -0,0 +1,274 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from analytics import CSRGraph
+from columnar import load_columns, read_meta, save_node_columns
+
+# --- CONFIGURAZIONE ---
+INPUT_PATH = 'dataset_hashtag.cols'              # Dataset a colonne (meglio se già passato da sentiment.py)
+METHOD = 'louvain'                               # 'louvain' oppure 'label_propagation' (più veloce, meno preciso)
+RESOLUTION = 1.0                                 # >1: comunità più piccole, <1: più grandi
+SEED = 0
+SUMMARY_PATH = 'communities_hashtag.csv'         # Una riga per comunità
+POLARIZATION_PATH = 'polarization_hashtag.json'  # Indici globali (modularità, EI, assortatività)
+SENTIMENT_COLUMN = 'sentiment_reazione'          # Sentiment di ogni risposta, scritto da sentiment.py
+
+MAX_ROUNDS = 50     # Giri di spostamento dei nodi per ogni livello di Louvain
+MAX_LEVELS = 20     # Livelli di aggregazione
+MOVE_SHARE = 0.5    # Quota dei nodi spostati insieme a ogni giro (evita che due nodi si scambino all'infinito)
+_EPS = 1e-12
+
+
+# --- LOUVAIN ---
+def _symmetric(graph):
+    """Archi non orientati (u, v, peso) con le coppie ripetute sommate: ogni arco compare in
+    entrambe le direzioni. Le auto-risposte non contano per le comunità."""
+    u, v, w = graph.undirected_edges()
+    keys, inverse = np.unique(u * graph.n + v, return_inverse=True)
+    return keys // graph.n, keys % graph.n, np.bincount(inverse, weights=w)
+
+
+def modularity(u, v, w, labels, resolution=RESOLUTION):
+    """Modularità di Newman di una partizione, su archi simmetrici (self-loop inclusi)."""
+    two_m = w.sum()
+    if not two_m:
+        return 0.0
+    k = np.bincount(u, weights=w, minlength=len(labels))
+    sigma = np.bincount(labels, weights=k)
+    inside = w[labels[u] == labels[v]].sum()
+    return float(inside / two_m - resolution * (sigma ** 2).sum() / two_m ** 2)
+
+
+def _renumber(labels):
+    """Etichette 0..k-1, dalla comunità più grande."""
+    _, inverse, counts = np.unique(labels, return_inverse=True, return_counts=True)
+    rank = np.empty(len(counts), dtype=np.int64)
+    rank[np.argsort(-counts, kind='stable')] = np.arange(len(counts))
+    return rank[inverse]
+
+
+def _local_moving(u, v, w, n, resolution, rng, max_rounds=MAX_ROUNDS):
+    """Fase 1 di Louvain, in parallelo su tutti i nodi: per ognuno si calcola con una sola
+    np.unique il guadagno di modularità verso ogni comunità vicina, e una quota casuale dei
+    nodi con guadagno positivo si sposta insieme. Se un giro peggiora la modularità
+    (spostamenti in conflitto) si annulla e la quota si dimezza."""
+    k = np.bincount(u, weights=w, minlength=n)
+    two_m = w.sum()
+    loop = u != v
+    lu, lv, lw = u[loop], v[loop], w[loop]
+    labels = np.arange(n, dtype=np.int64)
+    quality = modularity(u, v, w, labels, resolution)
+    share = MOVE_SHARE
+    for _ in range(max_rounds):
+        sigma = np.bincount(labels, weights=k, minlength=n)
+        keys, inverse = np.unique(lu * n + labels[lv], return_inverse=True)
+        k_in = np.bincount(inverse, weights=lw)
+        node, comm = keys // n, keys % n
+        own = comm == labels[node]
+        # Guadagno (a meno di 1/m) di entrare nella comunità, dopo essere usciti dalla propria
+        score = k_in - resolution * k[node] * (sigma[comm] - own * k[node]) / two_m
+        current = -resolution * k * (sigma[labels] - k) / two_m
+        current[node[own]] = score[own]
+        order = np.lexsort((rng.random(len(keys)), -score, node))
+        first = order[np.r_[True, node[order][1:] != node[order][:-1]]] if len(order) else order
+        better = score[first] > current[node[first]] + _EPS
+        movers, targets = node[first][better], comm[first][better]
+        if not len(movers):
+            break
+        pick = rng.random(len(movers)) < share
+        if not pick.any():
+            pick[np.argmax(score[first][better] - current[movers])] = True
+        candidate = labels.copy()
+        candidate[movers[pick]] = targets[pick]
+        new_quality = modularity(u, v, w, candidate, resolution)
+        if new_quality < quality - _EPS:
+            share /= 2
+            if share < 1e-3:
+                break
+            continue
+        gained = new_quality - quality
+        labels, quality = candidate, new_quality
+        if gained < 1e-7:
+            break
+    return labels
+
+
+def louvain(graph, resolution=RESOLUTION, seed=SEED, max_levels=MAX_LEVELS):
+    """Comunità di Louvain sul grafo non orientato pesato (peso = numero di risposte).
+    A ogni livello: spostamento dei nodi (vettoriale), poi ogni comunità diventa un nodo
+    del grafo aggregato, con un self-loop per gli archi interni. Etichette 0..k-1,
+    dalla comunità più grande."""
+    rng = np.random.default_rng(seed)
+    u, v, w = _symmetric(graph)
+    n = graph.n
+    membership = np.arange(n, dtype=np.int64)
+    for _ in range(max_levels):
+        labels = _local_moving(u, v, w, n, resolution, rng)
+        labels = _renumber(labels)
+        k = int(labels.max()) + 1 if n else 0
+        if k == n:
+            break
+        membership = labels[membership]
+        keys, inverse = np.unique(labels[u] * k + labels[v], return_inverse=True)
+        u, v, w, n = keys // k, keys % k, np.bincount(inverse, weights=w), k
+    return _renumber(membership)
+
+
+def detect(graph, method=METHOD, resolution=RESOLUTION, seed=SEED):
+    if method == 'louvain':
+        return louvain(graph, resolution=resolution, seed=seed)
+    if method == 'label_propagation':
+        return graph.label_propagation(seed=seed)
+    raise ValueError(f"Metodo sconosciuto: {method!r} (usa 'louvain' o 'label_propagation')")
+
+
+# --- POLARIZZAZIONE ---
+def _mean(total, count):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / count, np.nan)
+
+
+def _pearson(x, y):
+    valid = ~(np.isnan(x) | np.isnan(y))
+    if valid.sum() < 2 or np.std(x[valid]) == 0 or np.std(y[valid]) == 0:
+        return float('nan')
+    return float(np.corrcoef(x[valid], y[valid])[0, 1])
+
+
+def community_summary(sources, targets, labels, handles, sentiment=None, scores=None):
+    """Aggregati per comunità calcolati sugli archi di risposta (uno per risposta):
+    dimensione, risposte interne / in uscita / in entrata, quota di risposte verso altre
+    comunità, indice EI (-1: tutto interno, +1: tutto esterno) e sentiment medio delle
+    risposte scritte (interne e verso l'esterno). Restituisce un DataFrame."""
+    k = int(labels.max()) + 1 if len(labels) else 0
+    cs, ct = labels[sources], labels[targets]
+    internal = cs == ct
+    size = np.bincount(labels, minlength=k)
+    inside = np.bincount(cs[internal], minlength=k)
+    out = np.bincount(cs[~internal], minlength=k)
+    incoming = np.bincount(ct[~internal], minlength=k)
+    external = out + incoming
+    frame = pd.DataFrame({
+        'community': np.arange(k),
+        'size': size,
+        'replies_internal': inside,
+        'replies_out': out,
+        'replies_in': incoming,
+        'cross_ratio': _mean(out, inside + out),
+        'ei_index': _mean(external - inside, external + inside),
+    })
+    if sentiment is not None:
+        valid = ~np.isnan(sentiment)
+        s = np.nan_to_num(sentiment)
+        frame['mean_sentiment'] = _mean(np.bincount(cs, weights=s, minlength=k),
+                                        np.bincount(cs, weights=valid, minlength=k))
+        frame['mean_sentiment_internal'] = _mean(np.bincount(cs[internal], weights=s[internal], minlength=k),
+                                                 np.bincount(cs[internal], weights=valid[internal], minlength=k))
+        frame['mean_sentiment_cross'] = _mean(np.bincount(cs[~internal], weights=s[~internal], minlength=k),
+                                              np.bincount(cs[~internal], weights=valid[~internal], minlength=k))
+    if scores is not None:
+        # Utente più centrale di ogni comunità
+        order = np.lexsort((-scores, labels))
+        first = order[np.r_[True, labels[order][1:] != labels[order][:-1]]] if len(order) else order
+        frame['leader'] = np.asarray(handles, dtype=object)[first]
+    return frame
+
+
+def polarization(sources, targets, labels, sentiment=None, graph=None, resolution=RESOLUTION):
+    """Indici globali: modularità, indice EI, quota di risposte tra comunità,
+    assortatività per comunità (Newman, discreta) e assortatività del sentiment
+    (correlazione, lungo le risposte, del tono medio di chi risponde e di chi riceve)."""
+    cs, ct = labels[sources], labels[targets]
+    n_edges = len(sources)
+    internal = int((cs == ct).sum())
+    result = {
+        'communities': int(labels.max()) + 1 if len(labels) else 0,
+        'replies': n_edges,
+        'cross_ratio': (n_edges - internal) / n_edges if n_edges else None,
+        'ei_index': (n_edges - 2 * internal) / n_edges if n_edges else None,
+    }
+    if graph is not None:
+        result['modularity'] = modularity(*_symmetric(graph), labels, resolution)
+
+    # Assortatività discreta: r = (Σ e_ii - Σ a_i b_i) / (1 - Σ a_i b_i)
+    k = result['communities']
+    if n_edges and k:
+        e_ii = internal / n_edges
+        ab = float((np.bincount(cs, minlength=k) / n_edges * np.bincount(ct, minlength=k) / n_edges).sum())
+        result['community_assortativity'] = (e_ii - ab) / (1 - ab) if ab < 1 else 1.0
+
+    if sentiment is not None:
+        n = len(labels)
+        valid = ~np.isnan(sentiment)
+        tone = _mean(np.bincount(sources, weights=np.nan_to_num(sentiment), minlength=n),
+                     np.bincount(sources, weights=valid, minlength=n))
+        result['sentiment_assortativity'] = _pearson(tone[sources], tone[targets])
+        result['mean_sentiment_internal'] = float(np.nanmean(sentiment[cs == ct])) if internal else None
+        result['mean_sentiment_cross'] = float(np.nanmean(sentiment[cs != ct])) if internal < n_edges else None
+    # NaN (es. nessuna varianza) diventa null nel JSON
+    return {key: (None if np.isnan(value) else round(value, 6)) if isinstance(value, float) else value
+            for key, value in result.items()}
+
+
+def node_columns(sources, targets, labels, sentiment=None):
+    """Colonne per i nodi: comunità, dimensione della comunità, quota delle proprie risposte
+    dirette ad altre comunità e sentiment medio delle risposte scritte."""
+    n = len(labels)
+    cross = labels[sources] != labels[targets]
+    written = np.bincount(sources, minlength=n)
+    columns = {
+        'community': labels,
+        'community_size': np.bincount(labels)[labels],
+        'cross_ratio': _mean(np.bincount(sources, weights=cross, minlength=n), written),
+    }
+    if sentiment is not None:
+        columns['sentiment_mean'] = _mean(np.bincount(sources, weights=np.nan_to_num(sentiment), minlength=n),
+                                          np.bincount(sources, weights=~np.isnan(sentiment), minlength=n))
+    return columns
+
+
+if __name__ == "__main__":
+    import time
+
+    meta = read_meta(INPUT_PATH)
+    print(f"🧩 Comunità di {INPUT_PATH}: {meta['n_nodes']} nodi, {meta['n_edges']} archi ({METHOD})")
+    graph = CSRGraph.from_columnar(INPUT_PATH)
+    edges = load_columns(INPUT_PATH, mmap=True, prefix='edges.')
+    sources = np.asarray(edges['edges.source'], dtype=np.int64)
+    targets = np.asarray(edges['edges.target'], dtype=np.int64)
+    sentiment = edges.get(f'edges.{SENTIMENT_COLUMN}')
+    if sentiment is None:
+        print(f"⚠️ Colonna edges.{SENTIMENT_COLUMN} assente: lancia sentiment.py per gli indici di sentiment")
+    else:
+        sentiment = np.asarray(sentiment, dtype=np.float64)
+
+    start = time.perf_counter()
+    labels = detect(graph)
+    print(f"✅ {int(labels.max()) + 1 if len(labels) else 0} comunità in {time.perf_counter() - start:.1f}s")
+
+    nodes = load_columns(INPUT_PATH, mmap=True, prefix='nodes.')
+    scores = np.asarray(nodes['nodes.pagerank']) if 'nodes.pagerank' in nodes else graph.in_degree()
+    summary = community_summary(sources, targets, labels, graph.handles, sentiment, scores)
+    summary.to_csv(SUMMARY_PATH, index=False)
+    save_node_columns(INPUT_PATH, node_columns(sources, targets, labels, sentiment))
+
+    scores_global = polarization(sources, targets, labels, sentiment, graph)
+    with open(POLARIZATION_PATH, 'w', encoding='utf-8') as f:
+        json.dump({'method': METHOD, 'resolution': RESOLUTION, **scores_global}, f, indent=2)
+
+    print(f"📊 Modularità {scores_global['modularity']:.3f}, indice EI {scores_global['ei_index']:.3f}, "
+          f"assortatività per comunità {scores_global.get('community_assortativity', float('nan')):.3f}")
+    if sentiment is not None:
+        print(f"   Sentiment: interno {scores_global['mean_sentiment_internal']}, "
+              f"tra comunità {scores_global['mean_sentiment_cross']}, "
+              f"assortatività {scores_global['sentiment_assortativity']}")
+    print("🏘️ Comunità più grandi:")
+    for row in summary.head(5).itertuples():
+        line = f"   #{row.community}: {row.size} utenti, guida {row.leader}, risposte verso l'esterno {row.cross_ratio:.0%}"
+        if sentiment is not None:
+            line += f", sentiment medio {row.mean_sentiment:+.3f}"
+        print(line)
+    print(f"💾 Colonne community / community_size / cross_ratio in {INPUT_PATH}, "
+          f"riepilogo in {SUMMARY_PATH}, indici in {POLARIZATION_PATH}")
@@ -0,0 +1,125 @@
+import heapq
+from collections import Counter
+
+from fetcher import MAX_WORKERS, REQUESTS_PER_SECOND, fetch_all
+
+
+class SnowballCrawler:
+    """Crawl "a valanga" su più livelli.
+
+    - process_thread(uri) -> (edges, commenters, users_info, author), come process_single_thread
+      (author: handle dell'autore del post radice, None se il thread è stato scartato)
+    - find_user_posts(handle) -> lista di URI dei post da espandere per quell'utente
+    - on_thread(uri, edges, users_info, depth=..., author=...): thread accettato (es. nel journal)
+    - on_expand(handle): utente espanso (per poter riprendere senza rifare le ricerche)
+
+    La frontiera è una coda a priorità: viene espanso per primo l'utente visto più volte
+    come commentatore (a parità, quello scoperto al livello più basso). Handle e URI già
+    visitati non vengono mai richiesti due volte. Il budget di nodi / archi si controlla
+    a ogni thread: si sfora al massimo di un thread."""
+
+    def __init__(self, process_thread, find_user_posts, on_thread=None, on_expand=None, max_depth=2,
+                 max_nodes=20000, max_edges=200000, max_workers=MAX_WORKERS,
+                 requests_per_second=REQUESTS_PER_SECOND):
+        self.process_thread = process_thread
+        self.find_user_posts = find_user_posts
+        self.on_thread = on_thread
+        self.on_expand = on_expand
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.max_edges = max_edges
+        self.max_workers = max_workers
+        self.requests_per_second = requests_per_second
+
+        self.seen_count = Counter()   # handle -> quante volte è apparso come commentatore
+        self.depth = {}               # handle -> livello a cui è stato scoperto
+        self.frontier = []            # heap di (-seen_count, depth, handle)
+        self.expanded = set()         # handle già espansi (o autori di thread già scaricati)
+        self.visited_uris = set()
+        self.failed_uris = set()      # Thread falliti anche dopo i retry
+        self.nodes = set()
+        self.n_edges = 0
+
+    # --- BUDGET ---
+    def budget_left(self):
+        return len(self.nodes) < self.max_nodes and self.n_edges < self.max_edges
+
+    # --- FRONTIERA ---
+    def discover(self, handle, depth):
+        self.seen_count[handle] += 1
+        # Vale il livello più basso a cui l'utente è stato visto: chi compare prima oltre
+        # max_depth e poi entro il limite deve comunque essere espanso
+        self.depth[handle] = min(self.depth.get(handle, depth), depth)
+        if handle in self.expanded or self.depth[handle] > self.max_depth:
+            return
+        # Inseriamo una nuova voce con la priorità aggiornata; quelle vecchie verranno scartate
+        heapq.heappush(self.frontier, (-self.seen_count[handle], self.depth[handle], handle))
+
+    def _pop(self):
+        while self.frontier:
+            neg_count, depth, handle = heapq.heappop(self.frontier)
+            if handle in self.expanded or -neg_count != self.seen_count[handle] or depth != self.depth[handle]:
+                continue  # Già espanso o voce superata (priorità più alta o livello più basso)
+            return handle, depth
+        return None, None
+
+    # --- THREAD ---
+    def _accept(self, edges, users_info, depth, author, commenters):
+        self.n_edges += len(edges)
+        self.nodes.update(users_info)
+        # L'autore del thread non va rimesso in frontiera
+        if author is not None:
+            self.expanded.add(author)
+        for handle in commenters:
+            self.discover(handle, depth + 1)
+
+    def process_uris(self, uris, depth):
+        """Scarica i thread non ancora visitati; i commentatori finiscono al livello depth + 1.
+        A budget esaurito si smette di accettare thread (quelli non accettati restano da visitare)."""
+        new_uris = [uri for uri in dict.fromkeys(uris) if uri not in self.visited_uris]
+        results = fetch_all(self.process_thread, new_uris, max_workers=self.max_workers,
+                            requests_per_second=self.requests_per_second)
+        for uri, result in results:
+            if not self.budget_left():
+                break
+            self.visited_uris.add(uri)
+            if isinstance(result, Exception):
+                self.failed_uris.add(uri)
+                continue
+            edges, commenters, users_info, author = result
+            if not edges:
+                continue
+            self._accept(edges, users_info, depth, author, commenters)
+            if self.on_thread:
+                self.on_thread(uri, edges, users_info, depth=depth, author=author)
+        results.close()
+
+    def restore(self, threads, expanded=None):
+        """Ricostruisce lo stato da una raccolta precedente senza nessuna richiesta.
+        threads: (uri, edges, users_info, depth, author), es. dai record del journal.
+        expanded: utenti già espansi, che non vanno ricercati (insieme agli autori dei thread);
+        None per rimettere tutti in frontiera (aggiornamento: si cercano i loro post nuovi)."""
+        for uri, edges, users_info, depth, author in threads:
+            self.visited_uris.add(uri)
+            self._accept(edges, users_info, depth, author if expanded is not None else None,
+                         {edge[0] for edge in edges})
+        if expanded is not None:
+            self.expanded.update(expanded)
+
+    def run(self, progress=None):
+        """Espande la frontiera finché ci sono utenti entro max_depth e budget disponibile."""
+        while self.budget_left():
+            handle, depth = self._pop()
+            if handle is None:
+                break
+            self.expanded.add(handle)
+            try:
+                uris = self.find_user_posts(handle)
+            except Exception:
+                # Se l'utente non esiste o è bloccato, andiamo avanti
+                continue
+            if self.on_expand:
+                self.on_expand(handle)
+            self.process_uris(uris, depth)
+            if progress:
+                progress(self)
@@ -0,0 +1,160 @@
+import gzip
+import json
+
+# Coppie (attributo URI, attributo testo, ruolo) usate da get_thread_data sugli archi
+TEXT_FIELDS = (
+    ('trigger_uri', 'trigger_text', 'target'),
+    ('reply_uri', 'reply_content', 'source'),
+)
+
+
+def normalize_edges(edges):
+    """Separa i testi dagli archi: restituisce (posts, edges) dove posts è
+    {uri: [autore, testo]} e gli archi tengono solo gli URI dei post."""
+    posts = {}
+    slim = []
+    for source, target, attr in edges:
+        attr = dict(attr)
+        for uri_key, text_key, role in TEXT_FIELDS:
+            uri = attr.get(uri_key)
+            if uri is None:
+                continue
+            text = attr.pop(text_key, '')
+            if uri not in posts:
+                posts[uri] = [source if role == 'source' else target, text]
+        slim.append((source, target, attr))
+    return posts, slim
+
+
+class Dataset:
+    """Dataset normalizzato: handle internati in ID interi, tabella dei post indicizzata
+    per URI (ogni testo salvato una volta sola) e archi che riferiscono gli ID."""
+
+    def __init__(self):
+        # Utenti (nodi)
+        self.handles = []
+        self.handle_ids = {}
+        self.users = []
+        # Post (testi)
+        self.post_uris = []
+        self.post_ids = {}
+        self.post_authors = []
+        self.post_texts = []
+        # Archi (liste parallele)
+        self.edge_source = []
+        self.edge_target = []
+        self.edge_reply = []
+        self.edge_trigger = []
+        self.edge_attrs = {}
+
+    def __len__(self):
+        return len(self.edge_source)
+
+    # --- INTERNING ---
+    def handle_id(self, handle):
+        hid = self.handle_ids.get(handle)
+        if hid is None:
+            hid = len(self.handles)
+            self.handle_ids[handle] = hid
+            self.handles.append(handle)
+            self.users.append({})
+        return hid
+
+    def post_id(self, uri, author=None, text=''):
+        if uri is None:
+            return -1
+        pid = self.post_ids.get(uri)
+        if pid is None:
+            pid = len(self.post_uris)
+            self.post_ids[uri] = pid
+            self.post_uris.append(uri)
+            self.post_authors.append(self.handle_id(author) if author is not None else -1)
+            self.post_texts.append(text)
+        return pid
+
+    # --- INSERIMENTO ---
+    def add_user(self, handle, attrs):
+        self.users[self.handle_id(handle)].update(attrs)
+
+    def add_thread(self, posts, edges, users):
+        """Aggiunge un thread già normalizzato (come scritto nel journal)."""
+        for uri, (author, text) in posts.items():
+            self.post_id(uri, author, text)
+        for handle, attrs in users.items():
+            self.add_user(handle, attrs)
+        for source, target, attr in edges:
+            self.add_edge(source, target, attr)
+
+    def add_edges(self, edges, users):
+        """Aggiunge archi nel formato di get_thread_data (testi sugli archi)."""
+        posts, slim = normalize_edges(edges)
+        self.add_thread(posts, slim, users)
+
+    def add_edge(self, source, target, attr):
+        attr = dict(attr)
+        n = len(self.edge_source)
+        self.edge_source.append(self.handle_id(source))
+        self.edge_target.append(self.handle_id(target))
+        self.edge_reply.append(self.post_id(attr.pop('reply_uri', None), source))
+        self.edge_trigger.append(self.post_id(attr.pop('trigger_uri', None), target))
+        for key in attr.keys() - self.edge_attrs.keys():
+            self.edge_attrs[key] = [None] * n
+        for key, column in self.edge_attrs.items():
+            column.append(attr.get(key))
+
+    # --- LETTURA ---
+    def iter_edges(self, denormalize=True):
+        """Restituisce gli archi come (source, target, attr). Con denormalize=True
+        i testi vengono ricopiati sugli archi (trigger_text / reply_content)."""
+        for i in range(len(self.edge_source)):
+            attr = {key: column[i] for key, column in self.edge_attrs.items() if column[i] is not None}
+            reply, trigger = self.edge_reply[i], self.edge_trigger[i]
+            if trigger >= 0:
+                attr['trigger_uri'] = self.post_uris[trigger]
+                if denormalize:
+                    attr['trigger_text'] = self.post_texts[trigger]
+            if reply >= 0:
+                attr['reply_uri'] = self.post_uris[reply]
+                if denormalize:
+                    attr['reply_content'] = self.post_texts[reply]
+            yield self.handles[self.edge_source[i]], self.handles[self.edge_target[i]], attr
+
+    def to_networkx(self, graph_cls=None, denormalize=True):
+        # networkx si importa solo qui: journal e formato a colonne non ne hanno bisogno
+        import networkx as nx
+        G = (graph_cls or nx.MultiDiGraph)()
+        G.add_nodes_from((handle, self.users[hid]) for hid, handle in enumerate(self.handles))
+        G.add_edges_from(self.iter_edges(denormalize=denormalize))
+        return G
+
+    # --- FORMATO SU DISCO (JSON compresso, a colonne) ---
+    def save(self, path):
+        data = {
+            'handles': self.handles,
+            'users': self.users,
+            'posts': {'uri': self.post_uris, 'author': self.post_authors, 'text': self.post_texts},
+            'edges': {'source': self.edge_source, 'target': self.edge_target,
+                      'reply': self.edge_reply, 'trigger': self.edge_trigger,
+                      'attrs': self.edge_attrs},
+        }
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'), default=str)
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        ds = cls()
+        ds.handles = data['handles']
+        ds.handle_ids = {handle: hid for hid, handle in enumerate(ds.handles)}
+        ds.users = data['users']
+        ds.post_uris = data['posts']['uri']
+        ds.post_ids = {uri: pid for pid, uri in enumerate(ds.post_uris)}
+        ds.post_authors = data['posts']['author']
+        ds.post_texts = data['posts']['text']
+        ds.edge_source = data['edges']['source']
+        ds.edge_target = data['edges']['target']
+        ds.edge_reply = data['edges']['reply']
+        ds.edge_trigger = data['edges']['trigger']
+        ds.edge_attrs = data['edges']['attrs']
+        return ds
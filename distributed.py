@@ -0,0 +1,420 @@
+import json
+import os
+import sqlite3
+import time
+from multiprocessing import get_context
+
+from cache import CachedClient, ResponseCache
+from candidates import CandidateSelector
+from dataset import normalize_edges
+from fetcher import fetch_threads
+from metrics import registry
+from session import PASSWORD_PATH, LazyClient, lazy_client
+
+# --- CONFIGURAZIONE ---
+QUEUE_PATH = 'crawl_queue.sqlite'   # Coda di lavoro + archivio degli archi, condivisi dai processi
+
+SEARCH_MODE = 'HASHTAG'             # 'HASHTAG' oppure 'USER' (come in script33)
+TARGETS = ['#politics', '#trump', '#climate']
+POSTS_PER_TOPIC = 100               # Post per target, paginati dal coordinatore
+EXPAND_DEPTH = 0                    # >0: anche i commentatori diventano lavoro (i loro top post), fino a questo livello
+USER_POSTS_LIMIT = 3                # Top post scaricati per ogni commentatore espanso
+# Budget dell'espansione (come MAX_NODES / MAX_EDGES di script2): raggiunto uno dei limiti non si
+# accodano né si prendono più lavori dei livelli > 0; i post dei target vengono scaricati comunque
+MAX_NODES = 20000
+MAX_EDGES = 200000
+MAX_USER_TASKS = 1000               # Utenti espansi al massimo (lavori 'user' accodati)
+
+# Un processo (o più) per account: ognuno con la sua sessione e il suo budget di richieste
+ACCOUNTS = [
+    {'username': 'lorenzouni.bsky.social', 'password_path': PASSWORD_PATH, 'requests_per_second': 5, 'processes': 1},
+    # {'username': 'atlasover.bsky.social', 'password_path': 'password_atlasover.txt', 'requests_per_second': 5, 'processes': 1},
+]
+WORKER_THREADS = 4        # Thread scaricati in parallelo da ogni processo
+LEASE_SECONDS = 120       # Un lavoro preso da un processo morto torna in coda dopo questo tempo
+MAX_ATTEMPTS = 3          # Tentativi prima di segnare un lavoro come fallito
+POLL_SECONDS = 1.0        # Attesa dei worker quando la coda è momentaneamente vuota
+PROGRESS_SECONDS = 5      # Ogni quanto il coordinatore stampa lo stato della coda
+
+OUTPUT_PATH = 'dataset_distributed.cols'
+EXPORT_GEXF = True
+# True: tutti i client parlano col server sintetico di benchmark.py (prova in locale). Si può accendere
+# anche con BSKY_FAKE_SERVER=1: i worker (spawn) reimportano il modulo e ereditano l'ambiente
+FAKE_SERVER = os.environ.get('BSKY_FAKE_SERVER') == '1'
+
+
+# --- CODA DI LAVORO ---
+class WorkQueue:
+    """Coda di lavoro su SQLite condivisa da più processi, con lease a tempo.
+
+    Ogni lavoro ha una chiave unica (URI del post, oppure 'user:<handle>'), quindi lo stesso
+    post trovato da più target o da più worker entra in coda una volta sola. L'archivio
+    degli archi ha l'URI come chiave primaria ed è scritto nella stessa transazione che
+    chiude il lavoro: anche se un lease scade e due worker elaborano lo stesso thread,
+    gli archi vengono salvati esattamente una volta.
+
+    Utenti e archi salvati sono contati nella stessa transazione (tabella nodes e contatori
+    in meta), così il budget dell'espansione vale per tutti i processi insieme."""
+
+    def __init__(self, path, config=None, max_nodes=MAX_NODES, max_edges=MAX_EDGES,
+                 max_user_tasks=MAX_USER_TASKS):
+        self.path = path
+        self.max_nodes = max_nodes
+        self.max_edges = max_edges
+        self.max_user_tasks = max_user_tasks
+        if config is not None:
+            self._check_config(config)
+        self._db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS tasks (
+                key TEXT PRIMARY KEY, kind TEXT, value TEXT, depth INTEGER,
+                state TEXT DEFAULT 'pending', worker TEXT, lease_until REAL,
+                attempts INTEGER DEFAULT 0, error TEXT);
+            CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, depth);
+            CREATE TABLE IF NOT EXISTS threads (
+                uri TEXT PRIMARY KEY, posts TEXT, edges TEXT, users TEXT,
+                n_edges INTEGER, worker TEXT, time REAL);
+            CREATE TABLE IF NOT EXISTS nodes (handle TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS pages (
+                target TEXT PRIMARY KEY, cursor TEXT, fetched INTEGER, done INTEGER);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        ''')
+        if config is not None:
+            self.set('config', json.dumps(config, sort_keys=True))
+
+    def _check_config(self, config):
+        if not os.path.exists(self.path):
+            return
+        with sqlite3.connect(self.path) as db:
+            try:
+                row = db.execute("SELECT value FROM meta WHERE key = 'config'").fetchone()
+            except sqlite3.OperationalError:
+                row = None
+        if row and row[0] != json.dumps(config, sort_keys=True):
+            # Configurazione cambiata: archiviamo la vecchia coda e ripartiamo da zero (come RunJournal)
+            archived = f"{self.path}.{int(time.time())}.old"
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(self.path + suffix):
+                    os.replace(self.path + suffix, archived + suffix)
+            print(f"🗃️ Configurazione cambiata: vecchia coda archiviata in {archived}")
+
+    def _transaction(self):
+        # BEGIN IMMEDIATE: il lock di scrittura si prende subito, niente deadlock tra processi
+        self._db.execute('BEGIN IMMEDIATE')
+        return self._db
+
+    # --- METADATI ---
+    def get(self, key, default=None):
+        row = self._db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def set(self, key, value):
+        self._db.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+    def _add(self, key, n):
+        # Contatore in meta, da chiamare dentro una transazione
+        if n:
+            self._db.execute('INSERT INTO meta (key, value) VALUES (?, ?) '
+                             'ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + excluded.value',
+                             (key, n))
+
+    def count(self, key):
+        # 'n_nodes', 'n_edges' o 'n_user_tasks'
+        return int(self.get(key, 0))
+
+    # --- BUDGET ---
+    def budget_left(self):
+        return self.count('n_nodes') < self.max_nodes and self.count('n_edges') < self.max_edges
+
+    def _open_filter(self):
+        # A budget esaurito restano disponibili solo i post dei target (livello 0)
+        return '' if self.budget_left() else ' AND depth = 0'
+
+    # --- PAGINAZIONE (coordinatore) ---
+    def page_state(self, target):
+        row = self._db.execute('SELECT cursor, fetched, done FROM pages WHERE target = ?', (target,)).fetchone()
+        if not row:
+            return {'cursor': None, 'fetched': 0, 'done': False}
+        return {'cursor': row[0], 'fetched': row[1], 'done': bool(row[2])}
+
+    def record_page(self, target, uris, cursor, fetched, done=False):
+        """Accoda i post di una pagina e salva il cursore, nella stessa transazione."""
+        state = self.page_state(target)
+        db = self._transaction()
+        try:
+            db.executemany("INSERT OR IGNORE INTO tasks (key, kind, value, depth) VALUES (?, 'thread', ?, 0)",
+                           [(uri, uri) for uri in uris])
+            db.execute('INSERT OR REPLACE INTO pages (target, cursor, fetched, done) VALUES (?, ?, ?, ?)',
+                       (target, cursor, state['fetched'] + fetched, int(done or not cursor)))
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+    # --- LAVORI (worker) ---
+    def lease(self, worker, n, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        """Prende fino a n lavori liberi (o con il lease scaduto): prima i thread, poi le ricerche
+        degli utenti (dal livello più basso). I thread trovati da una ricerca passano così davanti
+        alle ricerche successive, e il budget si consuma mentre l'espansione procede."""
+        now = time.time()
+        db = self._transaction()
+        try:
+            # Lease scaduti troppe volte: il lavoro manda in crash chi lo prende, lo mettiamo da parte
+            db.execute("UPDATE tasks SET state = 'failed', error = 'lease scaduto' "
+                       "WHERE state = 'leased' AND lease_until < ? AND attempts >= ?", (now, max_attempts))
+            rows = db.execute("SELECT key, kind, value, depth FROM tasks "
+                              "WHERE (state = 'pending' OR (state = 'leased' AND lease_until < ?))"
+                              f"{self._open_filter()} ORDER BY kind = 'user', depth, rowid LIMIT ?",
+                              (now, n)).fetchall()
+            db.executemany("UPDATE tasks SET state = 'leased', worker = ?, lease_until = ?, "
+                           "attempts = attempts + 1 WHERE key = ?",
+                           [(worker, now + lease_seconds, key) for key, *_ in rows])
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return [{'key': key, 'kind': kind, 'value': value, 'depth': depth} for key, kind, value, depth in rows]
+
+    def complete_thread(self, task, worker, posts, edges, users, commenters=(), expand_depth=0):
+        """Salva gli archi del thread (una volta sola per URI) e chiude il lavoro.
+        Restituisce True se gli archi sono stati salvati ora, False se c'erano già."""
+        db = self._transaction()
+        try:
+            stored = db.execute(
+                'INSERT OR IGNORE INTO threads (uri, posts, edges, users, n_edges, worker, time) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (task['value'], json.dumps(posts, ensure_ascii=False), json.dumps(edges, ensure_ascii=False),
+                 json.dumps(users, ensure_ascii=False), len(edges), worker, time.time())).rowcount == 1
+            db.execute("UPDATE tasks SET state = 'done', lease_until = NULL WHERE key = ?", (task['key'],))
+            if stored:
+                self._add('n_nodes', db.executemany('INSERT OR IGNORE INTO nodes (handle) VALUES (?)',
+                                                    [(handle,) for handle in users]).rowcount)
+                self._add('n_edges', len(edges))
+            room = self.max_user_tasks - self.count('n_user_tasks')
+            if stored and task['depth'] < expand_depth and room > 0 and self.budget_left():
+                self._add('n_user_tasks', db.executemany(
+                    "INSERT OR IGNORE INTO tasks (key, kind, value, depth) VALUES (?, 'user', ?, ?)",
+                    [(f'user:{handle}', handle, task['depth'] + 1) for handle in list(commenters)[:room]]).rowcount)
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return stored
+
+    def complete_user(self, task, uris):
+        """Accoda i post trovati per un utente (allo stesso livello dell'utente) e chiude il lavoro."""
+        db = self._transaction()
+        try:
+            db.executemany("INSERT OR IGNORE INTO tasks (key, kind, value, depth) VALUES (?, 'thread', ?, ?)",
+                           [(uri, uri, task['depth']) for uri in uris])
+            db.execute("UPDATE tasks SET state = 'done', lease_until = NULL WHERE key = ?", (task['key'],))
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+    def fail(self, task, error, max_attempts=MAX_ATTEMPTS):
+        # Torna in coda finché ci sono tentativi, poi resta 'failed' (con l'errore, per capire perché)
+        self._db.execute("UPDATE tasks SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                         "lease_until = NULL, error = ? WHERE key = ? AND state = 'leased'",
+                         (max_attempts, f'{type(error).__name__}: {error}'[:500], task['key']))
+
+    # --- STATO ---
+    def counts(self):
+        counts = {}
+        for kind, state, n in self._db.execute('SELECT kind, state, COUNT(*) FROM tasks GROUP BY kind, state'):
+            counts.setdefault(kind, {})[state] = n
+        return counts
+
+    def n_edges(self):
+        return self.count('n_edges')
+
+    def finished(self):
+        """Vero quando il coordinatore ha finito di paginare e non resta lavoro libero o in corso."""
+        if self.get('coordinator_done') != '1':
+            return False
+        row = self._db.execute(f"SELECT 1 FROM tasks WHERE state IN ('pending', 'leased'){self._open_filter()} "
+                               "LIMIT 1").fetchone()
+        return row is None
+
+    def iter_threads(self):
+        """Thread salvati, nello stesso formato di RunJournal.iter_threads (per save_columnar_stream)."""
+        cursor = self._db.execute('SELECT uri, posts, edges, users FROM threads ORDER BY rowid')
+        for uri, posts, edges, users in cursor:
+            yield uri, json.loads(posts), [tuple(edge) for edge in json.loads(edges)], json.loads(users)
+
+    def close(self):
+        self._db.close()
+
+
+# --- CLIENT ---
+def account_rate(account):
+    # Il budget dell'account è diviso tra i suoi processi (più il coordinatore, che usa ACCOUNTS[0])
+    shares = account.get('processes', 1) + (1 if account == ACCOUNTS[0] else 0)
+    return account.get('requests_per_second', 5) / max(1, shares)
+
+
+def make_client(account, name, requests_per_second=0, fake_server=None):
+    # Sessione e cache per processo: i token di una sessione condivisa verrebbero
+    # invalidati dal refresh di un altro processo sullo stesso account.
+    # Il budget è nel client, per richiesta: get_thread_data può farne più di una per thread
+    if FAKE_SERVER if fake_server is None else fake_server:
+        from benchmark import fake_client
+        client = LazyClient(lambda: fake_client(requests_per_second=requests_per_second))
+    else:
+        client = lazy_client(account['username'], password_path=account.get('password_path', PASSWORD_PATH),
+                             session_path=f'bsky_session_{{username}}_{name}.txt',
+                             requests_per_second=requests_per_second)
+    return CachedClient(client, ResponseCache(f'bsky_cache_{name}.sqlite'))
+
+
+def find_user_posts(client, selector, handle, limit=USER_POSTS_LIMIT):
+    # Come in script2: i top post dell'utente, filtrati sui metadati prima di scaricarli
+    full_handle = handle if '.' in handle else f"{handle}.bsky.social"
+    res = client.app.bsky.feed.search_posts(params={'q': f'from:{full_handle}', 'limit': limit, 'sort': 'top'})
+    return [post.uri for post in selector.select(res.posts)]
+
+
+# --- WORKER ---
+def worker_main(name, account, queue_path, threads=WORKER_THREADS, expand_depth=EXPAND_DEPTH,
+                fake_server=None, max_nodes=MAX_NODES, max_edges=MAX_EDGES, max_user_tasks=MAX_USER_TASKS):
+    """Processo worker: prende lavori dalla coda e li esegue con get_thread_data di script33,
+    usando un client proprio (sessione, cache e budget dell'account). Importare script33
+    non apre la sua cache: il file si apre solo al primo uso, e il client viene sostituito.
+    fake_server=None segue FAKE_SERVER."""
+    import script33
+
+    script33.client = client = make_client(account, name, account_rate(account), fake_server)
+    queue = WorkQueue(queue_path, max_nodes=max_nodes, max_edges=max_edges, max_user_tasks=max_user_tasks)
+
+    def run(task):
+        if task['kind'] == 'user':
+            # Un selettore per lavoro: se il lavoro torna a questo worker (errore o lease scaduto)
+            # i suoi post non risultano già visti. I duplicati tra utenti li scarta la coda (chiave = URI)
+            selector = CandidateSelector(script33.extract_text_content, min_replies=script33.MIN_REPLIES)
+            return find_user_posts(client, selector, task['value'])
+        return script33.get_thread_data(task['value'])
+
+    while True:
+        tasks = queue.lease(name, threads * 4)
+        if not tasks:
+            if queue.finished():
+                break
+            time.sleep(POLL_SECONDS)
+            continue
+        results = fetch_threads(run, tasks, max_workers=threads, requests_per_second=0, return_exceptions=True)
+        for task, result in zip(tasks, results):
+            if isinstance(result, Exception):
+                queue.fail(task, result)
+            elif task['kind'] == 'user':
+                queue.complete_user(task, result)
+            else:
+                edges, users = result
+                posts, slim = normalize_edges(edges)
+                commenters = {source for source, _, _ in slim}
+                if queue.complete_thread(task, name, posts, slim, users, commenters, expand_depth):
+                    registry.inc('edges', len(edges))
+                else:
+                    registry.inc('duplicate_threads')
+
+    queue.close()
+    client.cache.close()
+    registry.save_json(f'metrics_distributed_{name}.json', worker=name, account=account['username'])
+
+
+# --- COORDINATORE ---
+def paginate(client, queue, selector, target, mode=SEARCH_MODE, limit=POSTS_PER_TOPIC):
+    """Pagina un target (hashtag o utente) e accoda i post selezionati; riprende dal cursore salvato."""
+    state = queue.page_state(target)
+    while not state['done'] and state['fetched'] < limit:
+        n = min(100, limit - state['fetched'])
+        if mode == 'HASHTAG':
+            res = client.app.bsky.feed.search_posts(
+                params={'q': target, 'limit': n, 'sort': 'top', 'lang': 'en', 'cursor': state['cursor']})
+            posts, cursor = res.posts, getattr(res, 'cursor', None)
+        else:
+            res = client.get_author_feed(actor=target, limit=n, filter='posts_with_replies', cursor=state['cursor'])
+            posts, cursor = [item.post for item in res.feed], getattr(res, 'cursor', None)
+        uris = [post.uri for post in selector.select(posts)]
+        queue.record_page(target, uris, cursor, len(posts), done=not posts)
+        state = queue.page_state(target)
+        print(f"   📥 {target}: {len(posts)} post, {len(uris)} in coda (Totale: {state['fetched']}/{limit})")
+
+
+def print_progress(queue):
+    counts = queue.counts()
+    threads, users = counts.get('thread', {}), counts.get('user', {})
+    line = (f"📦 Thread: {threads.get('done', 0)} fatti, {threads.get('leased', 0)} in corso, "
+            f"{threads.get('pending', 0)} in coda, {threads.get('failed', 0)} falliti")
+    if users:
+        line += f" | Utenti: {users.get('done', 0)}/{sum(users.values())}"
+    line += f" | Nodi: {queue.count('n_nodes')}, archi: {queue.n_edges()}"
+    print(line if queue.budget_left() else f"{line} (budget esaurito: niente più espansione)")
+
+
+if __name__ == "__main__":
+    from columnar import save_columnar_stream
+    from gexf import write_gexf
+    import script33
+
+    queue = WorkQueue(QUEUE_PATH, config={
+        'mode': SEARCH_MODE,
+        'targets': TARGETS,
+        'posts_per_topic': POSTS_PER_TOPIC,
+        'expand_depth': EXPAND_DEPTH,
+        'min_replies': script33.MIN_REPLIES,
+        'min_chars': script33.MIN_CHARS,
+        'thread_depth': script33.THREAD_DEPTH,
+        'max_reply_depth': script33.MAX_REPLY_DEPTH,
+        'max_fanout': script33.MAX_FANOUT,
+    })
+    queue.set('coordinator_done', 0)
+
+    # Processi worker (spawn: ognuno parte pulito, con il suo client e le sue connessioni SQLite)
+    ctx = get_context('spawn')
+    workers = []
+    for i, account in enumerate(ACCOUNTS):
+        for j in range(account.get('processes', 1)):
+            name = f"w{i}.{j}"
+            worker = ctx.Process(target=worker_main, args=(name, account, QUEUE_PATH), name=name)
+            worker.start()
+            workers.append(worker)
+    print(f"🚀 {len(workers)} worker avviati su {len(ACCOUNTS)} account")
+
+    # Il coordinatore pagina i target mentre i worker scaricano già i thread
+    client = make_client(ACCOUNTS[0], 'coordinator', account_rate(ACCOUNTS[0]))
+    selector = CandidateSelector(script33.extract_text_content, min_replies=script33.MIN_REPLIES,
+                                 min_chars=script33.MIN_CHARS)
+    for target in TARGETS:
+        print(f"\n🔍 Paginazione target: {target}")
+        try:
+            paginate(client, queue, selector, target)
+        except Exception as e:
+            # Il cursore è salvato: rilanciando si riprende da questa pagina
+            print(f"❌ Errore durante il fetch della lista post: {e}")
+    queue.set('coordinator_done', 1)
+    selector.report()
+
+    last = 0.0
+    while any(worker.is_alive() for worker in workers):
+        if time.monotonic() - last >= PROGRESS_SECONDS:
+            print_progress(queue)
+            last = time.monotonic()
+        time.sleep(0.5)
+    for worker in workers:
+        worker.join()
+    print_progress(queue)
+    if not queue.finished():
+        print("⚠️ I worker si sono fermati con lavoro ancora in coda: rilancia lo script per riprendere")
+
+    # --- SALVATAGGIO ---
+    meta = save_columnar_stream(queue.iter_threads, OUTPUT_PATH)
+    print(f"\n📊 Nodi: {meta['n_nodes']}, post: {meta['n_posts']}, archi: {meta['n_edges']}")
+    if meta['n_edges'] and EXPORT_GEXF:
+        filename = OUTPUT_PATH.replace('.cols', '.gexf')
+        write_gexf(OUTPUT_PATH, filename, multigraph=True)
+        print(f"✅ Salvato in {OUTPUT_PATH} e {filename}")
+    queue.close()
+    client.cache.close()
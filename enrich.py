@@ -0,0 +1,110 @@
+import os
+
+from cache import ResponseCache
+from columnar import load_columns, save_node_columns
+from fetcher import fetch_all
+from session import lazy_client
+
+# --- CONFIGURAZIONE ---
+USERNAME = 'lorenzouni.bsky.social'
+
+# Grafo da arricchire: cartella a colonne (.cols) oppure file .gexf
+INPUT_PATH = 'dataset_hashtag.cols'
+
+BATCH_SIZE = 25              # Massimo consentito da app.bsky.actor.get_profiles
+MAX_WORKERS = 4              # Batch scaricati in parallelo
+REQUESTS_PER_SECOND = 5      # Budget globale di richieste al secondo
+
+# Cache dei profili: nelle esecuzioni successive scarichiamo solo gli utenti nuovi
+PROFILE_CACHE_PATH = 'bsky_profiles.sqlite'
+PROFILE_TTL = 3 * 24 * 3600  # Dopo quanto tempo un profilo va riscaricato (secondi)
+
+PROFILE_FIELDS = ('followers_count', 'follows_count', 'posts_count')
+
+
+def full_handle(handle):
+    # Gli handle nel grafo sono salvati senza '.bsky.social'
+    return handle if '.' in handle else f"{handle}.bsky.social"
+
+
+def fetch_profiles(client, handles, cache, batch_size=BATCH_SIZE,
+                   max_workers=MAX_WORKERS, requests_per_second=REQUESTS_PER_SECOND):
+    """Restituisce {handle: {followers_count, follows_count, posts_count}} per gli handle,
+    usando la cache dove possibile e get_profiles (batch da 25) per il resto.
+    I batch falliti vengono ritentati una volta; gli utenti ancora mancanti restano fuori
+    dal risultato (e fuori dalla cache), così non si confondono con profili a zero."""
+    profiles = {}
+    missing = []
+    for handle in handles:
+        cached = cache.get(cache.make_key('profile', handle))
+        if cached is None:
+            missing.append(handle)
+        else:
+            profiles[handle] = cached
+    cache.hits += len(profiles)
+    cache.misses += len(missing)
+    print(f"👥 {len(handles)} utenti: {len(profiles)} già in cache, {len(missing)} da scaricare")
+
+    def fetch_batch(batch):
+        return client.app.bsky.actor.get_profiles(params={'actors': [full_handle(h) for h in batch]}).profiles
+
+    batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+    results = fetch_all(fetch_batch, batches, max_workers=max_workers,
+                        requests_per_second=requests_per_second)
+
+    from tqdm import tqdm
+    failed = 0
+    for batch, batch_profiles in tqdm(results, total=len(batches), desc="Profili"):
+        if isinstance(batch_profiles, Exception):
+            # Batch fallito anche al secondo tentativo: niente cache, verrà richiesto al prossimo run
+            print(f"❌ Errore get_profiles: {batch_profiles}")
+            failed += len(batch)
+            continue
+        found = {p.handle.replace('.bsky.social', ''): p for p in batch_profiles}
+        for handle in batch:
+            p = found.get(handle)
+            # Profili cancellati/sospesi: salviamo degli zeri per non richiederli a ogni run
+            info = {field: (getattr(p, field, None) or 0) if p else 0 for field in PROFILE_FIELDS}
+            cache.put(cache.make_key('profile', handle), info)
+            profiles[handle] = info
+    if failed:
+        print(f"⚠️ {failed} profili non scaricati: restano senza valore (NaN), non a 0")
+    return profiles
+
+
+def node_attributes(info):
+    # Profilo non scaricato (info None): valori mancanti, non zeri
+    attrs = {field: info.get(field, 0) if info is not None else float('nan') for field in PROFILE_FIELDS}
+    # Riempiamo anche i segnaposto 'followers'/'posts' scritti dagli script di raccolta
+    attrs['followers'] = attrs['followers_count']
+    attrs['posts'] = attrs['posts_count']
+    return attrs
+
+
+def enrich_columnar(client, path, cache):
+    handles = load_columns(path, prefix='nodes.handle')['nodes.handle'].tolist()
+    profiles = fetch_profiles(client, handles, cache)
+    rows = [node_attributes(profiles.get(handle)) for handle in handles]
+    save_node_columns(path, {key: [row[key] for row in rows] for key in rows[0]} if rows else {})
+
+
+def enrich_gexf(client, path, cache):
+    import networkx as nx
+    G = nx.read_gexf(path)
+    profiles = fetch_profiles(client, list(G.nodes()), cache)
+    # Nel GEXF gli utenti non scaricati restano senza attributi di profilo
+    nx.set_node_attributes(G, {handle: node_attributes(info) for handle, info in profiles.items() if handle in G})
+    nx.write_gexf(G, path)
+
+
+if __name__ == "__main__":
+    # Login (con la sessione salvata) solo se qualche profilo non è già in cache
+    client = lazy_client(USERNAME)
+
+    cache = ResponseCache(PROFILE_CACHE_PATH, ttl=PROFILE_TTL)
+    if os.path.isdir(INPUT_PATH):
+        enrich_columnar(client, INPUT_PATH, cache)
+    else:
+        enrich_gexf(client, INPUT_PATH, cache)
+    print(f"✅ Profili scritti sui nodi di {INPUT_PATH}")
+    cache.report()
@@ -0,0 +1,86 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import registry
+
+# --- CONFIGURAZIONE DI DEFAULT ---
+MAX_WORKERS = 4            # Richieste contemporanee in volo
+REQUESTS_PER_SECOND = 5.0  # Tetto sui task (chiamate di fetch_fn) condiviso dai worker (0 = nessun tetto)
+
+
+class RateLimiter:
+    """Limitatore condiviso tra thread: distribuisce le richieste a intervalli
+    regolari di 1/rate secondi, qualunque sia il numero di worker."""
+
+    def __init__(self, requests_per_second=REQUESTS_PER_SECOND):
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        # Prenotiamo lo slot sotto lock, ma dormiamo fuori dal lock
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        wait = slot - now
+        if wait > 0:
+            time.sleep(wait)
+
+
+def fetch_threads(fetch_fn, items, max_workers=MAX_WORKERS,
+                  requests_per_second=REQUESTS_PER_SECOND, limiter=None, return_exceptions=False,
+                  retries=0):
+    """Esegue fetch_fn(item) su tutti gli item con max_workers richieste in volo
+    e restituisce i risultati NELLO STESSO ORDINE degli item (output deterministico).
+
+    requests_per_second (o limiter) conta i task, non le richieste: un task può farne più
+    di una (es. get_thread_data con i rami riscaricati da walk_thread). Il vero budget di
+    richieste è quello del client (RateLimitedClient(requests_per_second=...)); in quel caso
+    qui si passa requests_per_second=0.
+
+    Con return_exceptions=True un errore non interrompe il ciclo: al posto del
+    risultato viene restituita l'eccezione, così il chiamante può ritentare quell'item.
+    Con retries > 0 un item fallito viene ritentato subito dallo stesso worker (ogni
+    tentativo prende un nuovo slot dal limiter), così l'ordine dei risultati non cambia.
+    Al massimo 2 * max_workers risultati vengono tenuti in memoria alla volta."""
+    if limiter is None:
+        limiter = RateLimiter(requests_per_second)
+
+    def task(item):
+        for attempt in range(retries + 1):
+            with registry.stage('sleep_fetcher'):
+                limiter.acquire()
+            try:
+                return fetch_fn(item)
+            except Exception as e:
+                registry.inc('task_errors', error=type(e).__name__)
+                if attempt < retries:
+                    registry.inc('task_retries')
+                    continue
+                if not return_exceptions:
+                    raise
+                return e
+
+    window = max_workers * 2
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for item in items:
+            pending.append(pool.submit(task, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def fetch_all(fetch_fn, items, retry_rounds=1, **kwargs):
+    """Come fetch_threads, ma gli item falliti non vanno persi: vengono ritentati
+    (fino a retry_rounds volte, subito, dentro la finestra ordinata) e restituiti come
+    (item, risultato) nello stesso ordine degli item, anche se qualche richiesta è fallita.
+    Gli item ancora falliti alla fine vengono restituiti come (item, eccezione)."""
+    kwargs['return_exceptions'] = True
+    kwargs['retries'] = retry_rounds
+    items = list(items)
+    yield from zip(items, fetch_threads(fetch_fn, items, **kwargs))
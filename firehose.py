@@ -0,0 +1,514 @@
+import json
+import os
+import re
+import shutil
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from cache import CachedClient, ResponseCache
+from columnar import save_columnar_stream, uri_hash
+from journal import RunJournal, read_records
+from metrics import registry
+from session import lazy_client
+
+# --- CONFIGURAZIONE ---
+USERNAME = 'lorenzouni.bsky.social'
+
+# Sorgente degli eventi: Jetstream (JSON) oppure un file di eventi registrati (test offline)
+JETSTREAM_URL = 'wss://jetstream2.us-east.bsky.network/subscribe'
+REPLAY_PATH = None          # Es. 'jetstream_replay.jsonl': se impostato non si usa la rete
+RECORD_PATH = None          # Se impostato, gli eventi ricevuti dal vivo vengono salvati qui (per il replay)
+
+# Filtri: una risposta viene tenuta se contiene uno degli hashtag, se il suo thread è partito
+# da un post con uno degli hashtag, oppure se risponde (o sta nel thread di) un utente target
+HASHTAGS = ['politics', 'trump', 'climate']
+TARGET_USERS = []           # Handle, es. ['nytimes.com']
+
+RESOLVE_HANDLES = True      # False: i DID non risolti restano DID (replay senza rete)
+BATCH_SIZE = 200            # Eventi accumulati prima di risolvere gli handle e scrivere nel journal
+CHECKPOINT_SECONDS = 10     # Ogni quanto salvare la posizione dello stream anche senza archi nuovi
+SNAPSHOT_SECONDS = 300      # Ogni quanto scrivere un segmento con gli archi nuovi (0 = solo alla fine)
+REWIND_SECONDS = 5          # Alla ripresa si riparte un po' prima del checkpoint (gli eventi doppi si scartano)
+DEDUP_SECONDS = 60          # Finestra (in tempo dello stream) in cui si ricordano i reply_uri già scritti
+POST_MEMORY = 200000        # Post recenti ricordati (autore, testo, profondità) per i testi dei trigger
+MAX_TRACKED_ROOTS = 100000  # Thread seguiti (post radice che hanno superato i filtri)
+
+# Durante l'ascolto gli snapshot vanno in OUTPUT_PATH.segments/ (un dataset a colonne per snapshot,
+# con i soli archi nuovi); a fine esecuzione il journal viene compattato in OUTPUT_PATH
+OUTPUT_PATH = 'dataset_firehose.cols'
+JOURNAL_PATH = 'journal_firehose.jsonl'
+
+# --- METRICHE ---
+METRICS_PATH = 'metrics_firehose.json'   # Riepilogo JSON a fine esecuzione
+PROMETHEUS_PATH = None      # es. 'metrics_firehose.prom': file Prometheus riscritto durante l'ascolto
+PROMETHEUS_INTERVAL = 30    # Secondi tra due aggiornamenti del file Prometheus
+
+# --- CACHE LOCALE ---
+CACHE_PATH = 'bsky_cache.sqlite'
+CACHE_TTL = 7 * 24 * 3600   # Validità di DID -> handle in cache (secondi)
+CACHE_MAX_MB = 500
+
+POST_COLLECTION = 'app.bsky.feed.post'
+_HASHTAG_RE = re.compile(r'#(\w+)')
+
+
+# --- FUNZIONI DI SUPPORTO ---
+def post_uri(did, rkey):
+    return f"at://{did}/{POST_COLLECTION}/{rkey}"
+
+
+def uri_did(uri):
+    # at://did:plc:xxx/app.bsky.feed.post/rkey -> did:plc:xxx
+    return uri.split('/')[2] if uri and uri.startswith('at://') else None
+
+
+def short_handle(handle):
+    return handle.replace('.bsky.social', '')
+
+
+def extract_text_content(record):
+    # Come negli script di raccolta, ma sul record JSON dell'evento
+    full_text = []
+    if record.get('text'):
+        full_text.append(record['text'])
+    for img in (record.get('embed') or {}).get('images') or []:
+        if img.get('alt'):
+            full_text.append(f"[IMG: {img['alt']}]")
+    return " ".join(full_text)
+
+
+def record_tags(record):
+    tags = {tag.lower() for tag in _HASHTAG_RE.findall(record.get('text') or '')}
+    for facet in record.get('facets') or []:
+        for feature in facet.get('features') or []:
+            if feature.get('$type') == 'app.bsky.richtext.facet#tag' and feature.get('tag'):
+                tags.add(feature['tag'].lower())
+    return tags
+
+
+# --- RISOLUZIONE DID -> HANDLE ---
+class HandleResolver:
+    """DID -> handle (senza '.bsky.social'). Fonti, in ordine: eventi 'identity' dello stream,
+    cache su disco, get_profiles a blocchi di 25. I DID non risolvibili restano DID."""
+
+    def __init__(self, client=None, cache=None, batch_size=25):
+        self.client = client
+        self.cache = cache
+        self.batch_size = batch_size
+        self.handles = {}
+        self.unknown = set()   # DID assenti dalla risposta di get_profiles (account cancellati o sospesi)
+
+    def learn(self, did, handle):
+        self.handles[did] = short_handle(handle)
+        if self.cache:
+            self.cache.put(self.cache.make_key('did', did), self.handles[did])
+
+    def resolve_many(self, dids):
+        missing = []
+        for did in dict.fromkeys(dids):
+            if did in self.handles or did in self.unknown:
+                continue
+            cached = self.cache.get(self.cache.make_key('did', did)) if self.cache else None
+            if cached is None:
+                missing.append(did)
+            else:
+                self.handles[did] = cached
+        if self.client is None:
+            return
+        for i in range(0, len(missing), self.batch_size):
+            batch = missing[i:i + self.batch_size]
+            try:
+                res = self.client.get_profiles(actors=batch)
+            except Exception as e:
+                print(f"❌ Errore get_profiles: {e}")
+                continue
+            for profile in res.profiles:
+                self.learn(profile.did, profile.handle)
+            self.unknown.update(did for did in batch if did not in self.handles)
+
+    def handle(self, did):
+        return self.handles.get(did, did)
+
+    def did_for(self, handle):
+        # Per gli utenti target: handle -> DID (dallo stream o dall'API)
+        handle = short_handle(handle)
+        for did, known in self.handles.items():
+            if known == handle:
+                return did
+        if self.client is None:
+            return None
+        full_handle = handle if '.' in handle else f"{handle}.bsky.social"
+        did = self.client.resolve_handle(full_handle).did
+        self.learn(did, full_handle)
+        return did
+
+
+# --- ELABORAZIONE DEGLI EVENTI ---
+class StreamProcessor:
+    """Trasforma gli eventi di creazione post in archi (source, target, attr) con lo stesso
+    schema di get_thread_data, ma con i DID al posto degli handle: un handle risolto più tardi
+    non divide lo stesso utente in due nodi (la traduzione si fa al salvataggio, in StreamGraph).
+    La memoria è limitata: si ricordano solo gli ultimi post_memory post (per testo e
+    profondità dei trigger) e max_roots thread seguiti."""
+
+    def __init__(self, resolver, hashtags=(), target_dids=(), post_memory=POST_MEMORY,
+                 max_roots=MAX_TRACKED_ROOTS):
+        self.resolver = resolver
+        self.hashtags = {tag.lower().lstrip('#') for tag in hashtags}
+        self.target_dids = set(target_dids)
+        self.post_memory = post_memory
+        self.max_roots = max_roots
+        self.posts = OrderedDict()   # uri -> (did, testo, profondità)
+        self.roots = OrderedDict()   # uri dei post radice seguiti
+        self.new_roots = []          # Radici seguite dall'ultimo checkpoint (da salvare nel journal)
+        self.nodes = set()
+        self.n_edges = 0
+        self.n_events = 0
+
+    def _remember(self, uri, did, text, depth):
+        self.posts[uri] = (did, text, depth)
+        if len(self.posts) > self.post_memory:
+            self.posts.popitem(last=False)
+
+    def _track(self, root):
+        if root not in self.roots:
+            self.new_roots.append(root)
+        self.roots[root] = True
+        self.roots.move_to_end(root)
+        if len(self.roots) > self.max_roots:
+            self.roots.popitem(last=False)
+
+    def take_new_roots(self):
+        roots, self.new_roots = self.new_roots, []
+        return roots
+
+    def restore(self, records):
+        """Ricostruisce dal journal i thread seguiti e i post recenti, per riprendere
+        lo stream senza perdere le risposte ai thread iniziati prima dell'interruzione."""
+        for rec in records:
+            for root in rec.get('roots', ()):
+                self._track(root)
+            if rec.get('type') != 'thread':
+                continue
+            depths = {attr.get('reply_uri'): attr.get('depth') for _, _, attr in rec['edges']}
+            for uri, (_, text) in rec.get('posts', {}).items():
+                self._remember(uri, uri_did(uri), text, depths.get(uri))
+        self.new_roots = []
+
+    def _matches(self, did, tags, parent_did=None, root_did=None):
+        if self.hashtags & tags:
+            return True
+        return bool(self.target_dids & {did, parent_did, root_did})
+
+    def _reply(self, event):
+        """Restituisce (did autore, uri genitore, attr con i DID) per una risposta da tenere."""
+        commit = event['commit']
+        record = commit.get('record') or {}
+        did = event['did']
+        uri = post_uri(did, commit['rkey'])
+        text = extract_text_content(record)
+        tags = record_tags(record)
+        reply = record.get('reply')
+
+        if not reply:
+            self._remember(uri, did, text, 0)
+            if self._matches(did, tags):
+                self._track(uri)
+            return None
+
+        parent_uri = reply['parent']['uri']
+        root_uri = reply['root']['uri']
+        parent = self.posts.get(parent_uri)
+        if parent_uri == root_uri:
+            depth = 1
+        else:
+            depth = parent[2] + 1 if parent and parent[2] is not None else None
+        self._remember(uri, did, text, depth)
+
+        if root_uri not in self.roots and not self._matches(did, tags, uri_did(parent_uri), uri_did(root_uri)):
+            return None
+        self._track(root_uri)
+        return did, parent_uri, {
+            'trigger_uri': parent_uri,
+            'trigger_text': parent[1] if parent else '',
+            'reply_uri': uri,
+            'reply_content': text,
+            'root_uri': root_uri,
+            'depth': depth,
+            'timestamp': record.get('createdAt'),
+            'like_count': 0,
+            'repost_count': 0,
+        }
+
+    def process(self, events):
+        """Elabora un blocco di eventi e restituisce (edges, users) come get_thread_data (con i DID)."""
+        pending = []
+        for event in events:
+            self.n_events += 1
+            kind = event.get('kind')
+            if kind == 'identity' and event.get('identity', {}).get('handle'):
+                self.resolver.learn(event['did'], event['identity']['handle'])
+                continue
+            commit = event.get('commit') or {}
+            if kind != 'commit' or commit.get('collection') != POST_COLLECTION or commit.get('operation') != 'create':
+                continue
+            reply = self._reply(event)
+            if reply:
+                pending.append(reply)
+
+        # Un'unica risoluzione degli handle per tutto il blocco (serviranno al salvataggio)
+        self.resolver.resolve_many([did for did, parent_uri, _ in pending] +
+                                   [uri_did(parent_uri) for _, parent_uri, _ in pending])
+        edges = []
+        users = {}
+        for did, parent_uri, attr in pending:
+            parent_did = uri_did(parent_uri)
+            edges.append((did, parent_did, attr))
+            users.setdefault(parent_did, {'followers': 0, 'posts': 0})
+            users[did] = {'followers': 0, 'posts': 0}
+        self.nodes.update(users)
+        self.n_edges += len(edges)
+        return edges, users
+
+
+# --- GRAFO DELLO STREAM ---
+def _swap_dir(tmp, path):
+    # os.replace non sovrascrive una cartella non vuota: la vecchia si sposta e poi si cancella,
+    # così chi legge trova sempre un dataset completo (mai colonne vecchie e nuove insieme)
+    old = None
+    if os.path.exists(path):
+        old = f"{path}.old"
+        shutil.rmtree(old, ignore_errors=True)
+        os.replace(path, old)
+    os.replace(tmp, path)
+    if old:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+class StreamGraph:
+    """Grafo dello stream: gli archi stanno solo nel journal. Ogni snapshot scrive un segmento
+    a colonne con i soli record accodati dopo lo snapshot precedente (posizione in byte salvata
+    nel journal), quindi il costo non cresce con la storia dello stream; save() a fine esecuzione
+    compatta tutto il journal in un unico dataset. Ogni scrittura passa da una cartella
+    temporanea spostata al suo posto a lavoro finito.
+
+    In memoria resta solo l'hash a 64 bit (lo stesso del writer a colonne) dei reply_uri scritti
+    negli ultimi dedup_seconds di stream: gli eventi più vecchi del checkpoint li scarta già run()
+    in base a time_us. I nodi restano DID; gli handle si scrivono al salvataggio."""
+
+    def __init__(self, resolver, journal, dedup_seconds=DEDUP_SECONDS):
+        self.resolver = resolver
+        self.journal = journal
+        self.window = dedup_seconds * 1_000_000
+        self.replies = OrderedDict()   # hash del reply_uri -> time_us del blocco (in ordine di tempo)
+
+    def new_edges(self, edges, time_us):
+        """Archi con un reply_uri non visto di recente (da scrivere nel journal)."""
+        while self.replies and next(iter(self.replies.values())) < time_us - self.window:
+            self.replies.popitem(last=False)
+        fresh = []
+        for edge in edges:
+            reply_uri = edge[2].get('reply_uri')
+            if reply_uri is not None:
+                digest = uri_hash(reply_uri)
+                if digest in self.replies:
+                    continue
+                self.replies[digest] = time_us
+            fresh.append(edge)
+        return fresh
+
+    def restore(self, records):
+        # records: righe del journal (read_records); servono solo i blocchi dentro la finestra
+        since = (self.journal.cursor or 0) - self.window
+        for rec in records:
+            if rec.get('type') == 'thread' and (rec.get('cursor') or 0) >= since:
+                self.new_edges(rec['edges'], rec['cursor'])
+
+    def _handles(self, dids):
+        # Journal precedenti: i nodi possono essere già handle, che restano come sono
+        self.resolver.resolve_many([did for did in dids if did.startswith('did:')])
+        return [self.resolver.handle(did) for did in dids]
+
+    def _write(self, path, start=0, end=None):
+        tmp = f"{path}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        meta = save_columnar_stream(lambda: self.journal.iter_threads(start, end), tmp, rename=self._handles)
+        _swap_dir(tmp, path)
+        return meta
+
+    def snapshot(self, path):
+        """Segmento con i record del journal successivi all'ultimo snapshot (None se non ce ne sono)."""
+        segments = f"{path}.segments"
+        last = self.journal.snapshot
+        if last is None or last['full']:
+            # Segmenti già compattati in path (o di un journal archiviato)
+            shutil.rmtree(segments, ignore_errors=True)
+        start = last['offset'] if last else 0
+        end = self.journal.offset()
+        if end <= start:
+            return None
+        threads = self.journal.iter_threads(start, end)
+        empty = next(threads, None) is None
+        threads.close()
+        if empty:
+            # Solo checkpoint del cursore: nessun segmento da scrivere
+            self.journal.record_snapshot(end, full=False)
+            return None
+        os.makedirs(segments, exist_ok=True)
+        # Il nome è la posizione iniziale: un segmento non registrato prima di un crash viene sostituito
+        meta = self._write(os.path.join(segments, f"{start:012d}.cols"), start, end)
+        self.journal.record_snapshot(end, full=False)
+        return meta
+
+    def save(self, path):
+        """Compatta l'intero journal in path e rimuove i segmenti."""
+        end = self.journal.offset()
+        meta = self._write(path, end=end)
+        shutil.rmtree(f"{path}.segments", ignore_errors=True)
+        self.journal.record_snapshot(end, full=True)
+        return meta
+
+
+# --- SORGENTI DEGLI EVENTI ---
+def iter_replay(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def iter_jetstream(url, cursor=None, record_path=None):
+    """Eventi dal vivo da Jetstream, con riconnessione automatica dal punto raggiunto."""
+    from websockets.exceptions import WebSocketException
+    from websockets.sync.client import connect
+
+    record = open(record_path, 'a', encoding='utf-8') if record_path else None
+    delay = 1
+    try:
+        while True:
+            params = {'wantedCollections': POST_COLLECTION}
+            if cursor:
+                params['cursor'] = cursor
+            try:
+                with connect(f"{url}?{urlencode(params)}", max_size=None) as ws:
+                    delay = 1
+                    for message in ws:
+                        event = json.loads(message)
+                        cursor = event.get('time_us', cursor)
+                        if record:
+                            record.write(message if isinstance(message, str) else message.decode('utf-8'))
+                            record.write('\n')
+                        yield event
+            except (OSError, WebSocketException) as e:
+                print(f"⚠️ Connessione persa ({e}), riconnessione tra {delay}s...")
+                time.sleep(delay)
+                delay = min(delay * 2, 60)
+                if cursor:
+                    cursor -= REWIND_SECONDS * 1_000_000
+    finally:
+        if record:
+            record.close()
+
+
+# --- CICLO PRINCIPALE ---
+def run(events, journal, processor, graph, batch_size=BATCH_SIZE, checkpoint_seconds=CHECKPOINT_SECONDS,
+        snapshot_seconds=SNAPSHOT_SECONDS, output_path=OUTPUT_PATH):
+    """Consuma gli eventi a blocchi: ogni blocco di archi viene scritto nel journal insieme
+    al cursore (time_us dell'ultimo evento), quindi dopo un'interruzione si riprende da lì
+    senza duplicare archi. Ogni snapshot_seconds gli archi nuovi vanno in un segmento accanto a
+    output_path; alla fine il journal viene compattato in output_path."""
+    # time_us più alto già visto: gli eventi ripetuti dopo una riconnessione si scartano
+    last_time = journal.cursor or 0
+    buffer = []
+    last_checkpoint = last_snapshot = time.monotonic()
+
+    def flush(checkpoint=False):
+        nonlocal buffer, last_checkpoint
+        if not buffer:
+            return
+        first, last = buffer[0].get('time_us'), buffer[-1].get('time_us')
+        with registry.stage('processing'):
+            edges, users = processor.process(buffer)
+        registry.inc('events', len(buffer))
+        registry.inc('edges', len(edges))
+        if last:
+            # Ritardo dello stream rispetto al tempo reale
+            registry.set('stream_lag_seconds', round(time.time() - last / 1_000_000, 3))
+        buffer = []
+        # Le nuove radici seguite vanno salvate subito: servono per riprendere i loro thread
+        roots = processor.take_new_roots()
+        edges = graph.new_edges(edges, last or 0)
+        if edges:
+            journal.record_thread(f"jetstream:{first}-{last}", edges, users, cursor=last, roots=roots)
+        elif roots or checkpoint or time.monotonic() - last_checkpoint >= checkpoint_seconds:
+            journal.record_cursor(last, roots=roots)
+        else:
+            return
+        last_checkpoint = time.monotonic()
+
+    try:
+        for event in events:
+            if event.get('time_us', 0) <= last_time:
+                continue  # Già elaborato (prima dell'interruzione o prima della riconnessione)
+            last_time = event['time_us']
+            buffer.append(event)
+            if len(buffer) >= batch_size or time.monotonic() - last_checkpoint >= checkpoint_seconds:
+                flush()
+                print(f"\r📡 Eventi: {processor.n_events} | Archi: {processor.n_edges} | "
+                      f"Nodi: {len(processor.nodes)} | Thread seguiti: {len(processor.roots)}", end='')
+            if snapshot_seconds and time.monotonic() - last_snapshot >= snapshot_seconds:
+                with registry.stage('serialization'):
+                    graph.snapshot(output_path)
+                last_snapshot = time.monotonic()
+    except KeyboardInterrupt:
+        print("\n⏹️ Interrotto: salvo il blocco in corso...")
+    flush(checkpoint=True)
+    print()
+    with registry.stage('serialization'):
+        return graph.save(output_path)
+
+
+if __name__ == "__main__":
+    journal = RunJournal(JOURNAL_PATH, config={
+        'mode': 'firehose',
+        'hashtags': HASHTAGS,
+        'targets': TARGET_USERS,
+    })
+
+    client = None
+    cache = ResponseCache(CACHE_PATH, ttl=CACHE_TTL, max_mb=CACHE_MAX_MB)
+    if RESOLVE_HANDLES:
+        # Login (con la sessione salvata) solo al primo handle non ancora in cache
+        client = CachedClient(lazy_client(USERNAME), cache)
+    resolver = HandleResolver(client, cache)
+
+    target_dids = [did for did in (resolver.did_for(handle) for handle in TARGET_USERS) if did]
+    processor = StreamProcessor(resolver, hashtags=HASHTAGS, target_dids=target_dids)
+    graph = StreamGraph(resolver, journal)
+    if journal.cursor:
+        processor.restore(read_records(JOURNAL_PATH))
+        graph.restore(read_records(JOURNAL_PATH))
+
+    if REPLAY_PATH:
+        print(f"📼 Replay degli eventi da {REPLAY_PATH}")
+        events = iter_replay(REPLAY_PATH)
+    else:
+        cursor = journal.cursor - REWIND_SECONDS * 1_000_000 if journal.cursor else None
+        print(f"📡 Connessione a {JETSTREAM_URL}" + (f" (ripresa dal cursore {cursor})" if cursor else ""))
+        events = iter_jetstream(JETSTREAM_URL, cursor=cursor, record_path=RECORD_PATH)
+
+    if PROMETHEUS_PATH:
+        registry.start_exporter(PROMETHEUS_PATH, PROMETHEUS_INTERVAL)
+    meta = run(events, journal, processor, graph)
+    journal.close()
+    print(f"✅ {meta['n_edges']} archi, {meta['n_nodes']} nodi salvati in {OUTPUT_PATH}")
+    cache.report()
+    cache.close()
+
+    registry.stop_exporter()
+    registry.save_json(METRICS_PATH, hashtags=HASHTAGS, targets=TARGET_USERS)
+    registry.report()
+    print(f"📈 Metriche salvate in {METRICS_PATH}")
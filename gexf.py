@@ -0,0 +1,152 @@
+import re
+import time
+from xml.sax.saxutils import quoteattr
+
+import numpy as np
+import pandas as pd
+
+from columnar import CHUNK_SIZE, load_columns, read_meta, save_edge_columns, save_node_columns
+
+# Tipi GEXF usati da nx.write_gexf per i corrispondenti tipi Python
+GEXF_TYPES = {'int': 'long', 'float': 'double', 'datetime': 'string', 'str': 'string'}
+# Caratteri non ammessi in XML 1.0 (rendono il file illeggibile per Gephi e nx.read_gexf)
+_INVALID_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff￾￿]')
+
+_EDGE_COLUMNS = ('source', 'target', 'reply', 'trigger')
+
+
+def _quote(value):
+    return quoteattr(_INVALID_XML.sub('', value))
+
+
+def _format(kind, value):
+    """Valore come stringa GEXF, oppure None se mancante (come gli attributi None per networkx)."""
+    if kind == 'float':
+        return None if np.isnan(value) else repr(float(value))
+    if kind == 'datetime':
+        return None if pd.isna(value) else pd.Timestamp(value).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    if kind == 'str':
+        return value or None
+    return str(int(value))
+
+
+def _attvalues(indent, values):
+    if not values:
+        return ''
+    lines = [f'{indent}  <attvalues>\n']
+    lines.extend(f'{indent}    <attvalue for="{aid}" value={_quote(value)} />\n' for aid, value in values)
+    lines.append(f'{indent}  </attvalues>\n')
+    return ''.join(lines)
+
+
+def write_gexf(columns_path, gexf_path, multigraph=True, denormalize=True, chunk_size=CHUNK_SIZE):
+    """Esporta un dataset a colonne in GEXF (per Gephi) scrivendo nodo per nodo e arco per arco:
+    le colonne sono lette in memory-map e i testi decodificati solo quando servono,
+    quindi non si costruisce mai il grafo NetworkX in memoria.
+
+    Con multigraph=False, come per un nx.DiGraph, tra due utenti resta un solo arco (l'ultimo).
+    Con denormalize=True i testi tornano sugli archi (trigger_text / reply_content)."""
+    meta = read_meta(columns_path)
+    kinds = meta['columns']
+    cols = load_columns(columns_path, mmap=True, lazy_strings=True)
+    handles = load_columns(columns_path, mmap=True, prefix='nodes.handle')['nodes.handle'].tolist()
+    n_edges = meta['n_edges']
+
+    node_keys = [name[6:] for name in kinds if name.startswith('nodes.') and name != 'nodes.handle']
+    edge_keys = [name[6:] for name in kinds if name.startswith('edges.') and name[6:] not in _EDGE_COLUMNS]
+    text_keys = ['trigger_uri', 'trigger_text', 'reply_uri', 'reply_content'] if denormalize \
+        else ['trigger_uri', 'reply_uri']
+    node_ids = {key: i for i, key in enumerate(node_keys)}
+    edge_ids = {key: len(node_ids) + i for i, key in enumerate(edge_keys + text_keys)}
+
+    source, target = cols['edges.source'], cols['edges.target']
+    if multigraph:
+        keep = None
+    else:
+        # Ultima occorrenza di ogni coppia (source, target)
+        pairs = np.asarray(source, dtype=np.int64) * max(len(handles), 1) + np.asarray(target, dtype=np.int64)
+        _, last = np.unique(pairs[::-1], return_index=True)
+        keep = np.zeros(n_edges, dtype=bool)
+        keep[n_edges - 1 - last] = True
+        del pairs, last
+
+    post_uris, post_texts = cols['posts.uri'], cols['posts.text']
+
+    with open(gexf_path, 'w', encoding='utf-8') as f:
+        f.write("<?xml version='1.0' encoding='utf-8'?>\n"
+                '<gexf xmlns="http://www.gexf.net/1.2draft" '
+                'xmlns:viz="http://www.gexf.net/1.2draft/viz" '
+                'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+                'xsi:schemaLocation="http://www.gexf.net/1.2draft http://www.gexf.net/1.2draft/gexf.xsd" '
+                'version="1.2">\n'
+                f'  <meta lastmodifieddate="{time.strftime("%Y-%m-%d")}" />\n'
+                '  <graph defaultedgetype="directed" mode="static" name="">\n')
+
+        # Dichiarazione degli attributi
+        f.write('    <attributes mode="static" class="edge">\n')
+        for key in edge_keys:
+            f.write(f'      <attribute id="{edge_ids[key]}" title={_quote(key)} '
+                    f'type="{GEXF_TYPES[kinds["edges." + key]]}" />\n')
+        for key in text_keys:
+            f.write(f'      <attribute id="{edge_ids[key]}" title="{key}" type="string" />\n')
+        f.write('    </attributes>\n')
+        f.write('    <attributes mode="static" class="node">\n')
+        for key in node_keys:
+            f.write(f'      <attribute id="{node_ids[key]}" title={_quote(key)} '
+                    f'type="{GEXF_TYPES[kinds["nodes." + key]]}" />\n')
+        f.write('    </attributes>\n')
+
+        # Nodi
+        f.write('    <nodes>\n')
+        node_cols = [(node_ids[key], kinds['nodes.' + key], cols['nodes.' + key]) for key in node_keys]
+        # Posizioni di layout.py: anche come viz:position, che Gephi usa per disporre i nodi
+        xs, ys = (cols['nodes.x'], cols['nodes.y']) if {'x', 'y'} <= set(node_keys) else (None, None)
+        for i, handle in enumerate(handles):
+            values = [(aid, _format(kind, column[i])) for aid, kind, column in node_cols]
+            values = [(aid, value) for aid, value in values if value is not None]
+            viz = ''
+            if xs is not None and not (np.isnan(xs[i]) or np.isnan(ys[i])):
+                viz = f'        <viz:position x="{float(xs[i])!r}" y="{float(ys[i])!r}" z="0.0" />\n'
+            head = f'      <node id={_quote(handle)} label={_quote(handle)}'
+            body = _attvalues("      ", values) + viz
+            f.write(f'{head}>\n{body}      </node>\n' if body else f'{head} />\n')
+        f.write('    </nodes>\n')
+
+        # Archi, a blocchi di chunk_size righe
+        f.write('    <edges>\n')
+        edge_cols = [(edge_ids[key], kinds['edges.' + key], cols['edges.' + key]) for key in edge_keys]
+        edge_id = 0
+        for start in range(0, n_edges, chunk_size):
+            stop = min(start + chunk_size, n_edges)
+            block = np.arange(start, stop) if keep is None else np.flatnonzero(keep[start:stop]) + start
+            sources, targets = source[block].tolist(), target[block].tolist()
+            replies, triggers = cols['edges.reply'][block].tolist(), cols['edges.trigger'][block].tolist()
+            lines = []
+            for j, i in enumerate(block.tolist()):
+                values = [(aid, _format(kind, column[i])) for aid, kind, column in edge_cols]
+                values = [(aid, value) for aid, value in values if value is not None]
+                for prefix, pid in (('trigger', triggers[j]), ('reply', replies[j])):
+                    if pid < 0:
+                        continue
+                    values.append((edge_ids[f'{prefix}_uri'], post_uris[pid]))
+                    if denormalize:
+                        text_key = 'trigger_text' if prefix == 'trigger' else 'reply_content'
+                        values.append((edge_ids[text_key], post_texts[pid]))
+                head = (f'      <edge source={_quote(handles[sources[j]])} '
+                        f'target={_quote(handles[targets[j]])} id="{edge_id}"')
+                lines.append(f'{head}>\n{_attvalues("      ", values)}      </edge>\n' if values else f'{head} />\n')
+                edge_id += 1
+            f.write(''.join(lines))
+        f.write('    </edges>\n  </graph>\n</gexf>\n')
+    return edge_id
+
+
+def attach_columns(columns_path, gexf_path, edges=None, nodes=None, **kwargs):
+    """Scrive nuove colonne nel dataset a colonne e rigenera il GEXF, senza cicli Python per arco
+    né grafo NetworkX in memoria. edges / nodes: DataFrame o {nome: array} allineati alle righe
+    (es. i sentiment calcolati su load_edges_frame). kwargs vanno a write_gexf."""
+    if edges is not None:
+        save_edge_columns(columns_path, edges)
+    if nodes is not None:
+        save_node_columns(columns_path, nodes)
+    return write_gexf(columns_path, gexf_path, **kwargs)
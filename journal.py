@@ -0,0 +1,218 @@
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+from dataset import Dataset, normalize_edges
+
+
+def normalize_time(value):
+    """Timestamp ISO-8601 in forma canonica (UTC, 'Z', microsecondi), così i confronti tra
+    stringhe seguono l'ordine temporale anche se l'API mescola '+00:00' e 'Z' o precisioni
+    diverse dei secondi. None (o un valore non leggibile) resta None."""
+    if not value:
+        return None
+    try:
+        ts = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def read_records(path, start=0, end=None):
+    # start / end: posizioni in byte (es. RunJournal.offset()) per rileggere solo una parte del journal
+    with open(path, 'rb') as f:
+        f.seek(start)
+        offset = start
+        for line in f:
+            if end is not None and offset >= end:
+                break
+            offset += len(line)
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # Riga troncata da un crash durante la scrittura: la ignoriamo
+                continue
+
+
+def iter_journal_threads(path, start=0, end=None):
+    """Rilegge dal disco (in streaming) i thread registrati in un journal, senza duplicati.
+    Restituisce (uri, posts, edges, users) in forma normalizzata."""
+    seen = set()
+    for rec in read_records(path, start, end):
+        if rec.get('type') != 'thread' or rec['uri'] in seen:
+            continue
+        seen.add(rec['uri'])
+        edges = [(source, target, attr) for source, target, attr in rec['edges']]
+        yield rec['uri'], rec.get('posts', {}), edges, rec['users']
+
+
+class RunJournal:
+    """Journal append-only (JSONL) di una raccolta: pagine scaricate per target,
+    thread elaborati e archi prodotti. Ogni riga viene scritta e sincronizzata su disco
+    subito, quindi dopo un crash basta rilanciare la stessa configurazione per riprendere."""
+
+    def __init__(self, path, config):
+        self.path = path
+        self.config = config
+        self.done_uris = set()
+        self.expanded_users = set()   # Utenti già espansi (crawl a valanga)
+        # target -> {'uris': [...], 'fetched': int, 'cursor': ..., 'done': bool,
+        #            'newest': timestamp del post più recente visto, 'since': soglia dell'aggiornamento}
+        self.targets = {}
+        self.cursor = None  # Posizione dello stream (firehose) già registrata
+        self.snapshot = None  # Ultimo snapshot a colonne registrato (firehose): {'offset': ..., 'full': ...}
+        self._load()
+        self._file = open(self.path, 'a', encoding='utf-8')
+        if self._resumed and not self._ends_with_newline():
+            # Chiudiamo l'eventuale riga troncata prima di accodare nuovi record
+            self._file.write('\n')
+        if not self._resumed:
+            self._write({'type': 'config', 'config': self.config})
+
+    def _load(self):
+        self._resumed = False
+        if not os.path.exists(self.path):
+            return
+        records = read_records(self.path)
+        first = next(records, None)
+        if not first or first.get('type') != 'config' or first.get('config') != self.config:
+            records.close()
+            # Configurazione cambiata: archiviamo il vecchio journal e ripartiamo da zero
+            archived = f"{self.path}.{int(time.time())}.old"
+            os.replace(self.path, archived)
+            print(f"🗂️ Configurazione diversa: vecchio journal spostato in {archived}")
+            return
+
+        self._resumed = True
+        for rec in records:
+            kind = rec.get('type')
+            if kind == 'page':
+                state = self.target_state(rec['target'])
+                state['uris'].extend(rec['uris'])
+                state['fetched'] += rec.get('fetched', len(rec['uris']))
+                state['cursor'] = rec['cursor']
+                newest = normalize_time(rec.get('newest'))   # Journal scritti prima della normalizzazione
+                state['newest'] = max(filter(None, (state['newest'], newest)), default=None)
+            elif kind == 'update':
+                self._begin_update()
+            elif kind == 'target_done':
+                self.target_state(rec['target'])['done'] = True
+            elif kind == 'thread':
+                self.done_uris.add(rec['uri'])
+            elif kind == 'user':
+                self.expanded_users.add(rec['handle'])
+            elif kind == 'snapshot':
+                self.snapshot = rec
+            if rec.get('cursor') is not None and kind in ('thread', 'cursor'):
+                self.cursor = rec['cursor']
+        print(f"♻️ Ripresa dal journal {self.path}: {len(self.done_uris)} thread già elaborati")
+
+    def _ends_with_newline(self):
+        with open(self.path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return True
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    # --- STATO DELLA PAGINAZIONE ---
+    def target_state(self, target):
+        return self.targets.setdefault(target, {'uris': [], 'fetched': 0, 'cursor': None, 'done': False,
+                                                'newest': None, 'since': None})
+
+    def record_page(self, target, uris, cursor, fetched=None, newest=None):
+        # uris: post selezionati della pagina; fetched: post restituiti dall'API (prima dei filtri);
+        # newest: timestamp (ISO) del post più recente della pagina
+        fetched = len(uris) if fetched is None else fetched
+        newest = normalize_time(newest)
+        state = self.target_state(target)
+        state['uris'].extend(uris)
+        state['fetched'] += fetched
+        state['cursor'] = cursor
+        state['newest'] = max(filter(None, (state['newest'], newest)), default=None)
+        self._write({'type': 'page', 'target': target, 'uris': uris, 'fetched': fetched, 'cursor': cursor,
+                     'newest': newest})
+
+    def record_target_done(self, target):
+        self.target_state(target)['done'] = True
+        self._write({'type': 'target_done', 'target': target})
+
+    # --- AGGIORNAMENTO INCREMENTALE ---
+    def completed(self):
+        return bool(self.targets) and all(state['done'] for state in self.targets.values())
+
+    def start_update(self):
+        """Apre un nuovo giro di raccolta sullo stesso journal: i target ripartono dalla prima
+        pagina ma solo per i post più recenti di 'newest' (che diventa 'since'); i thread già
+        elaborati restano nel journal e non vengono riscaricati."""
+        self._begin_update()
+        self._write({'type': 'update', 'time': time.strftime('%Y-%m-%dT%H:%M:%S')})
+
+    def _begin_update(self):
+        for state in self.targets.values():
+            state.update(fetched=0, cursor=None, done=False, since=state['newest'])
+
+    # --- THREAD ELABORATI ---
+    def is_done(self, uri):
+        return uri in self.done_uris
+
+    def record_thread(self, uri, edges, users, **extra):
+        # I testi vanno nella tabella 'posts' del record: uno per post, non uno per arco.
+        # extra: campi aggiuntivi scritti insieme agli archi (es. il cursore dello stream)
+        posts, slim_edges = normalize_edges(edges)
+        self.done_uris.add(uri)
+        if extra.get('cursor') is not None:
+            self.cursor = extra['cursor']
+        self._write({'type': 'thread', 'uri': uri, 'posts': posts, 'edges': slim_edges, 'users': users, **extra})
+
+    def iter_thread_records(self):
+        """Record 'thread' completi, senza duplicati, con i campi extra (es. depth / author
+        del crawl a valanga): servono a ricostruire lo stato del crawler senza richieste."""
+        self._file.flush()
+        seen = set()
+        for rec in read_records(self.path):
+            if rec.get('type') == 'thread' and rec['uri'] not in seen:
+                seen.add(rec['uri'])
+                yield rec
+
+    # --- UTENTI ESPANSI ---
+    def record_user(self, handle):
+        self.expanded_users.add(handle)
+        self._write({'type': 'user', 'handle': handle})
+
+    # --- STREAM ---
+    def record_cursor(self, cursor, **extra):
+        # Checkpoint dello stream anche quando non ci sono archi nuovi
+        self.cursor = cursor
+        self._write({'type': 'cursor', 'cursor': cursor, **extra})
+
+    def record_snapshot(self, offset, full):
+        # Il dataset a colonne copre il journal fino a offset (full: ricostruito per intero)
+        self.snapshot = {'type': 'snapshot', 'offset': offset, 'full': full}
+        self._write(self.snapshot)
+
+    def offset(self):
+        """Dimensione attuale del journal in byte (fine dell'ultimo record scritto)."""
+        self._file.flush()
+        return os.fstat(self._file.fileno()).st_size
+
+    def iter_threads(self, start=0, end=None):
+        self._file.flush()
+        return iter_journal_threads(self.path, start, end)
+
+    def load_dataset(self):
+        dataset = Dataset()
+        for _, posts, edges, users in self.iter_threads():
+            dataset.add_thread(posts, edges, users)
+        return dataset
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,314 @@
+import numpy as np
+
+from analytics import CSRGraph
+from columnar import load_columns, read_meta, save_node_columns
+
+# --- CONFIGURAZIONE ---
+INPUT_PATH = 'dataset_hashtag.cols'   # Dataset a colonne da disporre (x / y finiscono tra le colonne dei nodi)
+GEXF_PATH = 'dataset_hashtag_layout.gexf'   # GEXF con le posizioni (None: non esportare)
+HTML_PREFIX = 'layout_hashtag'        # Pagine interattive: <prefisso>_top.html e <prefisso>_communities.html
+
+# ForceAtlas2
+ITERATIONS = 300      # Giri di simulazione
+SCALING = 2.0         # Forza di repulsione (kr): valori più alti allargano il grafo
+GRAVITY = 1.0         # Attrazione verso il centro (tiene vicini i componenti sconnessi)
+TOLERANCE = 1.0       # Tolleranza all'oscillazione: più alta = più veloce ma meno preciso
+LEAF_SIZE = 8         # Nodi medi per cella della griglia più fine (repulsione esatta solo tra celle vicine)
+SEED = 0
+
+# Livelli di dettaglio per l'HTML
+TOP_K = 2000             # Nodi più importanti mostrati in <prefisso>_top.html
+TOP_BY = 'pagerank'      # 'pagerank' oppure 'degree'
+MAX_HTML_EDGES = 20000   # Archi più pesanti tenuti in ogni pagina
+MAX_COMMUNITIES = 300    # Super-nodi (comunità più grandi) in <prefisso>_communities.html
+CANVAS = 4000            # Ampiezza del disegno in pixel
+PALETTE = ['#e6194b', '#3cb44b', '#ffe119', '#4363d8', '#f58231', '#911eb4', '#46f0f0', '#f032e6',
+           '#bcf60c', '#fabebe', '#008080', '#e6beff', '#9a6324', '#fffac8', '#800000', '#aaffc3']
+
+MAX_PAIRS = 4_000_000    # Coppie vicine calcolate per blocco (limita la memoria con celle molto piene)
+_EPS = 1e-9
+
+
+# --- FORCEATLAS2 ---
+def _near_pairs(cell, side):
+    """Coppie (i, j) di nodi in celle adiacenti della griglia fine (la stessa cella inclusa), a blocchi."""
+    order = np.argsort(cell, kind='stable')
+    starts = np.searchsorted(cell[order], np.arange(side * side))
+    counts = np.bincount(cell, minlength=side * side)
+    cx, cy = cell // side, cell % side
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            nx_, ny_ = cx + dx, cy + dy
+            valid = np.flatnonzero((nx_ >= 0) & (nx_ < side) & (ny_ >= 0) & (ny_ < side))
+            other = nx_[valid] * side + ny_[valid]
+            n_pairs = counts[other]
+            # Blocchi con al massimo ~MAX_PAIRS coppie
+            bounds = np.searchsorted(np.cumsum(n_pairs), np.arange(MAX_PAIRS, n_pairs.sum(), MAX_PAIRS))
+            for block in np.split(np.arange(len(valid)), bounds):
+                c = n_pairs[block]
+                i = np.repeat(valid[block], c)
+                offsets = np.arange(c.sum()) - np.repeat(np.cumsum(c) - c, c)
+                j = order[np.repeat(starts[other[block]], c) + offsets]
+                keep = i != j
+                yield i[keep], j[keep]
+
+
+def _repulsion(pos, mass, scaling, leaf_size=LEAF_SIZE):
+    """Repulsione kr * m_i * m_j / d con l'approssimazione di Barnes-Hut su una piramide di griglie:
+    a ogni livello un nodo interagisce con il baricentro delle celle figlie dei vicini della sua
+    cella madre che non sono vicine alla sua (come un quadtree, ma ogni livello è un'operazione
+    vettoriale su tutti i nodi). Solo i nodi delle celle adiacenti al livello più fine
+    si respingono coppia per coppia."""
+    n = len(pos)
+    force = np.zeros_like(pos)
+    levels = max(2, int(np.ceil(np.log(max(n / leaf_size, 1.0)) / np.log(4))))
+    side = 2 ** levels
+    low = pos.min(axis=0)
+    span = max(float((pos.max(axis=0) - low).max()), _EPS) * (1 + 1e-6)
+    fine = np.minimum(((pos - low) / span * side).astype(np.int64), side - 1)
+
+    # Campo lontano, livello per livello (ai livelli 0 e 1 tutte le celle sono vicine)
+    offsets = np.array([(dx, dy) for dx in range(-2, 4) for dy in range(-2, 4)])
+    for level in range(2, levels + 1):
+        s = 2 ** level
+        own = fine >> (levels - level)
+        cell = own[:, 0] * s + own[:, 1]
+        m = np.bincount(cell, weights=mass, minlength=s * s)
+        filled = m > 0
+        com = np.zeros((s * s, 2))
+        for k in range(2):
+            com[filled, k] = np.bincount(cell, weights=mass * pos[:, k], minlength=s * s)[filled] / m[filled]
+        base = (own >> 1) * 2
+        for dx, dy in offsets:
+            ox, oy = base[:, 0] + dx, base[:, 1] + dy
+            ok = ((np.abs(ox - own[:, 0]) > 1) | (np.abs(oy - own[:, 1]) > 1)) & (ox >= 0) & (ox < s) & (oy >= 0) & (oy < s)
+            idx = np.flatnonzero(ok)
+            other = ox[idx] * s + oy[idx]
+            hit = filled[other]
+            idx, other = idx[hit], other[hit]
+            delta = pos[idx] - com[other]
+            d2 = np.maximum((delta ** 2).sum(axis=1), _EPS)
+            force[idx] += delta * (scaling * mass[idx] * m[other] / d2)[:, None]
+
+    # Campo vicino, esatto
+    for i, j in _near_pairs(fine[:, 0] * side + fine[:, 1], side):
+        delta = pos[i] - pos[j]
+        d2 = (delta ** 2).sum(axis=1)
+        # Nodi sovrapposti: una piccola spinta in una direzione qualsiasi li separa
+        same = d2 < _EPS
+        delta[same] = _EPS ** 0.5
+        d2 = np.maximum(d2, _EPS)
+        f = delta * (scaling * mass[i] * mass[j] / d2)[:, None]
+        for k in range(2):
+            force[:, k] += np.bincount(i, weights=f[:, k], minlength=n)
+    return force
+
+
+def force_atlas2(graph, iterations=ITERATIONS, scaling=SCALING, gravity=GRAVITY, tolerance=TOLERANCE,
+                 leaf_size=LEAF_SIZE, seed=SEED, positions=None, progress=None):
+    """Layout ForceAtlas2 (Jacomy et al. 2014) del grafo non orientato, tutto su array NumPy:
+    attrazione lineare lungo gli archi (pesata per numero di risposte), repulsione per
+    grado + 1 con Barnes-Hut su griglia, gravità verso il centro e velocità adattiva
+    (globale da oscillazione / trazione, locale per nodo). Restituisce un array (n, 2).
+
+    positions: posizioni di partenza (es. il layout precedente, dopo un aggiornamento del dataset)."""
+    rng = np.random.default_rng(seed)
+    u, v, w = graph.undirected_edges()
+    half = len(u) // 2
+    u, v, w = u[:half], v[:half], w[:half]
+    mass = 1.0 + np.bincount(u, minlength=graph.n) + np.bincount(v, minlength=graph.n)
+    pos = rng.uniform(-1, 1, (graph.n, 2)) * np.sqrt(graph.n) * 10
+    if positions is not None:
+        # I nodi nuovi (posizione NaN dopo un aggiornamento del dataset) partono a caso
+        positions = np.array(positions, dtype=np.float64)
+        known = ~np.isnan(positions).any(axis=1)
+        pos[known] = positions[known]
+    if graph.n < 2:
+        return pos
+
+    speed, speed_efficiency = 1.0, 1.0
+    previous = np.zeros_like(pos)
+    jitter = tolerance * max(np.sqrt(np.sqrt(graph.n)), min(10.0, 0.05 * np.sqrt(graph.n)))
+    for it in range(iterations):
+        force = _repulsion(pos, mass, scaling, leaf_size)
+        delta = pos[u] - pos[v]
+        for k in range(2):
+            force[:, k] -= np.bincount(u, weights=w * delta[:, k], minlength=graph.n)
+            force[:, k] += np.bincount(v, weights=w * delta[:, k], minlength=graph.n)
+        dist = np.maximum(np.sqrt((pos ** 2).sum(axis=1)), _EPS)
+        force -= pos * (gravity * mass / dist)[:, None]
+
+        # Velocità globale: quanto i nodi oscillano (swing) rispetto a quanto avanzano (traction)
+        swing = mass * np.sqrt(((force - previous) ** 2).sum(axis=1))
+        traction = mass * np.sqrt(((force + previous) ** 2).sum(axis=1)) / 2
+        total_swing, total_traction = swing.sum(), traction.sum()
+        if total_swing / max(total_traction, _EPS) > 2.0:
+            speed_efficiency = max(0.05, speed_efficiency * 0.5)
+        elif speed < 1000:
+            speed_efficiency *= 1.3
+        target = jitter * speed_efficiency * total_traction / max(total_swing, _EPS)
+        speed += min(target - speed, 0.5 * speed)
+
+        # Velocità locale: i nodi che oscillano rallentano; spostamento massimo 10 unità per giro
+        factor = speed / (1.0 + np.sqrt(speed * swing))
+        norm = np.sqrt((force ** 2).sum(axis=1))
+        factor = np.minimum(factor, 10.0 / np.maximum(norm, _EPS))
+        pos += force * factor[:, None]
+        previous = force
+        if progress:
+            progress(it)
+    return pos
+
+
+# --- LIVELLI DI DETTAGLIO ---
+def top_k(scores, k=TOP_K):
+    """Indici dei k nodi con punteggio più alto, in ordine decrescente."""
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k] if k else np.array([], dtype=np.int64)
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+def induced_edges(graph, nodes, max_edges=MAX_HTML_EDGES):
+    """Archi (sorgente, destinazione, peso) tra i nodi scelti, i più pesanti per primi."""
+    keep = np.zeros(graph.n, dtype=bool)
+    keep[nodes] = True
+    mask = keep[graph.rows] & keep[graph.indices] & (graph.rows != graph.indices)
+    src, dst, w = graph.rows[mask], graph.indices[mask], graph.weights[mask]
+    order = np.argsort(-w, kind='stable')[:max_edges]
+    return src[order], dst[order], w[order]
+
+
+def aggregate_communities(graph, labels, pos, scores, max_communities=MAX_COMMUNITIES):
+    """Grafo delle comunità: un super-nodo per comunità (baricentro delle posizioni dei membri,
+    pesato per grado) e un arco pesato per ogni coppia di comunità che si rispondono.
+    Restituisce (comunità, membri, posizioni, nodo rappresentativo, (sorgenti, destinazioni, pesi))."""
+    n_labels = int(labels.max()) + 1 if len(labels) else 0
+    size = np.bincount(labels, minlength=n_labels)
+    chosen = top_k(size.astype(np.float64), max_communities)
+    weight = 1.0 + graph.out_degree() + graph.in_degree()
+    total = np.bincount(labels, weights=weight, minlength=n_labels)
+    centers = np.stack([np.bincount(labels, weights=weight * pos[:, k], minlength=n_labels) / total
+                        for k in range(2)], axis=1)
+    # Rappresentante: il membro col punteggio più alto (per etichettare il super-nodo)
+    order = np.lexsort((-scores, labels))
+    first = order[np.r_[True, labels[order][1:] != labels[order][:-1]]]
+    leader = np.zeros(n_labels, dtype=np.int64)
+    leader[labels[first]] = first
+
+    src, dst = labels[graph.rows], labels[graph.indices]
+    cross = src != dst
+    keys, inverse = np.unique(src[cross] * n_labels + dst[cross], return_inverse=True)
+    w = np.bincount(inverse, weights=graph.weights[cross])
+    c_src, c_dst = keys // n_labels, keys % n_labels
+    keep = np.isin(c_src, chosen) & np.isin(c_dst, chosen)
+    return chosen, size[chosen], centers[chosen], leader[chosen], (c_src[keep], c_dst[keep], w[keep])
+
+
+# --- HTML (pyvis, senza fisica) ---
+def _scale(pos, canvas=CANVAS):
+    # Centrato e riscalato nel riquadro del canvas (vis.js lavora in pixel)
+    if not len(pos):
+        return pos
+    center = (pos.max(axis=0) + pos.min(axis=0)) / 2
+    extent = max(float(np.abs(pos - center).max()), _EPS)
+    return (pos - center) * (canvas / 2 / extent)
+
+
+def write_html(path, ids, labels, pos, sizes, edges, titles=None, colors=None, canvas=CANVAS):
+    """Pagina pyvis con le posizioni già calcolate e la fisica spenta: il browser disegna e basta.
+    Nodi e archi vanno direttamente nelle liste della Network (add_node / add_edge controllano
+    ogni volta l'esistenza dei nodi con una scansione lineare, quadratica sui grafi grandi)."""
+    from pyvis.network import Network
+
+    net = Network(height="750px", width="100%", bgcolor="#222222", font_color="white",
+                  directed=True, cdn_resources='remote')
+    xy = _scale(pos, canvas)
+    for k, node_id in enumerate(ids):
+        node = {'id': node_id, 'label': labels[k], 'shape': 'dot', 'size': float(sizes[k]),
+                'x': float(xy[k, 0]), 'y': float(xy[k, 1]), 'title': titles[k] if titles else labels[k]}
+        if colors:
+            node['color'] = colors[k]
+        net.nodes.append(node)
+        net.node_ids.append(node_id)
+        net.node_map[node_id] = node
+    src, dst, w = edges
+    width = 1.0 + np.log1p(w)
+    net.edges = [{'from': s, 'to': t, 'width': float(x), 'arrows': 'to'}
+                 for s, t, x in zip(np.asarray(ids)[src].tolist(), np.asarray(ids)[dst].tolist(), width.tolist())]
+    net.toggle_physics(False)
+    net.save_graph(path)
+    return net
+
+
+def _sizes(values, low=5.0, high=40.0):
+    values = np.asarray(values, dtype=np.float64)
+    top = values.max() if len(values) and values.max() > 0 else 1.0
+    return low + (high - low) * np.sqrt(values / top)
+
+
+def export_top(path, graph, pos, scores, labels=None, k=TOP_K, max_edges=MAX_HTML_EDGES):
+    """Vista dei k nodi più importanti, nelle posizioni del layout completo."""
+    nodes = top_k(scores, k)
+    local = np.full(graph.n, -1, dtype=np.int64)
+    local[nodes] = np.arange(len(nodes))
+    src, dst, w = induced_edges(graph, nodes, max_edges)
+    handles = graph.handles[nodes].tolist()
+    colors = [PALETTE[c % len(PALETTE)] for c in labels[nodes].tolist()] if labels is not None else None
+    titles = [f"{h} (punteggio {s:.4g}, risposte ricevute {d:.0f})"
+              for h, s, d in zip(handles, scores[nodes].tolist(), graph.in_degree()[nodes].tolist())]
+    write_html(path, list(range(len(nodes))), handles, pos[nodes], _sizes(scores[nodes]),
+               (local[src], local[dst], w), titles=titles, colors=colors)
+    return len(nodes), len(src)
+
+
+def export_communities(path, graph, pos, scores, labels, max_communities=MAX_COMMUNITIES):
+    """Vista aggregata: un super-nodo per comunità, grande quanto il numero di membri."""
+    chosen, size, centers, leader, (src, dst, w) = aggregate_communities(graph, labels, pos, scores,
+                                                                          max_communities)
+    local = np.full(int(labels.max()) + 1, -1, dtype=np.int64)
+    local[chosen] = np.arange(len(chosen))
+    names = [f"{graph.handles[lead]} (+{n - 1})" for lead, n in zip(leader.tolist(), size.tolist())]
+    titles = [f"Comunità {c}: {n} utenti, guida {graph.handles[lead]}"
+              for c, n, lead in zip(chosen.tolist(), size.tolist(), leader.tolist())]
+    colors = [PALETTE[c % len(PALETTE)] for c in chosen.tolist()]
+    order = np.argsort(-w, kind='stable')[:MAX_HTML_EDGES]
+    write_html(path, list(range(len(chosen))), names, centers, _sizes(size, 8.0, 80.0),
+               (local[src[order]], local[dst[order]], w[order]), titles=titles, colors=colors)
+    return len(chosen), len(order)
+
+
+if __name__ == "__main__":
+    import time
+
+    meta = read_meta(INPUT_PATH)
+    print(f"🗺️ Layout di {INPUT_PATH}: {meta['n_nodes']} nodi, {meta['n_edges']} archi")
+    graph = CSRGraph.from_columnar(INPUT_PATH)
+    nodes = load_columns(INPUT_PATH, mmap=True, prefix='nodes.')
+
+    start = time.perf_counter()
+    previous = np.stack([nodes['nodes.x'], nodes['nodes.y']], axis=1) if 'nodes.x' in nodes else None
+    pos = force_atlas2(graph, positions=previous)
+    print(f"✅ ForceAtlas2: {ITERATIONS} giri in {time.perf_counter() - start:.1f}s")
+
+    # Comunità e punteggi: se analytics.py / communities.py li hanno già scritti, si riusano
+    columns = {'x': pos[:, 0], 'y': pos[:, 1]}
+    if 'nodes.community' in nodes:
+        labels = np.asarray(nodes['nodes.community'], dtype=np.int64)
+    else:
+        labels = columns['community'] = graph.label_propagation(seed=SEED)
+    if TOP_BY == 'pagerank':
+        scores = np.asarray(nodes['nodes.pagerank']) if 'nodes.pagerank' in nodes else graph.pagerank()
+    else:
+        scores = graph.in_degree() + graph.out_degree()
+    save_node_columns(INPUT_PATH, columns)
+    print(f"💾 Posizioni x / y salvate nelle colonne dei nodi di {INPUT_PATH}")
+
+    n_nodes, n_edges = export_top(f"{HTML_PREFIX}_top.html", graph, pos, scores, labels)
+    print(f"🌐 {HTML_PREFIX}_top.html: {n_nodes} nodi, {n_edges} archi (primi per {TOP_BY})")
+    n_nodes, n_edges = export_communities(f"{HTML_PREFIX}_communities.html", graph, pos, scores, labels)
+    print(f"🌐 {HTML_PREFIX}_communities.html: {n_nodes} comunità, {n_edges} archi tra comunità")
+
+    if GEXF_PATH:
+        from gexf import write_gexf
+        write_gexf(INPUT_PATH, GEXF_PATH, multigraph=True)
+        print(f"💾 {GEXF_PATH} con le posizioni (viz:position) per Gephi")
@@ -0,0 +1,283 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+# --- CONFIGURAZIONE DI DEFAULT ---
+# Limiti superiori (secondi) dei bucket degli istogrammi di latenza
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PROMETHEUS_INTERVAL = 30   # Ogni quanti secondi riscrivere il file Prometheus
+PREFIX = 'bsky'            # Prefisso dei nomi delle metriche Prometheus
+WAIT_PREFIX = 'sleep'      # Fasi di attesa (rate limit, backoff): misurate anche insieme, in tempo reale
+
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _wall_keys(name):
+    # Ogni fase ha il suo orologio in tempo reale; le fasi di attesa anche quello comune
+    return (name, WAIT_PREFIX) if name.startswith(WAIT_PREFIX) and name != WAIT_PREFIX else (name,)
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+class Histogram:
+    """Istogramma cumulativo a bucket fissi (come quelli di Prometheus)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        # Stima per interpolazione lineare dentro il bucket (l'ultimo è aperto: ne diamo il limite inferiore)
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                low = self.buckets[i - 1] if i else 0.0
+                if i == len(self.buckets):
+                    return low
+                return low + (self.buckets[i] - low) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+    def summary(self):
+        cumulative = 0
+        buckets = {}
+        for bound, n in zip(list(self.buckets) + ['+Inf'], self.counts):
+            cumulative += n
+            buckets[str(bound)] = cumulative
+        quantiles = {f'p{int(q * 100)}': self.quantile(q) for q in (0.5, 0.9, 0.99)}
+        return {'count': self.count, 'sum_seconds': round(self.sum, 3),
+                'mean_seconds': round(self.sum / self.count, 4) if self.count else None,
+                **{key: round(value, 4) for key, value in quantiles.items() if value is not None},
+                'buckets': buckets}
+
+
+class Metrics:
+    """Registro delle metriche di una esecuzione, condiviso da tutti i thread:
+    contatori con etichette, istogrammi di latenza per endpoint e tempi per fase.
+
+    Le fasi si annidano per thread: ogni fase registra sia il tempo totale sia il
+    tempo "proprio", al netto delle fasi interne. Così per esempio il tempo proprio
+    di un thread elaborato è parsing + visita, senza la rete e le attese.
+    Questi tempi sono sommati sui thread (con 4 worker possono superare la durata del run);
+    il tempo reale con almeno un thread dentro la fase è in wall_seconds."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.counters = Counter()
+        self.gauges = {}
+        self.histograms = defaultdict(Histogram)
+        self.stages = defaultdict(lambda: [0, 0.0, 0.0])   # [chiamate, secondi totali, secondi propri]
+        self.wall = defaultdict(float)   # fase -> secondi reali con almeno un thread nella fase
+        self._active = Counter()         # fase -> thread dentro la fase adesso
+        self._active_since = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._exporter = None
+
+    # --- REGISTRAZIONE ---
+    def inc(self, name, n=1, **labels):
+        with self._lock:
+            self.counters[name, _labels(labels)] += n
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.gauges[name, _labels(labels)] = value
+
+    def observe(self, name, seconds, **labels):
+        with self._lock:
+            self.histograms[name, _labels(labels)].observe(seconds)
+
+    @contextmanager
+    def stage(self, name):
+        """Misura il tempo speso nel blocco (vedi la docstring della classe per l'annidamento)."""
+        stack = self._local.__dict__.setdefault('stack', [])
+        frame = [0.0]   # Tempo delle fasi interne
+        stack.append(frame)
+        start = time.perf_counter()
+        with self._lock:
+            for key in _wall_keys(name):
+                self._active[key] += 1
+                if self._active[key] == 1:
+                    self._active_since[key] = start
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            elapsed = end - start
+            stack.pop()
+            if stack:
+                stack[-1][0] += elapsed
+            with self._lock:
+                entry = self.stages[name]
+                entry[0] += 1
+                entry[1] += elapsed
+                entry[2] += elapsed - frame[0]
+                for key in _wall_keys(name):
+                    self._active[key] -= 1
+                    if not self._active[key]:
+                        self.wall[key] += end - self._active_since.pop(key)
+
+    def timed(self, name):
+        """Decoratore: ogni chiamata della funzione è una fase."""
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    # --- LETTURA ---
+    def _wall_seconds(self, key, now):
+        # Da chiamare con il lock: include l'intervallo in corso se qualche thread è ancora nella fase
+        return self.wall[key] + (now - self._active_since[key] if key in self._active_since else 0.0)
+
+    def total(self, name):
+        with self._lock:
+            return sum(value for (key, _), value in self.counters.items() if key == name)
+
+    def summary(self):
+        elapsed = time.time() - self.started
+        with self._lock:
+            counters = defaultdict(dict)
+            for (name, labels), value in sorted(self.counters.items()):
+                counters[name][','.join(f'{k}={v}' for k, v in labels) or 'totale'] = value
+            gauges = {name + _label_text(labels): value for (name, labels), value in self.gauges.items()}
+            histograms = defaultdict(dict)
+            for (name, labels), hist in sorted(self.histograms.items()):
+                histograms[name][','.join(v for _, v in labels) or 'totale'] = hist.summary()
+            now = time.perf_counter()
+            stages = {name: {'calls': calls, 'seconds': round(total, 3), 'self_seconds': round(own, 3),
+                             'wall_seconds': round(self._wall_seconds(name, now), 3)}
+                      for name, (calls, total, own) in sorted(self.stages.items())}
+            wait_wall = self._wall_seconds(WAIT_PREFIX, now)
+        edges = self.total('edges')
+        return {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'elapsed_seconds': round(elapsed, 3),
+            'edges': edges,
+            'edges_per_sec': round(edges / elapsed, 2) if elapsed else None,
+            'stages': stages,
+            'wait_wall_seconds': round(wait_wall, 3),   # Tempo reale con almeno un thread in attesa
+            'counters': dict(counters),
+            'gauges': gauges,
+            'histograms': dict(histograms),
+        }
+
+    # --- EXPORT ---
+    def save_json(self, path, **extra):
+        """Riepilogo JSON di fine esecuzione (extra: es. la configurazione dello script)."""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({**extra, **self.summary()}, f, indent=2, ensure_ascii=False)
+
+    def prometheus_text(self):
+        """Metriche nel formato testuale di Prometheus (per il textfile collector di node_exporter)."""
+        lines = []
+        with self._lock:
+            names = sorted({name for name, _ in self.counters})
+            for name in names:
+                lines.append(f'# TYPE {PREFIX}_{name}_total counter')
+                for (key, labels), value in sorted(self.counters.items()):
+                    if key == name:
+                        lines.append(f'{PREFIX}_{name}_total{_label_text(labels)} {value}')
+            for name in sorted({name for name, _ in self.gauges}):
+                lines.append(f'# TYPE {PREFIX}_{name} gauge')
+                for (key, labels), value in sorted(self.gauges.items()):
+                    if key == name:
+                        lines.append(f'{PREFIX}_{name}{_label_text(labels)} {value}')
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f'# TYPE {PREFIX}_{name} histogram')
+                for (key, labels), hist in sorted(self.histograms.items()):
+                    if key != name:
+                        continue
+                    cumulative = 0
+                    for bound, n in zip(list(hist.buckets) + ['+Inf'], hist.counts):
+                        cumulative += n
+                        lines.append(f'{PREFIX}_{name}_bucket{_label_text(labels + (("le", str(bound)),))} {cumulative}')
+                    lines.append(f'{PREFIX}_{name}_sum{_label_text(labels)} {hist.sum}')
+                    lines.append(f'{PREFIX}_{name}_count{_label_text(labels)} {hist.count}')
+            for i, metric in enumerate(('stage_calls_total', 'stage_seconds_total', 'stage_self_seconds_total')):
+                lines.append(f'# TYPE {PREFIX}_{metric} counter')
+                for name, values in sorted(self.stages.items()):
+                    lines.append(f'{PREFIX}_{metric}{{stage="{name}"}} {values[i]}')
+            now = time.perf_counter()
+            lines.append(f'# TYPE {PREFIX}_stage_wall_seconds_total counter')
+            for name in sorted(self.stages):
+                lines.append(f'{PREFIX}_stage_wall_seconds_total{{stage="{name}"}} {self._wall_seconds(name, now)}')
+        elapsed = time.time() - self.started
+        lines.append(f'# TYPE {PREFIX}_uptime_seconds gauge')
+        lines.append(f'{PREFIX}_uptime_seconds {elapsed}')
+        lines.append(f'# TYPE {PREFIX}_edges_per_second gauge')
+        lines.append(f'{PREFIX}_edges_per_second {self.total("edges") / elapsed if elapsed else 0}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        # Scrittura atomica: chi legge il file non vede mai metà aggiornamento
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp, path)
+
+    def start_exporter(self, path, interval=PROMETHEUS_INTERVAL):
+        """Riscrive il file Prometheus ogni interval secondi in un thread in background."""
+        stop = threading.Event()
+
+        def loop():
+            while not stop.wait(interval):
+                self.write_prometheus(path)
+
+        thread = threading.Thread(target=loop, daemon=True)
+        thread.start()
+        self._exporter = (stop, thread, path)
+
+    def stop_exporter(self):
+        if self._exporter:
+            stop, thread, path = self._exporter
+            stop.set()
+            thread.join()
+            self.write_prometheus(path)
+            self._exporter = None
+
+    def report(self):
+        s = self.summary()
+        with self._lock:
+            counters = list(self.counters.items())
+        requests = self.total('requests')
+        errors = requests - sum(value for (name, labels), value in counters
+                                if name == 'requests' and ('status', '200') in labels)
+        stages = s['stages']
+        sleep = sum(v['self_seconds'] for k, v in stages.items() if k.startswith(WAIT_PREFIX))
+        network = stages.get('network', {})
+        print(f"⏱️ Metriche: {requests} richieste ({errors} errori, {self.total('retries')} retry), "
+              f"rete {round(network.get('wall_seconds', 0), 1)}s, attese {round(s['wait_wall_seconds'], 1)}s "
+              f"su {round(s['elapsed_seconds'], 1)}s di esecuzione, {s['edges']} archi ({s['edges_per_sec']}/s)")
+        print(f"   Sommati sui thread: rete {round(network.get('self_seconds', 0), 1)}s, attese {round(sleep, 1)}s")
+        rejected = {labels[0][1]: value for (name, labels), value in counters
+                    if name == 'threads_rejected' and labels}
+        if rejected:
+            print("   Thread scartati: " + ', '.join(f"{reason}: {n}" for reason, n in sorted(rejected.items())))
+
+
+# Registro unico del processo, come il registro di default di prometheus_client
+registry = Metrics()
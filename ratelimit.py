@@ -0,0 +1,137 @@
+import random
+import threading
+import time
+
+from atproto import Client, exceptions
+
+from metrics import registry
+
+# --- CONFIGURAZIONE DI DEFAULT ---
+MAX_RETRIES = 5          # Tentativi extra su 429 / 5xx / timeout
+BASE_BACKOFF = 1.0       # Secondi del primo backoff (poi raddoppia)
+MAX_BACKOFF = 60.0       # Tetto del backoff esponenziale
+QUOTA_RESERVE = 10       # Richieste della finestra che lasciamo sempre libere
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class AdaptiveRateLimiter:
+    """Controller condiviso da tutti i thread: legge gli header ratelimit-* del server,
+    distribuisce le richieste rimaste nella finestra fino al reset e, su 429/5xx/timeout,
+    mette in pausa tutti con un backoff esponenziale con jitter.
+    Con requests_per_second > 0 le richieste reali non superano comunque quel ritmo:
+    è il budget di richieste degli script (una per ogni chiamata XRPC, retry compresi)."""
+
+    def __init__(self, max_retries=MAX_RETRIES, base_backoff=BASE_BACKOFF,
+                 max_backoff=MAX_BACKOFF, reserve=QUOTA_RESERVE, requests_per_second=0):
+        self.min_interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.reserve = reserve
+        self.limit = None
+        self.remaining = None
+        self.reset_at = None
+        self.slept = 0.0
+        self.retries = 0
+        self._next_slot = 0.0
+        self._pause_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next_slot, self._pause_until)
+            interval = self.min_interval
+            if self.remaining is not None and self.reset_at and self.reset_at > now:
+                if self.remaining <= self.reserve:
+                    # Quota finita: aspettiamo il reset della finestra
+                    slot = max(slot, self.reset_at)
+                    self.remaining = None
+                else:
+                    # Distribuiamo le richieste rimaste sul tempo che manca al reset
+                    interval = max(interval, (self.reset_at - now) / (self.remaining - self.reserve))
+                    self.remaining -= 1
+            self._next_slot = slot + interval
+        wait = slot - now
+        if wait > 0:
+            self._sleep(wait)
+
+    def update(self, headers):
+        """Aggiorna la stima della quota dagli header della risposta."""
+        try:
+            remaining = int(headers['ratelimit-remaining'])
+            reset_at = float(headers['ratelimit-reset'])
+        except (KeyError, TypeError, ValueError):
+            return
+        with self._lock:
+            self.remaining = remaining
+            self.reset_at = reset_at
+            if 'ratelimit-limit' in headers:
+                self.limit = int(headers['ratelimit-limit'])
+
+    def backoff(self, attempt, response=None):
+        """Pausa dopo un errore ritentabile. Su 429 la pausa vale per tutti i thread."""
+        delay = min(self.max_backoff, self.base_backoff * 2 ** attempt) * random.uniform(0.5, 1.5)
+        with self._lock:
+            self.retries += 1
+            if response is not None and response.status_code == 429:
+                until = time.time() + delay
+                reset = (response.headers or {}).get('ratelimit-reset')
+                if reset:
+                    until = max(until, float(reset))
+                self._pause_until = max(self._pause_until, until)
+                self.remaining = None
+                return
+        self._sleep(delay)
+
+    def _sleep(self, seconds):
+        with self._lock:
+            self.slept += seconds
+        time.sleep(seconds)
+
+
+def is_retryable(error):
+    # Timeout / errori di rete senza risposta, 429 e 5xx vanno ritentati; 4xx no
+    response = getattr(error, 'response', None)
+    if response is None:
+        return isinstance(error, exceptions.NetworkError)
+    return response.status_code in RETRY_STATUS
+
+
+class RateLimitedClient(Client):
+    """atproto Client che passa ogni richiesta XRPC dall'AdaptiveRateLimiter e
+    ritenta automaticamente le richieste fallite per quota, errori del server o timeout."""
+
+    def __init__(self, *args, limiter=None, requests_per_second=0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limiter = limiter or AdaptiveRateLimiter(requests_per_second=requests_per_second)
+
+    def _invoke(self, invoke_type, **kwargs):
+        # Nome XRPC dell'endpoint (es. app.bsky.feed.getPostThread) per le metriche
+        endpoint = str(kwargs.get('url', '')).rsplit('/', 1)[-1]
+        attempt = 0
+        while True:
+            with registry.stage('sleep_quota'):
+                self.limiter.acquire()
+            start = time.perf_counter()
+            try:
+                with registry.stage('network'):
+                    response = super()._invoke(invoke_type, **dict(kwargs))
+            except exceptions.RequestErrorBase as e:
+                status = e.response.status_code if e.response is not None else 'error'
+                registry.observe('request_seconds', time.perf_counter() - start, endpoint=endpoint)
+                registry.inc('requests', endpoint=endpoint, status=status)
+                if e.response is not None:
+                    self.limiter.update(e.response.headers or {})
+                if attempt >= self.limiter.max_retries or not is_retryable(e):
+                    raise
+                registry.inc('retries', endpoint=endpoint, status=status)
+                with registry.stage('sleep_backoff'):
+                    self.limiter.backoff(attempt, e.response)
+                attempt += 1
+                continue
+            registry.observe('request_seconds', time.perf_counter() - start, endpoint=endpoint)
+            registry.inc('requests', endpoint=endpoint, status=response.status_code)
+            self.limiter.update(response.headers)
+            return response
@@ -1,12 +1,13 @@
-import time
-import networkx as nx
-from atproto import Client
-from tqdm import tqdm
+from cache import CachedClient, ResponseCache
+from session import lazy_client
+from crawler import SnowballCrawler
+from candidates import CandidateSelector
+from thread_walker import walk_thread
+from journal import RunJournal
+from metrics import registry
 
 # --- CONFIGURAZIONE ---
 USERNAME = 'atlasover.bsky.social'
-with open('my_password.txt', 'r') as f:
-    PASSWORD = f.read().strip()
 
 # Query Iniziale (Il "Seme" della valanga)
 SEARCH_QUERY = 'venezuela' 
@@ -14,13 +15,41 @@ SEARCH_QUERY = 'venezuela'
 # LIMITI
 INITIAL_POSTS_LIMIT = 3   # Quanti post prendere dalla ricerca iniziale
 USER_POSTS_LIMIT = 3      # Quanti post top scaricare per ogni utente scoperto
-DELAY = 1.5                # Pausa anti-ban
 MIN_REPLIES = 5            # Abbassiamo un po' il filtro per catturare più utenti
+THREAD_DEPTH = 6       # Profondità di ogni get_post_thread (1 = solo risposte dirette)
+MAX_REPLY_DEPTH = 20   # Livello massimo di risposte-alle-risposte da seguire
+MAX_FANOUT = 500       # Massimo numero di risposte seguite per ogni post
 
-# --- LOGIN ---
-client = Client()
-client.login(USERNAME, PASSWORD)
-print(f"✅ Loggato come {USERNAME}")
+# CRAWL
+MAX_DEPTH = 2              # Livelli di espansione (1 = solo i commentatori dei post seme)
+MAX_NODES = 20000          # Budget di utenti sul dataset intero (anche tra una ripresa e l'altra)
+MAX_EDGES = 200000         # Budget di archi sul dataset intero
+MAX_WORKERS = 4            # Thread scaricati in parallelo
+REQUESTS_PER_SECOND = 5    # Budget globale di richieste al secondo
+UPDATE_MODE = False        # True: riprende il journal precedente e cerca post nuovi (archi deduplicati per reply_uri)
+
+# --- CACHE LOCALE ---
+CACHE_PATH = 'bsky_cache.sqlite'
+CACHE_TTL = 7 * 24 * 3600   # Validità delle risposte in cache (secondi)
+CACHE_MAX_MB = 500          # Dimensione massima del file di cache
+CACHE_ONLY = False          # True: serve solo dalla cache (per rifare i filtri senza usare quota API)
+
+# --- METRICHE ---
+METRICS_PATH = 'metrics_snowball.json'   # Riepilogo JSON a fine esecuzione
+PROMETHEUS_PATH = None      # es. 'metrics_snowball.prom': file Prometheus riscritto durante il crawl
+PROMETHEUS_INTERVAL = 30    # Secondi tra due aggiornamenti del file Prometheus
+
+# --- CLIENT ---
+# Il client vero nasce al primo uso: import di atproto e login con la sessione salvata in
+# bsky_session_<utente>.txt (la password serve solo se la sessione è scaduta).
+# Le risposte di get_post_thread / search_posts / get_author_feed passano dalla cache su disco;
+# le richieste reali (anche quelle dei rami riscaricati) seguono REQUESTS_PER_SECOND e la quota
+# del server (header ratelimit-*), con retry su 429/5xx
+# (in modalità aggiornamento le ricerche vanno sempre richieste al server)
+client = CachedClient(lazy_client(USERNAME, requests_per_second=REQUESTS_PER_SECOND), ResponseCache(CACHE_PATH, ttl=CACHE_TTL, max_mb=CACHE_MAX_MB, offline=CACHE_ONLY),
+                      refresh=('search_posts',) if UPDATE_MODE else ())
+if CACHE_ONLY:
+    print("🗄️ Modalità solo-cache: nessuna chiamata API")
 
 # --- FUNZIONI DI SUPPORTO ---
 def extract_text_content(post_record):
@@ -33,23 +62,32 @@ def extract_text_content(post_record):
                 full_text.append(f"[IMG: {img.alt}]")
     return " ".join(full_text)
 
+def reject(reason):
+    # Thread scartato: lo contiamo per motivo nelle metriche
+    registry.inc('threads_rejected', reason=reason)
+    return [], set(), {}, None
+
+@registry.timed('thread_processing')
 def process_single_thread(post_uri):
-    """Scarica un thread e restituisce archi e lista dei commentatori"""
+    """Scarica un thread e restituisce archi, commentatori, utenti e autore del post radice"""
     edges = []
     commenters = set()
     users_info = {}
 
+    from atproto import exceptions  # atproto si importa solo quando serve (vedi session.lazy_client)
+
     try:
-        thread_data = client.get_post_thread(uri=post_uri, depth=1)
-    except Exception:
-        return [], set(), {}
+        thread_data = client.get_post_thread(uri=post_uri, depth=THREAD_DEPTH, parent_height=0)
+    except exceptions.BadRequestError:
+        # Post cancellato o non trovato: inutile ritentare
+        return reject('non_trovato')
 
-    if not hasattr(thread_data.thread, 'post'): return [], set(), {}
-    if not hasattr(thread_data.thread, 'replies'): return [], set(), {}
+    if not hasattr(thread_data.thread, 'post'): return reject('non_trovato')
+    if not hasattr(thread_data.thread, 'replies'): return reject('senza_risposte')
 
     # Filtro rapido: se ha poche risposte, ignoriamo
     if len(thread_data.thread.replies) < MIN_REPLIES:
-        return [], set(), {}
+        return reject('poche_risposte')
 
     original_post = thread_data.thread.post
     target_handle = original_post.author.handle.replace('.bsky.social', '')
@@ -58,36 +96,105 @@ def process_single_thread(post_uri):
     if hasattr(original_post, 'record'):
         magnet_text = extract_text_content(original_post.record)
     
-    if not magnet_text.strip(): return [], set(), {}
+    if not magnet_text.strip(): return reject('testo_vuoto')
 
     # Salviamo il target
     users_info[target_handle] = {'type': 'target'}
 
-    for reply in thread_data.thread.replies:
-        if hasattr(reply, 'post'):
-            source_handle = reply.post.author.handle.replace('.bsky.social', '')
-            
-            reply_text = ""
-            if hasattr(reply.post, 'record'):
-                reply_text = extract_text_content(reply.post.record)
-            
-            edge_attr = {
-                'trigger_text': magnet_text,
-                'reply_content': reply_text
-            }
-            edges.append((source_handle, target_handle, edge_attr))
-            
-            # Aggiungiamo il commentatore alla lista "da espandere"
-            commenters.add(source_handle)
-            users_info[source_handle] = {'type': 'commenter'}
-
-    return edges, commenters, users_info
+    # Seguiamo anche le risposte alle risposte (arco verso l'autore del post genitore)
+    replies = walk_thread(client, thread_data.thread, depth=THREAD_DEPTH,
+                          max_depth=MAX_REPLY_DEPTH, max_fanout=MAX_FANOUT)
+    for reply, parent_post, level in replies:
+        source_handle = reply.post.author.handle.replace('.bsky.social', '')
+        parent_handle = parent_post.author.handle.replace('.bsky.social', '')
+
+        parent_text = magnet_text
+        if parent_post is not original_post and hasattr(parent_post, 'record'):
+            parent_text = extract_text_content(parent_post.record)
+        
+        reply_text = ""
+        if hasattr(reply.post, 'record'):
+            reply_text = extract_text_content(reply.post.record)
+        
+        edge_attr = {
+            'trigger_uri': parent_post.uri,
+            'trigger_text': parent_text,
+            'reply_uri': reply.post.uri,
+            'reply_content': reply_text,
+            'root_uri': original_post.uri,
+            'depth': level
+        }
+        edges.append((source_handle, parent_handle, edge_attr))
+        
+        # Aggiungiamo il commentatore alla lista "da espandere"
+        commenters.add(source_handle)
+        users_info[source_handle] = {'type': 'commenter'}
+
+    return edges, commenters, users_info, target_handle
+
+# Pre-filtro sui metadati dei risultati di ricerca (reply_count, testo) prima di scaricare i thread
+selector = CandidateSelector(extract_text_content, min_replies=MIN_REPLIES)
+
+def find_user_posts(user_handle):
+    """Restituisce gli URI dei top post di un utente (per l'espansione a valanga)"""
+    # Trucco: Cerchiamo "from:utente" ordinato per "top"
+    # Ricostruiamo l'handle completo se necessario
+    full_handle = user_handle if '.' in user_handle else f"{user_handle}.bsky.social"
+
+    user_search = client.app.bsky.feed.search_posts(
+        params={
+            'q': f'from:{full_handle}', 
+            'limit': USER_POSTS_LIMIT, 
+            'sort': 'top'
+        }
+    )
+    return [post.uri for post in selector.select(user_search.posts, sort=True)]
 
 # --- MAIN LOOP A DUE FASI ---
 if __name__ == "__main__":
-    all_edges = []
-    all_users_data = {}
-    users_to_expand = set() # Qui raccoglieremo chi commenta
+    # Import pesanti (tqdm, pandas, networkx) solo per la raccolta vera e propria
+    from tqdm import tqdm
+    from columnar import carry_node_columns, save_columnar_stream, snapshot_nodes
+    from gexf import write_gexf
+
+    # Ogni thread va subito su disco nel journal: in memoria restano solo la frontiera
+    # e gli insiemi di utenti/URI già visti, non gli archi
+    journal = RunJournal("journal_snowball.jsonl", config={
+        'query': SEARCH_QUERY,
+        'initial_posts_limit': INITIAL_POSTS_LIMIT,
+        'user_posts_limit': USER_POSTS_LIMIT,
+        'min_replies': MIN_REPLIES,
+        'max_depth': MAX_DEPTH,
+        # Forma del thread scaricato: cambiarla non deve mescolare due grafi nello stesso journal
+        'thread_depth': THREAD_DEPTH,
+        'max_reply_depth': MAX_REPLY_DEPTH,
+        'max_fanout': MAX_FANOUT,
+    })
+
+    def collect(uri, edges, users_info, **extra):
+        # extra (livello e autore) finisce nel journal: serve a ripristinare il crawler
+        if not journal.is_done(uri):
+            journal.record_thread(uri, edges, users_info, **extra)
+            registry.inc('edges', len(edges))
+
+    if PROMETHEUS_PATH:
+        registry.start_exporter(PROMETHEUS_PATH, PROMETHEUS_INTERVAL)
+
+    crawler = SnowballCrawler(
+        process_single_thread, find_user_posts, on_thread=collect, on_expand=journal.record_user,
+        max_depth=MAX_DEPTH, max_nodes=MAX_NODES, max_edges=MAX_EDGES,
+        max_workers=MAX_WORKERS, requests_per_second=0,   # Il budget è nel client, per richiesta
+    )
+
+    # Ripresa: frontiera, thread visitati e budget tornano dal journal, senza riscaricare nulla.
+    # In aggiornamento tutti gli utenti tornano in frontiera per cercare i loro post nuovi
+    # (MAX_NODES / MAX_EDGES valgono per tutto il dataset: vanno alzati per farlo crescere)
+    if journal.done_uris:
+        crawler.restore(((rec['uri'], rec['edges'], rec['users'], rec.get('depth', 0), rec.get('author'))
+                         for rec in journal.iter_thread_records()),
+                        expanded=None if UPDATE_MODE else journal.expanded_users)
+        print(f"♻️ Crawler ripristinato: {len(crawler.visited_uris)} thread, {len(crawler.nodes)} utenti, "
+              f"{len(crawler.frontier)} voci in frontiera")
 
     print(f"🚀 FASE 1: Ricerca iniziale per '{SEARCH_QUERY}'...")
     
@@ -97,64 +204,53 @@ if __name__ == "__main__":
     )
     
     print(f"   Trovati {len(search_res.posts)} post seme. Analisi thread...")
+    # Prima i semi con più risposte: a budget esaurito restano fuori i thread più piccoli
+    seeds = selector.select(search_res.posts, sort=True)
+    crawler.process_uris([post.uri for post in seeds], depth=0)
 
-    for post in tqdm(search_res.posts):
-        edges, new_commenters, u_info = process_single_thread(post.uri)
-        
-        all_edges.extend(edges)
-        all_users_data.update(u_info)
-        users_to_expand.update(new_commenters) # Salviamo i colpevoli!
-        
-        time.sleep(DELAY)
-
-    print(f"\n📊 Fine Fase 1. Archi trovati: {len(all_edges)}")
-    print(f"👥 Utenti scoperti da analizzare: {len(users_to_expand)}")
+    print(f"\n📊 Fine Fase 1. Archi trovati: {crawler.n_edges}")
+    print(f"👥 Utenti scoperti da analizzare: {len(crawler.seen_count)}")
     
-    # Rimuoviamo dalla lista di espansione chi abbiamo già analizzato (autori dei post iniziali)
-    # per evitare loop infiniti o ridondanze
-    already_processed = set([edge[1] for edge in all_edges]) # I target della fase 1
-    users_to_expand = users_to_expand - already_processed
-    
-    print(f"🚀 FASE 2: Espansione a Valanga su {len(users_to_expand)} utenti...")
+    print(f"🚀 FASE 2: Espansione a Valanga (fino a {MAX_DEPTH} livelli, max {MAX_NODES} nodi / {MAX_EDGES} archi)...")
     print(f"   (Scaricheremo i Top {USER_POSTS_LIMIT} post per ognuno di loro)")
 
-    # 2. ESPANSIONE RICORSIVA (SOLO 1 LIVELLO PER ORA)
-    for user_handle in tqdm(list(users_to_expand)):
-        try:
-            # Trucco: Cerchiamo "from:utente" ordinato per "top"
-            # Ricostruiamo l'handle completo se necessario
-            full_handle = user_handle if '.' in user_handle else f"{user_handle}.bsky.social"
-            
-            user_search = client.app.bsky.feed.search_posts(
-                params={
-                    'q': f'from:{full_handle}', 
-                    'limit': USER_POSTS_LIMIT, 
-                    'sort': 'top'
-                }
-            )
-            
-            if not user_search.posts:
-                continue
-
-            # Processiamo i top post di questo utente
-            for user_post in user_search.posts:
-                edges, _, u_info = process_single_thread(user_post.uri)
-                if edges:
-                    all_edges.extend(edges)
-                    all_users_data.update(u_info)
-                time.sleep(DELAY) # Importante!
-                
-        except Exception as e:
-            # Se l'utente non esiste o è bloccato, andiamo avanti
-            continue
+    # 2. ESPANSIONE MULTI-LIVELLO: prima gli utenti che commentano più spesso
+    with tqdm(unit=" utenti") as bar:
+        def progress(c):
+            bar.update(1)
+            bar.set_postfix(nodi=len(c.nodes), archi=c.n_edges, frontiera=len(c.frontier))
+        crawler.run(progress=progress)
+
+    selector.report()
 
     # --- SALVATAGGIO ---
     print(f"\n✅ RACCOLTA COMPLETATA!")
-    print(f"   Totale Archi: {len(all_edges)}")
-    print(f"   Totale Nodi coinvolti: {len(all_users_data)}")
-
-    if all_edges:
-        G = nx.DiGraph()
-        G.add_edges_from(all_edges)
-        nx.write_gexf(G, "dataset_snowball.gexf")
-        print("💾 File 'dataset_snowball.gexf' salvato.")
\ No newline at end of file
+    print(f"   Totale Archi: {crawler.n_edges}")
+    print(f"   Totale Nodi coinvolti: {len(crawler.nodes)}")
+    print(f"   Utenti espansi: {len(crawler.expanded)}, thread visitati: {len(crawler.visited_uris)}")
+    if crawler.failed_uris:
+        print(f"   ❌ Thread non scaricati dopo i retry: {len(crawler.failed_uris)}")
+
+    # Dataset a colonne e GEXF scritti in streaming dal journal
+    previous = snapshot_nodes("dataset_snowball.cols") if UPDATE_MODE else None
+    with registry.stage('serialization'):
+        meta = save_columnar_stream(journal.iter_threads, "dataset_snowball.cols")
+    journal.close()
+    if previous:
+        kept = carry_node_columns("dataset_snowball.cols", previous)
+        print(f"♻️ Attributi mantenuti per {kept} utenti già presenti nel dataset")
+    if meta['n_edges']:
+        # Come un DiGraph: un solo arco per coppia di utenti
+        with registry.stage('serialization'):
+            write_gexf("dataset_snowball.cols", "dataset_snowball.gexf", multigraph=False)
+        print("💾 File 'dataset_snowball.cols' e 'dataset_snowball.gexf' salvati.")
+
+    client.cache.report()
+
+    # --- METRICHE ---
+    registry.set('cache_hits', client.cache.hits)
+    registry.set('cache_misses', client.cache.misses)
+    registry.stop_exporter()
+    registry.save_json(METRICS_PATH, query=SEARCH_QUERY)
+    registry.report()
+    print(f"📈 Metriche salvate in {METRICS_PATH}")
@@ -1,13 +1,13 @@
-import time
-import networkx as nx
-from atproto import Client, exceptions
-from tqdm import tqdm
+from cache import CachedClient, ResponseCache
+from session import lazy_client
+from fetcher import fetch_all
+from thread_walker import walk_thread
+from journal import RunJournal, normalize_time
+from candidates import CandidateSelector
+from metrics import registry
 
 # --- CONFIGURAZIONE ---
 USERNAME = 'lorenzouni.bsky.social'
-# Legge la password dal file
-with open('my_password.txt', 'r') as f:
-    PASSWORD = f.read().strip()
 
 # ==========================================
 #      CONFIGURAZIONE RICERCA
@@ -28,14 +28,38 @@ POSTS_PER_TOPIC = 100
 # (Opzionale) Se vuoi tornare a USER mode:
 # TARGET_USERS = ['theonion.com', 'nytimes.com', 'stephenking.bsky.social']
 
-DELAY = 1.5            # Secondi di pausa tra le richieste dei thread
+MAX_WORKERS = 4        # Thread scaricati in parallelo
+REQUESTS_PER_SECOND = 5 # Budget globale di richieste al secondo (condiviso dai worker)
 MIN_CHARS = 30         # Lunghezza minima testo
 MIN_REPLIES = 10       # Numero minimo di risposte (ridotto per avere più dati)
-
-# --- 1. LOGIN ---
-client = Client()
-client.login(USERNAME, PASSWORD)
-print(f"✅ Loggato come {USERNAME}")
+THREAD_DEPTH = 6       # Profondità di ogni get_post_thread (1 = solo risposte dirette)
+MAX_REPLY_DEPTH = 20   # Livello massimo di risposte-alle-risposte da seguire
+MAX_FANOUT = 500       # Massimo numero di risposte seguite per ogni post
+EXPORT_GEXF = True     # Esporta anche in GEXF (per Gephi), oltre al formato a colonne
+UPDATE_MODE = False    # True: aggiorna il dataset esistente scaricando solo i post nuovi di ogni target
+
+# --- CACHE LOCALE ---
+CACHE_PATH = 'bsky_cache.sqlite'
+CACHE_TTL = 7 * 24 * 3600   # Validità delle risposte in cache (secondi)
+CACHE_MAX_MB = 500          # Dimensione massima del file di cache
+CACHE_ONLY = False          # True: serve solo dalla cache (per rifare i filtri senza usare quota API)
+
+# --- METRICHE ---
+METRICS_PATH = f"metrics_{SEARCH_MODE.lower()}.json"   # Riepilogo JSON a fine esecuzione
+PROMETHEUS_PATH = None      # es. 'metrics_hashtag.prom': file Prometheus riscritto durante la raccolta
+PROMETHEUS_INTERVAL = 30    # Secondi tra due aggiornamenti del file Prometheus
+
+# --- 1. CLIENT ---
+# Il client vero nasce al primo uso: import di atproto e login con la sessione salvata in
+# bsky_session_<utente>.txt (la password serve solo se la sessione è scaduta).
+# Le risposte di get_post_thread / search_posts / get_author_feed passano dalla cache su disco;
+# le richieste reali (anche quelle dei rami riscaricati) seguono REQUESTS_PER_SECOND e la quota
+# del server (header ratelimit-*), con retry su 429/5xx
+# (in modalità aggiornamento le liste di post vanno sempre richieste al server)
+client = CachedClient(lazy_client(USERNAME, requests_per_second=REQUESTS_PER_SECOND), ResponseCache(CACHE_PATH, ttl=CACHE_TTL, max_mb=CACHE_MAX_MB, offline=CACHE_ONLY),
+                      refresh=('search_posts', 'get_author_feed') if UPDATE_MODE else ())
+if CACHE_ONLY:
+    print("🗄️ Modalità solo-cache: nessuna chiamata API")
 
 # --- FUNZIONI DI SUPPORTO ---
 def extract_text_content(post_record):
@@ -49,19 +73,37 @@ def extract_text_content(post_record):
                     full_text.append(f"[IMG: {img.alt}]")
     return " ".join(full_text)
 
+def feed_time(item):
+    # Istante dell'elemento nel feed: per un repost conta quando è stato ripostato,
+    # per un post fissato (in cima al feed qualunque sia la data) None.
+    # In forma canonica (normalize_time): si confronta come stringa con state['since']
+    reason = getattr(item, 'reason', None)
+    if reason is None:
+        return normalize_time(item.post.indexed_at)
+    return normalize_time(getattr(reason, 'indexed_at', None))
+
+def reject(reason):
+    # Thread scartato: lo contiamo per motivo nelle metriche
+    registry.inc('threads_rejected', reason=reason)
+    return [], {}
+
+@registry.timed('thread_processing')
 def get_thread_data(post_uri, min_chars=MIN_CHARS):
+    from atproto import exceptions  # atproto si importa solo quando serve (vedi session.lazy_client)
+
     try:
-        thread_data = client.get_post_thread(uri=post_uri, depth=1)
-    except Exception as e:
-        return [], {}
+        thread_data = client.get_post_thread(uri=post_uri, depth=THREAD_DEPTH, parent_height=0)
+    except exceptions.BadRequestError:
+        # Post cancellato o non trovato: inutile ritentare
+        return reject('non_trovato')
 
     # Controlli di esistenza
-    if not hasattr(thread_data.thread, 'post'): return [], {}
-    if not hasattr(thread_data.thread, 'replies') or not thread_data.thread.replies: return [], {}
+    if not hasattr(thread_data.thread, 'post'): return reject('non_trovato')
+    if not hasattr(thread_data.thread, 'replies') or not thread_data.thread.replies: return reject('senza_risposte')
 
     # FILTRO: NUMERO MINIMO DI RISPOSTE
     if len(thread_data.thread.replies) < MIN_REPLIES:
-        return [], {}
+        return reject('poche_risposte')
 
     original_post = thread_data.thread.post
     target_handle = original_post.author.handle.replace('.bsky.social', '')
@@ -71,8 +113,8 @@ def get_thread_data(post_uri, min_chars=MIN_CHARS):
         magnet_text = extract_text_content(original_post.record)
 
     # Filtri sul contenuto del Magnete
-    if not magnet_text.strip(): return [], {}
-    if len(magnet_text) < min_chars: return [], {}
+    if not magnet_text.strip(): return reject('testo_vuoto')
+    if len(magnet_text) < min_chars: return reject('testo_corto')
 
     edges = []
     users = {}
@@ -80,45 +122,58 @@ def get_thread_data(post_uri, min_chars=MIN_CHARS):
     # Inizializziamo l'autore del post
     users[target_handle] = {'followers': 0, 'posts': 0}
 
-    # Raccogliamo tutte le risposte
-    for reply in thread_data.thread.replies:
-        if hasattr(reply, 'post'):
-            source_handle = reply.post.author.handle.replace('.bsky.social', '')
-
-            reply_text = ""
-            timestamp = None
-            like_count = 0
-            repost_count = 0
-
-            if hasattr(reply.post, 'record'):
-                reply_text = extract_text_content(reply.post.record)
-                # Timestamp del post
-                if hasattr(reply.post.record, 'created_at'):
-                    timestamp = reply.post.record.created_at
-
-            # Metriche di engagement
-            if hasattr(reply.post, 'like_count'):
-                like_count = reply.post.like_count or 0
-            if hasattr(reply.post, 'repost_count'):
-                repost_count = reply.post.repost_count or 0
-
-            # Arco di risposta con metadati arricchiti
-            edge_attr = {
-                'trigger_text': magnet_text,
-                'reply_content': reply_text,
-                'timestamp': timestamp,
-                'like_count': like_count,
-                'repost_count': repost_count
-            }
-            edges.append((source_handle, target_handle, edge_attr))
-            users[source_handle] = {'followers': 0, 'posts': 0}
+    # Raccogliamo tutte le risposte, anche quelle alle risposte:
+    # ogni arco va da chi risponde all'autore del post a cui risponde direttamente
+    replies = walk_thread(client, thread_data.thread, depth=THREAD_DEPTH,
+                          max_depth=MAX_REPLY_DEPTH, max_fanout=MAX_FANOUT)
+    for reply, parent_post, level in replies:
+        source_handle = reply.post.author.handle.replace('.bsky.social', '')
+        parent_handle = parent_post.author.handle.replace('.bsky.social', '')
+
+        parent_text = magnet_text
+        if parent_post is not original_post and hasattr(parent_post, 'record'):
+            parent_text = extract_text_content(parent_post.record)
+
+        reply_text = ""
+        timestamp = None
+        like_count = 0
+        repost_count = 0
+
+        if hasattr(reply.post, 'record'):
+            reply_text = extract_text_content(reply.post.record)
+            # Timestamp del post
+            if hasattr(reply.post.record, 'created_at'):
+                timestamp = reply.post.record.created_at
+
+        # Metriche di engagement
+        if hasattr(reply.post, 'like_count'):
+            like_count = reply.post.like_count or 0
+        if hasattr(reply.post, 'repost_count'):
+            repost_count = reply.post.repost_count or 0
+
+        # Arco di risposta con metadati arricchiti
+        edge_attr = {
+            'trigger_uri': parent_post.uri,
+            'trigger_text': parent_text,
+            'reply_uri': reply.post.uri,
+            'reply_content': reply_text,
+            'root_uri': original_post.uri,
+            'depth': level,
+            'timestamp': timestamp,
+            'like_count': like_count,
+            'repost_count': repost_count
+        }
+        edges.append((source_handle, parent_handle, edge_attr))
+        users[source_handle] = {'followers': 0, 'posts': 0}
 
     return edges, users
 
 # --- 3. MAIN LOOP (CON PAGINAZIONE UNIVERSALE) ---
 if __name__ == "__main__":
-    all_edges = []
-    all_users = {}
+    # Import pesanti (tqdm, pandas, networkx) solo per la raccolta vera e propria
+    from tqdm import tqdm
+    from columnar import carry_node_columns, save_columnar_stream, snapshot_nodes
+    from gexf import write_gexf
 
     print(f"🚀 Inizio raccolta dati in modalità: {SEARCH_MODE}")
     print(f"🎯 Obiettivo: {POSTS_PER_TOPIC} post per target")
@@ -134,19 +189,51 @@ if __name__ == "__main__":
             print("❌ Errore: TARGET_USERS non definito. Usa HASHTAG mode o definisci TARGET_USERS.")
             exit(1)
 
+    # Journal su disco: dopo un crash basta rilanciare con la stessa configurazione
+    journal = RunJournal(f"journal_{SEARCH_MODE.lower()}.jsonl", config={
+        'mode': SEARCH_MODE,
+        'targets': targets,
+        'posts_per_topic': POSTS_PER_TOPIC,
+        'min_chars': MIN_CHARS,
+        'min_replies': MIN_REPLIES,
+        # Forma del thread scaricato: cambiarla non deve mescolare due grafi nello stesso journal
+        'thread_depth': THREAD_DEPTH,
+        'max_reply_depth': MAX_REPLY_DEPTH,
+        'max_fanout': MAX_FANOUT,
+    })
+    if UPDATE_MODE and journal.completed():
+        # Stesso journal della raccolta precedente: solo post più recenti dell'ultimo visto per target
+        journal.start_update()
+        print("🔄 Aggiornamento incrementale: si scaricano solo i post nuovi")
+
+    if PROMETHEUS_PATH:
+        registry.start_exporter(PROMETHEUS_PATH, PROMETHEUS_INTERVAL)
+
+    # Pre-filtro sui metadati già presenti nei risultati di ricerca + dedup degli URI tra i target
+    selector = CandidateSelector(extract_text_content, min_replies=MIN_REPLIES, min_chars=MIN_CHARS)
+    for state in journal.targets.values():
+        selector.mark_seen(state['uris'])
+
     for target in targets:
         print(f"\n🔍 Ricerca target: {target}")
-        posts_to_process = []
-        cursor = None
+        # URI dei post da elaborare (ripresi dal journal se la raccolta era stata interrotta)
+        state = journal.target_state(target)
+        posts_to_process = list(state['uris'])
+        n_fetched = state['fetched']   # Post restituiti dall'API, prima del pre-filtro
+        cursor = state['cursor']
+        completed = state['done'] or bool(n_fetched and not cursor)
+        if n_fetched:
+            print(f"   ♻️ Ripresi {len(posts_to_process)} post dal journal")
 
         # --- BLOCCO DI RECUPERO LISTA POST (PAGINAZIONE) ---
-        while len(posts_to_process) < POSTS_PER_TOPIC:
+        while not completed and n_fetched < POSTS_PER_TOPIC:
             try:
                 # Calcoliamo quanti post chiedere in questo giro (max 100)
-                remaining = POSTS_PER_TOPIC - len(posts_to_process)
+                remaining = POSTS_PER_TOPIC - n_fetched
                 current_limit = min(100, remaining)
                 
                 fetched_batch = []
+                batch_times = []   # Istanti dei post nel risultato (per 'newest')
                 next_cursor = None
 
                 # --- RAMO A: HASHTAG ---
@@ -157,10 +244,12 @@ if __name__ == "__main__":
                             'limit': current_limit, 
                             'sort': 'top', 
                             'lang': 'en',
-                            'cursor': cursor
+                            'cursor': cursor,
+                            'since': state['since']  # Modalità aggiornamento: solo post nuovi
                         }
                     )
                     fetched_batch = search_res.posts
+                    batch_times = [normalize_time(post.indexed_at) for post in fetched_batch]
                     next_cursor = getattr(search_res, 'cursor', None)
 
                 # --- RAMO B: USER ---
@@ -172,59 +261,115 @@ if __name__ == "__main__":
                         cursor=cursor
                     )
                     fetched_batch = [item.post for item in feed_res.feed]
+                    batch_times = [feed_time(item) for item in feed_res.feed]
                     next_cursor = getattr(feed_res, 'cursor', None)
+                    if state['since']:
+                        # Il feed è cronologico per feed_time (i post fissati non contano): teniamo
+                        # solo gli elementi successivi alla raccolta precedente e smettiamo di
+                        # paginare quando tutta la pagina è più vecchia
+                        newer = [ts is not None and ts > state['since'] for ts in batch_times]
+                        if not any(newer):
+                            next_cursor = None
+                        fetched_batch = [post for post, keep in zip(fetched_batch, newer) if keep]
+                        batch_times = [ts for ts, keep in zip(batch_times, newer) if keep]
 
                 # Aggiungiamo i risultati alla lista principale
                 if not fetched_batch:
                     print("   ⚠️ Nessun altro post trovato nel feed.")
+                    completed = True
                     break
                 
-                posts_to_process.extend(fetched_batch)
-                print(f"   📥 Scaricati {len(fetched_batch)} post (Totale: {len(posts_to_process)}/{POSTS_PER_TOPIC})")
+                # Teniamo solo i post che possono superare i filtri e non ancora visti,
+                # prima quelli con più risposte (se la raccolta si interrompe restano i thread più utili)
+                candidates = selector.select(fetched_batch, sort=True)
+                batch_uris = [post.uri for post in candidates]
+                n_fetched += len(fetched_batch)
+                posts_to_process.extend(batch_uris)
+                newest = max(filter(None, batch_times), default=None)
+                journal.record_page(target, batch_uris, next_cursor, fetched=len(fetched_batch), newest=newest)
+                print(f"   📥 Scaricati {len(fetched_batch)} post, {len(candidates)} selezionati "
+                      f"(Totale: {n_fetched}/{POSTS_PER_TOPIC})")
 
                 # Se non c'è una pagina successiva, ci fermiamo
                 if not next_cursor:
+                    completed = True
                     break
                 
                 cursor = next_cursor
-                time.sleep(0.5) # Piccola pausa tra le pagine del feed
 
             except Exception as e:
                 print(f"❌ Errore durante il fetch della lista post: {e}")
                 break
-        
-        # --- BLOCCO DI SCARICO DISCUSSIONI ---
-        print(f"   ⚙️ Inizio scaricamento thread per {len(posts_to_process)} post...")
 
-        for post in tqdm(posts_to_process):
-            edges, users = get_thread_data(post.uri, min_chars=MIN_CHARS)
+        if not state['done'] and (completed or n_fetched >= POSTS_PER_TOPIC):
+            journal.record_target_done(target)
 
-            if edges:  # Se abbiamo trovato dati validi
-                all_edges.extend(edges)
-                all_users.update(users)
-
-            time.sleep(DELAY) 
+        # --- BLOCCO DI SCARICO DISCUSSIONI ---
+        uris = [uri for uri in posts_to_process if not journal.is_done(uri)]
+        print(f"   ⚙️ Inizio scaricamento thread per {len(uris)} post "
+              f"({len(posts_to_process) - len(uris)} già presenti nel journal)...")
+
+        # Download concorrente: i risultati arrivano nello stesso ordine dei post,
+        # i thread falliti (dopo i retry del client) vengono ritentati senza cambiare l'ordine
+        results = fetch_all(get_thread_data, uris,
+                            max_workers=MAX_WORKERS,
+                            requests_per_second=0)   # Il budget è nel client, per richiesta
+
+        # Ogni thread viene scritto nel journal appena scaricato (anche se scartato dai filtri)
+        failed = 0
+        for uri, result in tqdm(results, total=len(uris)):
+            if isinstance(result, Exception):
+                # Non lo registriamo nel journal: verrà ritentato alla prossima esecuzione
+                failed += 1
+                registry.inc('threads_failed')
+                continue
+            edges, users = result
+            journal.record_thread(uri, edges, users)
+            registry.inc('edges', len(edges))
+        if failed:
+            print(f"   ❌ {failed} thread non scaricati (verranno ritentati rilanciando lo script)")
+
+    selector.report()
+
+    # --- 4. SALVATAGGIO (in streaming dal journal) ---
+    # Il journal è già il "sink" degli archi: il dataset a colonne viene scritto a blocchi
+    # rileggendolo due volte, senza mai tenere tutti gli archi in memoria
+    # (archi deduplicati per reply_uri, quindi le risposte già raccolte non si ripetono)
+    columns_path = f"dataset_{SEARCH_MODE.lower()}.cols"
+    previous = snapshot_nodes(columns_path) if UPDATE_MODE else None
+    with registry.stage('serialization'):
+        meta = save_columnar_stream(journal.iter_threads, columns_path)
+    journal.close()
+    if previous:
+        # Profili e metriche già calcolati restano sugli utenti già presenti
+        kept = carry_node_columns(columns_path, previous)
+        print(f"♻️ Attributi mantenuti per {kept} utenti già presenti nel dataset")
 
-    # --- 4. SALVATAGGIO ---
     print(f"\n📊 Statistiche Finali:")
-    print(f"   Nodi unici: {len(all_users)}")
-    print(f"   Archi (Risposte): {len(all_edges)}")
-
-    if all_edges:
-        # Usa MultiDiGraph per permettere archi multipli tra stessi nodi
-        # (stesso utente può rispondere più volte allo stesso autore)
-        G = nx.MultiDiGraph()
-        G.add_edges_from(all_edges)
-
-        # Aggiungi attributi ai nodi
-        for node_id in G.nodes():
-            if node_id in all_users:
-                G.nodes[node_id]['followers'] = all_users[node_id]['followers']
-                G.nodes[node_id]['posts'] = all_users[node_id]['posts']
-
-        filename = f"dataset_{SEARCH_MODE.lower()}.gexf"
-        nx.write_gexf(G, filename)
-        print(f"✅ Salvato tutto in {filename}")
+    print(f"   Nodi unici: {meta['n_nodes']}")
+    print(f"   Post unici: {meta['n_posts']}")
+    print(f"   Archi (Risposte): {meta['n_edges']}")
+
+    if meta['n_edges']:
+        print(f"✅ Salvato tutto in {columns_path}")
+
+        if EXPORT_GEXF:
+            # MultiDiGraph: archi multipli tra stessi nodi (stesso utente può rispondere
+            # più volte allo stesso autore); per Gephi i testi tornano sugli archi
+            filename = f"dataset_{SEARCH_MODE.lower()}.gexf"
+            with registry.stage('serialization'):
+                write_gexf(columns_path, filename, multigraph=True)
+            print(f"✅ Esportato anche in {filename} (Gephi)")
         print(f"💡 Grafo pronto per analisi sentiment/centralità!")
     else:
-        print("⚠️ Nessun dato raccolto. Forse i filtri sono troppo stretti (MIN_REPLIES o MIN_CHARS)?")
\ No newline at end of file
+        print("⚠️ Nessun dato raccolto. Forse i filtri sono troppo stretti (MIN_REPLIES o MIN_CHARS)?")
+
+    client.cache.report()
+
+    # --- 5. METRICHE ---
+    registry.set('cache_hits', client.cache.hits)
+    registry.set('cache_misses', client.cache.misses)
+    registry.stop_exporter()
+    registry.save_json(METRICS_PATH, mode=SEARCH_MODE, targets=targets)
+    registry.report()
+    print(f"📈 Metriche salvate in {METRICS_PATH}")
@@ -0,0 +1,123 @@
+import hashlib
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from columnar import load_columns, save_columns
+
+# --- CONFIGURAZIONE ---
+INPUT_PATH = 'dataset_hashtag.cols'          # Dataset a colonne da annotare
+SENTIMENT_CACHE_PATH = 'sentiment_cache.sqlite'
+WORKERS = os.cpu_count() or 1                # Processi per il calcolo VADER
+CHUNK_SIZE = 2000                            # Testi per ogni blocco inviato a un processo
+
+_analyzer = None
+
+
+# --- CALCOLO (nei processi worker) ---
+def _init_worker():
+    global _analyzer
+    from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+    _analyzer = SentimentIntensityAnalyzer()
+
+
+def _score_chunk(texts):
+    if _analyzer is None:
+        _init_worker()
+    # Un testo vuoto ('', es. un post con sola immagine) esiste ed è neutro: VADER darebbe 0.0
+    return [float(_analyzer.polarity_scores(text)['compound']) if text else 0.0 for text in texts]
+
+
+# --- CACHE PERSISTENTE (hash del testo -> compound) ---
+def text_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class SentimentCache:
+    def __init__(self, path=SENTIMENT_CACHE_PATH):
+        self._db = sqlite3.connect(path)
+        self._db.execute('CREATE TABLE IF NOT EXISTS scores (hash TEXT PRIMARY KEY, compound REAL)')
+        self._db.commit()
+
+    def get_many(self, hashes):
+        found = {}
+        for i in range(0, len(hashes), 900):   # Limite di parametri di SQLite
+            batch = hashes[i:i + 900]
+            query = f"SELECT hash, compound FROM scores WHERE hash IN ({','.join('?' * len(batch))})"
+            found.update(self._db.execute(query, batch).fetchall())
+        return found
+
+    def put_many(self, items):
+        self._db.executemany('INSERT OR REPLACE INTO scores (hash, compound) VALUES (?, ?)', items)
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+
+def score_texts(texts, cache_path=SENTIMENT_CACHE_PATH, workers=WORKERS, chunk_size=CHUNK_SIZE):
+    """Restituisce un array di compound VADER allineato a texts.
+    Ogni testo unico viene calcolato una volta sola; quelli già in cache non vengono ricalcolati,
+    gli altri vengono divisi in blocchi e distribuiti su un pool di processi.
+    I testi mancanti (None, o NaN in una colonna pandas: tutto ciò che non è una stringa)
+    restano NaN, come in score_columnar; '' è un testo vuoto e vale 0.0."""
+    texts = [t if isinstance(t, str) else None for t in texts]
+    unique = list(dict.fromkeys(t for t in texts if t is not None))
+    hashes = [text_hash(t) for t in unique]
+
+    cache = SentimentCache(cache_path)
+    scores = cache.get_many(hashes)
+    todo = [(h, t) for h, t in zip(hashes, unique) if h not in scores]
+    print(f"🧠 Sentiment: {len(unique)} testi unici, {len(unique) - len(todo)} già in cache, {len(todo)} da calcolare")
+
+    if todo:
+        from tqdm import tqdm
+        chunks = [todo[i:i + chunk_size] for i in range(0, len(todo), chunk_size)]
+        if workers > 1 and len(chunks) > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                results = pool.map(_score_chunk, [[t for _, t in chunk] for chunk in chunks])
+                for chunk, values in tqdm(zip(chunks, results), total=len(chunks), desc="Sentiment"):
+                    computed = list(zip((h for h, _ in chunk), values))
+                    cache.put_many(computed)
+                    scores.update(computed)
+        else:
+            for chunk in tqdm(chunks, desc="Sentiment"):
+                computed = list(zip((h for h, _ in chunk), _score_chunk([t for _, t in chunk])))
+                cache.put_many(computed)
+                scores.update(computed)
+    cache.close()
+
+    by_text = {t: scores[h] for h, t in zip(hashes, unique)}
+    by_text[None] = np.nan
+    return np.array([by_text[t] for t in texts], dtype=np.float64)
+
+
+def add_sentiment_columns(df, columns=None, **kwargs):
+    """Aggiunge al DataFrame una colonna di sentiment per ogni colonna di testo
+    (di default Magnete -> sentiment_magnete, Reazione -> sentiment_reazione)."""
+    columns = columns or {'Magnete': 'sentiment_magnete', 'Reazione': 'sentiment_reazione'}
+    for text_col, score_col in columns.items():
+        df[score_col] = score_texts(df[text_col].tolist(), **kwargs)
+    return df
+
+
+def score_columnar(path, **kwargs):
+    """Annota un dataset a colonne: il sentiment si calcola una volta per post (posts.sentiment)
+    e si propaga agli archi con una sola indicizzazione NumPy."""
+    cols = load_columns(path, prefix='posts.text')
+    post_scores = score_texts(cols['posts.text'].tolist(), **kwargs)
+    save_columns(path, 'posts', {'sentiment': post_scores})
+
+    edges = load_columns(path, mmap=True, names=('edges.trigger', 'edges.reply'))
+    padded = np.append(post_scores, np.nan)   # indice -1 (post mancante) -> NaN, non un neutro 0.0
+    save_columns(path, 'edges', {
+        'sentiment_magnete': padded[edges['edges.trigger']],
+        'sentiment_reazione': padded[edges['edges.reply']],
+    })
+
+
+if __name__ == "__main__":
+    score_columnar(INPUT_PATH)
+    print(f"✅ Colonne sentiment_magnete / sentiment_reazione scritte in {INPUT_PATH}")
@@ -0,0 +1,79 @@
+import os
+import threading
+
+from metrics import registry
+
+# --- CONFIGURAZIONE DI DEFAULT ---
+PASSWORD_PATH = 'my_password.txt'
+# Sessione esportata (contiene i token: non va condivisa né messa sotto git)
+SESSION_PATH = 'bsky_session_{username}.txt'
+
+
+def _save_session(path, session_string):
+    # File leggibile solo dal proprietario, scritto in modo atomico
+    # (file temporaneo per processo: due processi che salvano insieme non si pestano i piedi)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(session_string)
+    os.replace(tmp, path)
+
+
+def login(client, username, password_path=PASSWORD_PATH, session_path=SESSION_PATH):
+    """Autentica il client riusando la sessione salvata su disco: niente createSession,
+    che ha una quota molto stretta (30 ogni 5 minuti, 300 al giorno per handle).
+    Il client rinnova da solo i token scaduti e ogni nuova sessione (login o refresh)
+    viene riscritta su disco. La password si legge solo se la sessione non è più valida."""
+    from atproto import exceptions
+
+    path = session_path.format(username=username)
+    client.on_session_change(lambda event, session: _save_session(path, session.encode()))
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            session_string = f.read().strip()
+        try:
+            client.login(session_string=session_string)
+            registry.inc('logins', kind='session')
+            print(f"🔑 Sessione riusata per {username}")
+            return client
+        except (exceptions.AtProtocolError, ValueError) as e:
+            print(f"⚠️ Sessione salvata non più valida ({type(e).__name__}): nuovo login")
+
+    with open(password_path, 'r') as f:
+        password = f.read().strip()
+    client.login(username, password)
+    registry.inc('logins', kind='password')
+    print(f"✅ Loggato come {username}")
+    return client
+
+
+class LazyClient:
+    """Segnaposto del client: quello vero (import di atproto e login) viene creato
+    al primo attributo richiesto. Gli script si possono quindi importare, e le
+    esecuzioni servite dalla cache partono, senza rete e senza password."""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+def lazy_client(username, password_path=PASSWORD_PATH, session_path=SESSION_PATH, **kwargs):
+    """RateLimitedClient autenticato con login() al primo uso (kwargs vanno al client).
+    Più processi sullo stesso account devono usare session_path diversi: il refresh di
+    uno invaliderebbe i token salvati dall'altro."""
+    def connect():
+        from ratelimit import RateLimitedClient
+        return login(RateLimitedClient(**kwargs), username, password_path=password_path,
+                     session_path=session_path)
+    return LazyClient(connect)
@@ -0,0 +1,247 @@
+import numpy as np
+import pandas as pd
+
+from analytics import CSRGraph
+from columnar import load_columns, read_meta
+
+# --- CONFIGURAZIONE ---
+INPUT_PATH = 'dataset_hashtag.cols'     # Dataset a colonne (serve la colonna edges.timestamp)
+WINDOW = '1D'                           # Ampiezza della finestra (stringhe pandas: '1h', '1D', '7D', ...)
+STEP = '1D'                             # Passo tra due finestre (uguale a WINDOW: adiacenti; minore: sovrapposte)
+TIMELINE_PATH = 'timeline_hashtag.csv'  # Una riga per finestra
+SENTIMENT_COLUMN = 'sentiment_reazione'  # Scritta da sentiment.py (se manca, niente aggregati di sentiment)
+TOP_USERS = 3                           # Utenti più risposti riportati per ogni finestra
+
+
+def _ms(value):
+    """Istante (stringa, datetime, Timestamp o millisecondi) in millisecondi dall'epoca."""
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert('UTC').tz_localize(None)
+    return ts.value // 1_000_000
+
+
+def _duration_ms(value):
+    return int(value) if isinstance(value, (int, np.integer)) else pd.Timedelta(value).value // 1_000_000
+
+
+class TemporalEdgeIndex:
+    """Archi ordinati per timestamp: una query su un intervallo è una coppia di
+    searchsorted (O(log m)) e restituisce una fetta contigua degli array, senza scansioni.
+    I totali per intervallo (archi, like, repost, sentiment) vengono da somme cumulative;
+    il sentiment mancante (NaN) resta fuori sia dalla somma sia dal conteggio degli archi valutati.
+
+    Gli ID dei nodi restano quelli del dataset, quindi i grafi di finestre diverse
+    sono confrontabili nodo per nodo. Gli archi senza timestamp restano fuori dall'indice."""
+
+    def __init__(self, times, sources, targets, handles, sentiment=None, likes=None, reposts=None, rows=None):
+        times = np.asarray(times, dtype=np.int64)
+        order = np.argsort(times, kind='stable')
+        self.times = times[order]
+        self.sources = np.asarray(sources, dtype=np.int64)[order]
+        self.targets = np.asarray(targets, dtype=np.int64)[order]
+        self.rows = (np.arange(len(order)) if rows is None else np.asarray(rows, dtype=np.int64))[order]
+        self.handles = np.asarray(handles, dtype=object)
+        self.n = len(self.handles)
+        self.sentiment = None if sentiment is None else np.asarray(sentiment, dtype=np.float64)[order]
+        self._cumulative = {}
+        for name, values in (('likes', likes), ('reposts', reposts), ('sentiment', sentiment)):
+            if values is not None:
+                values = np.nan_to_num(np.asarray(values, dtype=np.float64)[order])
+                self._cumulative[name] = np.concatenate([[0.0], np.cumsum(values)])
+        if self.sentiment is not None:
+            scored = ~np.isnan(self.sentiment)
+            self._cumulative['scored'] = np.concatenate([[0.0], np.cumsum(scored)])
+
+    @classmethod
+    def from_columnar(cls, path, sentiment_column=SENTIMENT_COLUMN):
+        cols = load_columns(path, mmap=True, prefix='edges.')
+        if 'edges.timestamp' not in cols:
+            raise ValueError(f"❌ {path} non ha la colonna edges.timestamp: gli orari delle risposte "
+                             f"li salvano script33.py, distributed.py e firehose.py (non script1.py / script2.py)")
+        stamps = np.asarray(cols['edges.timestamp'], dtype='datetime64[ms]')
+        dated = np.flatnonzero(~np.isnat(stamps))
+        pick = (lambda name: np.asarray(cols[name])[dated] if name in cols else None)
+        handles = load_columns(path, mmap=True, prefix='nodes.handle')['nodes.handle']
+        return cls(stamps[dated].astype(np.int64), pick('edges.source'), pick('edges.target'), handles,
+                   sentiment=pick(f'edges.{sentiment_column}') if sentiment_column else None,
+                   likes=pick('edges.like_count'), reposts=pick('edges.repost_count'), rows=dated)
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def start(self):
+        return pd.Timestamp(int(self.times[0]), unit='ms') if len(self) else None
+
+    @property
+    def end(self):
+        return pd.Timestamp(int(self.times[-1]), unit='ms') if len(self) else None
+
+    # --- QUERY SU INTERVALLI [start, end) ---
+    def span(self, start, end):
+        """Posizioni (lo, hi) degli archi con start <= timestamp < end."""
+        lo = np.searchsorted(self.times, _ms(start), side='left')
+        hi = np.searchsorted(self.times, _ms(end), side='left')
+        return int(lo), int(max(lo, hi))
+
+    def count(self, start, end):
+        lo, hi = self.span(start, end)
+        return hi - lo
+
+    def total(self, name, start, end):
+        """Somma di 'likes', 'reposts', 'sentiment' o 'scored' (archi con sentiment) sull'intervallo, in O(log m)."""
+        lo, hi = self.span(start, end)
+        cumulative = self._cumulative[name]
+        return float(cumulative[hi] - cumulative[lo])
+
+    def edges(self, start, end):
+        """Archi dell'intervallo: (sorgenti, destinazioni, righe nel dataset), viste senza copia."""
+        lo, hi = self.span(start, end)
+        return self.sources[lo:hi], self.targets[lo:hi], self.rows[lo:hi]
+
+    def snapshot(self, start, end):
+        """Grafo CSR degli archi dell'intervallo (stessi ID dei nodi del dataset)."""
+        sources, targets, _ = self.edges(start, end)
+        return CSRGraph.from_ids(sources, targets, self.handles)
+
+    def windows(self, width=WINDOW, step=STEP, start=None, end=None):
+        return SlidingWindow(self, width, step, start, end)
+
+
+class SlidingWindow:
+    """Finestra scorrevole sull'indice. A ogni passo si applicano solo gli archi che
+    entrano e quelli che escono dalla finestra: gradi, conteggi e somme di sentiment
+    per nodo si aggiornano in O(archi cambiati), senza ricostruire niente.
+
+    Iterando si ottiene sempre lo stesso oggetto, aggiornato sul posto: gli array
+    (in_degree, out_degree, ...) vanno copiati se servono dopo il passo successivo."""
+
+    def __init__(self, index, width=WINDOW, step=STEP, start=None, end=None):
+        self.index = index
+        self.width = _duration_ms(width)
+        self.step = _duration_ms(step)
+        if self.width <= 0 or self.step <= 0:
+            raise ValueError("width e step devono essere positivi")
+        first = _ms(start) if start is not None else (int(index.times[0]) if len(index) else 0)
+        if start is None:
+            first -= first % self.step   # Finestre allineate al passo (es. a mezzanotte per '1D')
+        self.first = first
+        self.last = _ms(end) if end is not None else (int(index.times[-1]) + 1 if len(index) else first)
+        self._reset()
+
+    def _reset(self):
+        n = self.index.n
+        self.start = self.end = self.first
+        self.lo = self.hi = 0
+        self.in_degree = np.zeros(n, dtype=np.int64)
+        self.out_degree = np.zeros(n, dtype=np.int64)
+        self.in_sentiment = np.zeros(n)    # Somma del sentiment delle risposte ricevute
+        self.out_sentiment = np.zeros(n)   # Somma del sentiment delle risposte scritte
+        self.in_scored = np.zeros(n, dtype=np.int64)   # Risposte ricevute con un sentiment (non NaN)
+        self.active = 0                    # Nodi con almeno un arco nella finestra
+
+    def _apply(self, lo, hi, sign):
+        if hi <= lo:
+            return
+        index = self.index
+        sources, targets = index.sources[lo:hi], index.targets[lo:hi]
+        touched = np.unique(np.concatenate([sources, targets]))
+        before = (self.in_degree[touched] + self.out_degree[touched]) > 0
+        np.add.at(self.out_degree, sources, sign)
+        np.add.at(self.in_degree, targets, sign)
+        if index.sentiment is not None:
+            values = index.sentiment[lo:hi]
+            np.add.at(self.in_scored, targets, ~np.isnan(values) * sign)
+            values = np.nan_to_num(values) * sign
+            np.add.at(self.out_sentiment, sources, values)
+            np.add.at(self.in_sentiment, targets, values)
+        after = (self.in_degree[touched] + self.out_degree[touched]) > 0
+        self.active += int(after.sum()) - int(before.sum())
+
+    def move(self, start):
+        """Porta la finestra su [start, start + width): aggiorna con i soli archi cambiati."""
+        end = start + self.width
+        lo, hi = self.index.span(start, end)
+        if lo >= self.hi or hi <= self.lo:
+            # Nessuna sovrapposizione (finestre adiacenti o distanti): esce la vecchia, entra la nuova.
+            # Costa O(archi delle due finestre), non O(nodi) come azzerare gli array
+            self._apply(self.lo, self.hi, -1)
+            self._apply(lo, hi, 1)
+        else:
+            self._apply(self.lo, lo, -1)   # Usciti a sinistra
+            self._apply(self.hi, hi, 1)    # Entrati a destra
+            self._apply(lo, self.lo, 1)    # (solo se si torna indietro)
+            self._apply(hi, self.hi, -1)
+        self.start, self.end, self.lo, self.hi = start, end, lo, hi
+        return self
+
+    def __iter__(self):
+        self._reset()
+        start = self.first
+        while start < self.last:
+            yield self.move(start)
+            start += self.step
+
+    # --- LETTURA DELLA FINESTRA CORRENTE ---
+    @property
+    def n_edges(self):
+        return self.hi - self.lo
+
+    def graph(self):
+        """Grafo CSR della finestra corrente."""
+        return CSRGraph.from_ids(self.index.sources[self.lo:self.hi], self.index.targets[self.lo:self.hi],
+                                 self.index.handles)
+
+    def mean_in_sentiment(self):
+        """Sentiment medio delle risposte ricevute da ogni nodo (NaN per chi non ne ha di valutate)."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.in_scored > 0, self.in_sentiment / self.in_scored, np.nan)
+
+    def top(self, k=TOP_USERS):
+        """I k utenti con più risposte ricevute nella finestra."""
+        k = min(k, self.index.n)
+        if not k or not self.n_edges:
+            return []
+        top = np.argpartition(-self.in_degree, k - 1)[:k]
+        top = top[np.argsort(-self.in_degree[top], kind='stable')]
+        return [(self.index.handles[i], int(self.in_degree[i])) for i in top if self.in_degree[i] > 0]
+
+    def summary(self, top_users=TOP_USERS):
+        index = self.index
+        row = {
+            'start': pd.Timestamp(self.start, unit='ms'),
+            'end': pd.Timestamp(self.end, unit='ms'),
+            'edges': self.n_edges,
+            'active_users': self.active,
+        }
+        for name in ('likes', 'reposts'):
+            if name in index._cumulative:
+                row[name] = index.total(name, self.start, self.end)
+        if index.sentiment is not None:
+            scored = index.total('scored', self.start, self.end)
+            row['mean_sentiment'] = index.total('sentiment', self.start, self.end) / scored if scored else np.nan
+        row['top_users'] = ', '.join(f'{handle} ({n})' for handle, n in self.top(top_users))
+        return row
+
+
+def timeline(index, width=WINDOW, step=STEP, start=None, end=None, top_users=TOP_USERS):
+    """DataFrame con una riga per finestra (archi, utenti attivi, engagement, sentiment, utenti più risposti)."""
+    return pd.DataFrame([window.summary(top_users) for window in index.windows(width, step, start, end)])
+
+
+if __name__ == "__main__":
+    meta = read_meta(INPUT_PATH)
+    index = TemporalEdgeIndex.from_columnar(INPUT_PATH)
+    print(f"🕒 {len(index)} archi datati su {meta['n_edges']} ({index.start} → {index.end})")
+    if index.sentiment is None:
+        print(f"⚠️ Colonna edges.{SENTIMENT_COLUMN} assente: lancia sentiment.py per gli aggregati di sentiment")
+    frame = timeline(index)
+    frame.to_csv(TIMELINE_PATH, index=False)
+    print(f"📈 {len(frame)} finestre da {WINDOW} (passo {STEP}) salvate in {TIMELINE_PATH}")
+    if len(frame):
+        busiest = frame.loc[frame['edges'].idxmax()]
+        print(f"   Finestra più attiva: {busiest['start']} con {busiest['edges']} archi "
+              f"e {busiest['active_users']} utenti ({busiest['top_users']})")
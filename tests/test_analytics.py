@@ -0,0 +1,74 @@
+import networkx as nx
+import numpy as np
+import pytest
+# Versioni in puro Python di networkx: le pubbliche richiedono scipy, che il progetto non usa
+from networkx.algorithms.link_analysis.hits_alg import _hits_python as nx_hits
+from networkx.algorithms.link_analysis.pagerank_alg import _pagerank_python as nx_pagerank
+
+from analytics import CSRGraph
+
+
+def karate_replies(seed=0):
+    """Grafo delle risposte grande come il karate club: ogni amicizia diventa una o più
+    risposte in una direzione casuale (a volte in entrambe), più qualche auto-risposta."""
+    rng = np.random.default_rng(seed)
+    edges = []
+    for u, v in nx.karate_club_graph().edges():
+        a, b = (u, v) if rng.random() < 0.5 else (v, u)
+        edges += [(f'u{a}', f'u{b}')] * int(rng.integers(1, 4))
+        if rng.random() < 0.3:
+            edges.append((f'u{b}', f'u{a}'))
+    edges += [('u0', 'u0'), ('u33', 'u33')]
+    return edges
+
+
+def weighted_digraph(edges):
+    G = nx.DiGraph()
+    for u, v in edges:
+        w = G[u][v]['weight'] + 1 if G.has_edge(u, v) else 1
+        G.add_edge(u, v, weight=w)
+    return G
+
+
+@pytest.fixture(scope='module')
+def graphs():
+    edges = karate_replies()
+    return CSRGraph.from_edges(edges), weighted_digraph(edges)
+
+
+def assert_matches(graph, values, expected, **kwargs):
+    np.testing.assert_allclose([graph.to_dict(values)[h] for h in expected], list(expected.values()), **kwargs)
+
+
+def test_multi_edges_become_weights(graphs):
+    graph, G = graphs
+    assert graph.n == G.number_of_nodes() and len(graph.indices) == G.number_of_edges()
+    assert_matches(graph, graph.out_degree(), dict(G.out_degree(weight='weight')))
+    assert_matches(graph, graph.in_degree(weighted=False), dict(G.in_degree()))
+
+
+def test_pagerank_matches_networkx(graphs):
+    graph, G = graphs
+    assert_matches(graph, graph.pagerank(), nx_pagerank(G, alpha=0.85, tol=1e-12), atol=1e-8)
+
+
+def test_hits_matches_networkx(graphs):
+    graph, G = graphs
+    hub, authority = graph.hits()
+    nx_hub, nx_authority = nx_hits(G, tol=1e-12)
+    assert_matches(graph, hub, nx_hub, atol=1e-6)
+    assert_matches(graph, authority, nx_authority, atol=1e-6)
+
+
+def test_core_number_matches_networkx(graphs):
+    graph, G = graphs
+    simple = nx.Graph(G.to_undirected())
+    simple.remove_edges_from(nx.selfloop_edges(simple))
+    assert_matches(graph, graph.core_number(), nx.core_number(simple))
+
+
+def test_betweenness_with_all_sources_is_exact(graphs):
+    graph, G = graphs
+    unweighted = nx.DiGraph(G.edges())
+    unweighted.remove_edges_from(nx.selfloop_edges(unweighted))
+    assert_matches(graph, graph.approx_betweenness(k=graph.n), nx.betweenness_centrality(unweighted), atol=1e-9)
@@ -0,0 +1,109 @@
+import pytest
+
+import cache as cache_module
+from cache import CachedClient, CacheMiss, ResponseCache
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, 'time', clock)
+    return clock
+
+
+def counter():
+    calls = []
+
+    def call(value='risposta'):
+        calls.append(value)
+        return {'value': value, 'n': len(calls)}
+    return call, calls
+
+
+def test_ttl_expiry(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / 'c.sqlite'), ttl=10)
+    call, calls = counter()
+    assert cache.fetch('get_post_thread', {'uri': 'a'}, call)['n'] == 1
+    clock.now += 5
+    assert cache.fetch('get_post_thread', {'uri': 'a'}, call)['n'] == 1   # Ancora valida
+    clock.now += 6
+    assert cache.fetch('get_post_thread', {'uri': 'a'}, call)['n'] == 2   # Scaduta: richiesta di nuovo
+    assert (cache.hits, cache.misses) == (1, 2)
+    cache.close()
+
+
+def test_lru_eviction_keeps_recently_used(tmp_path, clock):
+    entry = len(cache_module.pickle.dumps('x' * 300, protocol=cache_module.pickle.HIGHEST_PROTOCOL))
+    cache = ResponseCache(str(tmp_path / 'c.sqlite'), max_mb=3.5 * entry / 1024 / 1024)
+    for key in 'abc':
+        clock.now += 1
+        cache.put(key, 'x' * 300)
+    clock.now += 1
+    assert cache.get('a') is not None     # 'a' diventa la voce usata più di recente
+    clock.now += 1
+    cache.put('d', 'x' * 300)             # Oltre il limite: esce 'b', la meno usata
+    assert cache.get('b') is None
+    assert all(cache.get(key) is not None for key in 'acd')
+    assert cache.evicted == 1 and cache._total_bytes == 3 * entry
+    cache.close()
+
+    # La dimensione totale viene riletta alla riapertura
+    reopened = ResponseCache(str(tmp_path / 'c.sqlite'))
+    reopened.get('a')
+    assert reopened._total_bytes == 3 * entry
+    reopened.close()
+
+
+def test_offline_mode_raises_cache_miss(tmp_path):
+    path = str(tmp_path / 'c.sqlite')
+    online = ResponseCache(path)
+    call, calls = counter()
+    online.fetch('search_posts', {'q': '#a'}, call)
+    online.close()
+
+    offline = ResponseCache(path, offline=True)
+    assert offline.fetch('search_posts', {'q': '#a'}, call)['n'] == 1
+    with pytest.raises(CacheMiss):
+        offline.fetch('search_posts', {'q': '#b'}, call)
+    # In modalità offline refresh non forza la rete: si legge comunque la cache
+    assert offline.fetch('search_posts', {'q': '#a'}, call, refresh=True)['n'] == 1
+    assert len(calls) == 1
+    offline.close()
+
+
+def test_refresh_updates_without_reading(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'c.sqlite'))
+    call, calls = counter()
+    cache.fetch('get_author_feed', {'actor': 'a'}, call)
+    assert cache.fetch('get_author_feed', {'actor': 'a'}, call, refresh=True)['n'] == 2
+    assert cache.fetch('get_author_feed', {'actor': 'a'}, call)['n'] == 2   # La risposta nuova è in cache
+    cache.close()
+
+
+def test_cached_client_refresh_per_endpoint(tmp_path):
+    class Client:
+        def __init__(self):
+            self.calls = []
+
+        def get_post_thread(self, uri, depth=None, parent_height=None):
+            self.calls.append(('thread', uri))
+            return len(self.calls)
+
+        def get_author_feed(self, actor, cursor=None, filter=None, limit=None):
+            self.calls.append(('feed', actor))
+            return len(self.calls)
+
+    client = Client()
+    cached = CachedClient(client, ResponseCache(str(tmp_path / 'c.sqlite')), refresh={'get_author_feed'})
+    assert cached.get_post_thread(uri='a', depth=6) == cached.get_post_thread(uri='a', depth=6) == 1
+    assert cached.get_post_thread(uri='a', depth=3) == 2   # Parametri diversi, chiave diversa
+    assert cached.get_author_feed(actor='x') == 3 and cached.get_author_feed(actor='x') == 4
+    cached.cache.close()
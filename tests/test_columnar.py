@@ -0,0 +1,158 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from columnar import (StringColumn, carry_node_columns, load_columns, load_dataset, load_edges_frame,
+                      load_nodes_frame, read_meta, save_columnar, save_columnar_stream, save_columns,
+                      snapshot_nodes)
+from dataset import Dataset, normalize_edges
+
+
+def thread(uri, edges, users=None):
+    """Un thread nel formato di RunJournal.iter_threads, a partire da archi come quelli di get_thread_data."""
+    posts, slim = normalize_edges(edges)
+    return uri, posts, slim, users or {}
+
+
+def reply(n, parent=None, **attrs):
+    attr = {'reply_uri': f'at://r/{n}', 'reply_content': f'risposta {n}'}
+    if parent is not None:
+        attr.update(trigger_uri=f'at://r/{parent}', trigger_text=f'risposta {parent}')
+    attr.update(attrs)
+    return attr
+
+
+def save_threads(path, threads, **kwargs):
+    return save_columnar_stream(lambda: iter(threads), str(path), **kwargs)
+
+
+def test_stream_dedups_reply_uris_across_threads(tmp_path):
+    threads = [
+        thread('t1', [('b', 'a', reply(1, 0, depth=1)), ('c', 'b', reply(2, 1, depth=2))]),
+        # La stessa risposta raggiunta da un secondo thread (o da una seconda esecuzione)
+        thread('t2', [('c', 'b', reply(2, 1, depth=2)), ('d', 'c', reply(3, 2, depth=3))]),
+        # Due risposte distinte tra gli stessi utenti restano due archi
+        thread('t3', [('b', 'a', reply(4, 0, depth=1))]),
+    ]
+    meta = save_threads(tmp_path / 'd.cols', threads, chunk_size=2)
+    assert meta['n_edges'] == 4
+    edges = load_edges_frame(str(tmp_path / 'd.cols'), categorical=False)
+    assert edges['reply_uri'].tolist() == ['at://r/1', 'at://r/2', 'at://r/3', 'at://r/4']
+    assert list(zip(edges['source'], edges['target'])) == [('b', 'a'), ('c', 'b'), ('d', 'c'), ('b', 'a')]
+    # I post ripetuti riusano l'ID della prima occorrenza
+    uris = load_columns(str(tmp_path / 'd.cols'), names=('posts.uri',))['posts.uri'].tolist()
+    assert len(uris) == len(set(uris))
+    assert edges['trigger_text'].tolist() == ['risposta 0', 'risposta 1', 'risposta 2', 'risposta 0']
+    assert edges['reply_content'].tolist() == [f'risposta {n}' for n in (1, 2, 3, 4)]
+    assert edges['depth'].tolist() == [1, 2, 3, 1]
+
+
+def test_stream_none_first_columns(tmp_path):
+    threads = [
+        thread('t1', [('b', 'a', reply(1, note=None, score=None)),
+                      ('c', 'a', reply(2, note=None, score=None))]),
+        thread('t2', [('d', 'a', reply(3, note='ciao', score=None))]),
+    ]
+    save_threads(tmp_path / 'd.cols', threads, chunk_size=1)
+    kinds = read_meta(str(tmp_path / 'd.cols'))['columns']
+    # Una colonna None in tutte le righe non diventa una colonna di interi
+    assert kinds['edges.note'] == 'str' and kinds['edges.score'] == 'str'
+    edges = load_edges_frame(str(tmp_path / 'd.cols'), categorical=False)
+    assert edges['note'].tolist() == ['', '', 'ciao']
+    assert edges['score'].tolist() == ['', '', '']
+
+
+def test_stream_mixed_int_float_and_timestamps(tmp_path):
+    threads = [
+        thread('t1', [('b', 'a', reply(1, like_count=3, weight=1, timestamp='2024-05-01T10:00:00.000Z'))]),
+        thread('t2', [('c', 'a', reply(2, like_count=None, weight=0.5,
+                                       timestamp='2024-05-01T12:00:00.123456+00:00')),
+                      ('d', 'a', reply(3, like_count=7, weight=None, timestamp=None))]),
+    ]
+    save_threads(tmp_path / 'd.cols', threads)
+    kinds = read_meta(str(tmp_path / 'd.cols'))['columns']
+    assert (kinds['edges.like_count'], kinds['edges.weight'], kinds['edges.timestamp']) == ('int', 'float', 'datetime')
+    edges = load_edges_frame(str(tmp_path / 'd.cols'))
+    assert edges['like_count'].dtype == np.int64 and edges['like_count'].tolist() == [3, 0, 7]
+    assert edges['weight'].dtype == np.float64
+    np.testing.assert_array_equal(edges['weight'], [1.0, 0.5, np.nan])
+    assert edges['timestamp'].dtype == 'datetime64[ms]'
+    assert edges['timestamp'].tolist()[:2] == [pd.Timestamp('2024-05-01 10:00:00'),
+                                               pd.Timestamp('2024-05-01 12:00:00.123')]
+    assert pd.isna(edges['timestamp'].iloc[2])
+
+
+def test_stream_empty_dataset(tmp_path):
+    meta = save_threads(tmp_path / 'd.cols', [])
+    assert (meta['n_nodes'], meta['n_posts'], meta['n_edges']) == (0, 0, 0)
+    edges = load_edges_frame(str(tmp_path / 'd.cols'))
+    assert len(edges) == 0 and list(edges.columns)[:4] == ['source', 'target', 'trigger_uri', 'trigger_text']
+    assert len(load_nodes_frame(str(tmp_path / 'd.cols'))) == 0
+
+
+def sample_dataset():
+    dataset = Dataset()
+    dataset.add_edges([
+        ('bob', 'alice', reply(1, 0, depth=1, like_count=2, timestamp='2024-05-01T10:00:00Z')),
+        ('carol', 'bob', reply(2, 1, depth=2, like_count=0, timestamp=None, reply_content='caffè ☕')),
+    ], {'alice': {'followers': 10, 'bio': 'ciao'}, 'bob': {'followers': 3}})
+    return dataset
+
+
+def test_save_columnar_round_trip(tmp_path):
+    path = str(tmp_path / 'd.cols')
+    dataset = sample_dataset()
+    meta = save_columnar(dataset, path)
+    assert (meta['n_nodes'], meta['n_posts'], meta['n_edges']) == (3, 3, 2)
+
+    # Testi: un buffer UTF-8 + offset per colonna, numeri in .npy
+    assert (tmp_path / 'd.cols' / 'posts.text.data.npy').exists()
+    assert (tmp_path / 'd.cols' / 'posts.text.offsets.npy').exists()
+    cols = load_columns(path)
+    assert isinstance(cols['edges.source'], np.memmap) and cols['edges.source'].dtype == np.int64
+    assert cols['edges.timestamp'].dtype == 'datetime64[ms]'
+    assert cols['nodes.followers'].dtype == np.int64
+    assert cols['posts.text'].tolist() == dataset.post_texts
+    assert not isinstance(load_columns(path, mmap=False)['edges.source'], np.memmap)
+    lazy = load_columns(path, lazy_strings=True)['posts.text']
+    assert isinstance(lazy, StringColumn) and lazy[2] == 'caffè ☕' and len(lazy) == 3
+
+    loaded = load_dataset(path)
+    assert loaded.handles == dataset.handles and loaded.post_uris == dataset.post_uris
+    assert loaded.users[0] == {'followers': 10, 'bio': 'ciao'}
+    assert loaded.users[2] == {'followers': 0, 'bio': ''}   # Attributi mancanti: valori di default
+    assert [edge[:2] for edge in loaded.iter_edges()] == [edge[:2] for edge in dataset.iter_edges()]
+    assert loaded.edge_attrs['timestamp'] == ['2024-05-01T10:00:00.000000Z', None]
+
+
+def test_save_columns_adds_and_replaces(tmp_path):
+    path = str(tmp_path / 'd.cols')
+    save_columnar(sample_dataset(), path)
+    save_columns(path, 'edges', {'weight': np.array([0.5, 1.5]), 'label': ['x', None]})
+    save_columns(path, 'nodes', pd.DataFrame({'followers': [1, 2, 3]}))
+    kinds = read_meta(path)['columns']
+    assert (kinds['edges.weight'], kinds['edges.label'], kinds['nodes.followers']) == ('float', 'str', 'int')
+    edges = load_edges_frame(path, categorical=False)
+    assert edges['weight'].tolist() == [0.5, 1.5] and edges['label'].tolist() == ['x', '']
+    assert load_nodes_frame(path)['followers'].tolist() == [1, 2, 3]
+    with pytest.raises(ValueError):
+        save_columns(path, 'edges', {'weight': [1.0]})
+
+
+def test_carry_node_columns_after_rewrite(tmp_path):
+    path = str(tmp_path / 'd.cols')
+    save_columnar(sample_dataset(), path)
+    save_columns(path, 'nodes', {'pagerank': [0.5, 0.3, 0.2]})
+    snapshot = snapshot_nodes(path)
+
+    # Nuova raccolta: carol sparisce, arriva dave; le colonne calcolate dopo (pagerank) tornano per handle
+    dataset = Dataset()
+    dataset.add_edges([('dave', 'bob', reply(3)), ('bob', 'alice', reply(1))], {'bob': {'followers': 4}})
+    save_columnar(dataset, path)
+    assert carry_node_columns(path, snapshot) == 2
+    nodes = load_nodes_frame(path).set_index('handle')
+    assert nodes.loc['bob', 'pagerank'] == 0.3 and nodes.loc['alice', 'pagerank'] == 0.5
+    assert np.isnan(nodes.loc['dave', 'pagerank'])
+    assert nodes.loc['bob', 'followers'] == 3       # Valore della versione precedente
+    assert nodes.loc['alice', 'bio'] == 'ciao'
+    assert snapshot_nodes(str(tmp_path / 'missing.cols')) is None
@@ -0,0 +1,62 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from analytics import CSRGraph
+from communities import _symmetric, louvain, modularity, polarization
+
+
+def karate():
+    """Karate club come grafo di risposte (una risposta per amicizia, direzione casuale)
+    con qualche risposta ripetuta e un'auto-risposta, che non conta per le comunità."""
+    rng = np.random.default_rng(0)
+    edges = []
+    for u, v in nx.karate_club_graph().edges():
+        a, b = (u, v) if rng.random() < 0.5 else (v, u)
+        edges += [(a, b)] * int(rng.integers(1, 3))
+    edges.append((5, 5))
+    sources, targets = (np.array(x, dtype=np.int64) for x in zip(*edges))
+    graph = CSRGraph.from_ids(sources, targets, [f'u{i}' for i in range(34)])
+
+    G = nx.Graph()
+    G.add_nodes_from(range(34))
+    for a, b in edges:
+        if a != b:
+            G.add_edge(a, b, weight=G[a][b]['weight'] + 1 if G.has_edge(a, b) else 1)
+    return graph, sources, targets, G
+
+
+def partition(labels):
+    return [set(np.flatnonzero(labels == c).tolist()) for c in range(labels.max() + 1)]
+
+
+@pytest.mark.parametrize('resolution', [1.0, 0.5, 2.0])
+def test_modularity_matches_networkx(resolution):
+    graph, _, _, G = karate()
+    labels = np.arange(34) % 3
+    expected = nx.community.modularity(G, partition(labels), weight='weight', resolution=resolution)
+    assert modularity(*_symmetric(graph), labels, resolution) == pytest.approx(expected, abs=1e-12)
+
+
+def test_louvain_is_as_good_as_networkx():
+    graph, _, _, G = karate()
+    labels = louvain(graph)
+    assert sorted(np.bincount(labels), reverse=True) == np.bincount(labels).tolist()   # 0 = la più grande
+    ours = modularity(*_symmetric(graph), labels)
+    assert ours == pytest.approx(nx.community.modularity(G, partition(labels), weight='weight'), abs=1e-12)
+    theirs = nx.community.modularity(G, nx.community.louvain_communities(G, weight='weight', seed=0),
+                                     weight='weight')
+    assert ours >= theirs - 0.01
+    assert (louvain(graph) == labels).all()   # Deterministico a parità di seed
+
+
+def test_community_assortativity_matches_networkx():
+    graph, sources, targets, _ = karate()
+    labels = louvain(graph)
+    result = polarization(sources, targets, labels, graph=graph)
+    replies = nx.MultiDiGraph()
+    replies.add_nodes_from((i, {'community': int(c)}) for i, c in enumerate(labels))
+    replies.add_edges_from(zip(sources.tolist(), targets.tolist()))
+    expected = nx.attribute_assortativity_coefficient(replies, 'community')
+    assert result['community_assortativity'] == pytest.approx(expected, abs=1e-6)
+    assert result['modularity'] == pytest.approx(modularity(*_symmetric(graph), labels), abs=1e-6)
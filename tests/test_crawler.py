@@ -0,0 +1,57 @@
+from crawler import SnowballCrawler
+
+
+def make_crawler(threads, posts, max_depth=1):
+    """threads: uri -> (autore, commentatori); posts: handle -> uri dei suoi post."""
+    fetched = []
+
+    def process_thread(uri):
+        fetched.append(uri)
+        author, commenters = threads[uri]
+        edges = [(c, author, {'reply_uri': f'{uri}#{c}'}) for c in commenters]
+        users = {c: {'type': 'commenter'} for c in commenters}
+        return edges, set(commenters), users, author
+
+    crawler = SnowballCrawler(process_thread, lambda handle: posts.get(handle, []), max_depth=max_depth,
+                              max_workers=2, requests_per_second=0)
+    return crawler, fetched
+
+
+THREADS = {
+    'b/1': ('b', ['c']),        # c visto per la prima volta al livello 2 (oltre max_depth = 1)
+    'a/1': ('a', ['c', 'd']),   # ... poi al livello 1, dentro il limite
+    'c/1': ('c', ['e']),
+}
+
+
+def test_handle_first_seen_past_limit_is_expanded_later():
+    crawler, fetched = make_crawler(THREADS, {'c': ['c/1']})
+    crawler.process_uris(['b/1'], depth=1)
+    assert crawler.depth['c'] == 2 and not crawler.frontier
+    crawler.process_uris(['a/1'], depth=0)
+    assert crawler.depth['c'] == 1
+    crawler.run()
+    assert 'c' in crawler.expanded and 'c/1' in fetched
+    # e (commentatore di c) è al livello 2: resta fuori
+    assert 'e' not in crawler.expanded
+
+
+def test_restore_keeps_lowest_depth():
+    crawler, fetched = make_crawler(THREADS, {'c': ['c/1']})
+    crawler.restore([('b/1', [('c', 'b', {})], {'c': {}}, 1, 'b'),
+                     ('a/1', [('c', 'a', {}), ('d', 'a', {})], {'c': {}, 'd': {}}, 0, 'a')], expanded=set())
+    assert crawler.depth['c'] == 1
+    crawler.run()
+    assert 'c' in crawler.expanded and fetched == ['c/1']
+
+
+def test_stale_frontier_entries_are_skipped():
+    crawler, _ = make_crawler({}, {})
+    crawler.discover('x', 2)
+    crawler.discover('x', 1)
+    crawler.discover('y', 1)
+    handle, depth = crawler._pop()
+    assert (handle, depth) == ('x', 1)
+    crawler.expanded.add('x')
+    assert crawler._pop() == ('y', 1)
+    assert crawler._pop() == (None, None)
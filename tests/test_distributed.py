@@ -0,0 +1,132 @@
+import json
+from multiprocessing import get_context
+
+import distributed
+from benchmark import FakeBluesky, fake_client
+from candidates import CandidateSelector
+from distributed import WorkQueue, paginate, worker_main
+
+ACCOUNT = {'username': 'bench.bsky.social', 'requests_per_second': 0, 'processes': 2}
+
+
+def queue_with(tmp_path, uris):
+    queue = WorkQueue(str(tmp_path / 'queue.sqlite'))
+    queue.record_page('#test', uris, None, len(uris), done=True)
+    return queue
+
+
+def test_complete_thread_stores_once(tmp_path):
+    queue = queue_with(tmp_path, ['at://a/post/1'])
+    # Il lease del primo worker scade: il lavoro passa al secondo, ma entrambi finiscono
+    first, = queue.lease('w0', 1, lease_seconds=-1)
+    second, = queue.lease('w1', 1)
+    assert first['key'] == second['key']
+    edges = [['bob', 'alice', 'at://b/post/2', 'at://a/post/1']]
+    assert queue.complete_thread(second, 'w1', [], edges, ['alice', 'bob'])
+    assert not queue.complete_thread(first, 'w0', [], edges, ['alice', 'bob'])
+    assert [uri for uri, *_ in queue.iter_threads()] == ['at://a/post/1']
+    assert queue.n_edges() == 1 and queue.count('n_nodes') == 2
+    assert queue.counts() == {'thread': {'done': 1}}
+
+
+def test_lease_expiry_and_release(tmp_path):
+    queue = queue_with(tmp_path, ['at://a/post/1', 'at://a/post/2'])
+    assert len(queue.lease('w0', 2)) == 2
+    assert queue.lease('w1', 2) == []            # Lease ancora validi
+    queue.close()
+
+    queue = WorkQueue(str(tmp_path / 'expired.sqlite'))
+    queue.record_page('#test', ['at://a/post/1'], None, 1, done=True)
+    for worker in ('w0', 'w1', 'w2'):
+        # Lease già scaduto (worker morto): il lavoro torna a chi lo chiede dopo
+        assert [task['key'] for task in queue.lease(worker, 1, lease_seconds=-1)] == ['at://a/post/1']
+    # Scaduto troppe volte: il lavoro viene messo da parte invece di tornare in coda
+    assert queue.lease('w3', 1, max_attempts=3) == []
+    assert queue.counts() == {'thread': {'failed': 1}}
+
+
+def test_fail_requeues_until_max_attempts(tmp_path):
+    queue = queue_with(tmp_path, ['at://a/post/1'])
+    for _ in range(2):
+        task, = queue.lease('w0', 1)
+        queue.fail(task, RuntimeError('boom'), max_attempts=3)
+        assert queue.counts() == {'thread': {'pending': 1}}
+    task, = queue.lease('w0', 1)
+    queue.fail(task, RuntimeError('boom'), max_attempts=3)
+    assert queue.counts() == {'thread': {'failed': 1}}
+    assert queue.lease('w0', 1) == []
+    assert queue.finished() is False               # Il coordinatore non ha ancora chiuso
+    queue.set('coordinator_done', 1)
+    assert queue.finished()
+
+
+def test_workers_with_fake_server(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    import script33
+    queue_path = str(tmp_path / 'queue.sqlite')
+    queue = WorkQueue(queue_path, config={'targets': ['#politics']})
+    selector = CandidateSelector(script33.extract_text_content, min_replies=script33.MIN_REPLIES)
+    paginate(fake_client(FakeBluesky()), queue, selector, '#politics', mode='HASHTAG', limit=20)
+    queued = queue.counts()['thread']['pending']
+    assert queued > 0
+    queue.set('coordinator_done', 1)
+
+    # Due processi veri (spawn, come nel coordinatore): il server finto arriva come argomento
+    ctx = get_context('spawn')
+    workers = [ctx.Process(target=worker_main, args=(f'w{i}', ACCOUNT, queue_path),
+                           kwargs={'threads': 2, 'expand_depth': 1, 'fake_server': True, 'max_user_tasks': 5})
+               for i in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=120)
+        assert worker.exitcode == 0
+
+    assert queue.finished()
+    counts = queue.counts()
+    assert counts['user'] == {'done': 5}
+    uris = [uri for uri, *_ in queue.iter_threads()]
+    done = {key for key, in queue._db.execute("SELECT key FROM tasks WHERE kind = 'thread' AND state = 'done'")}
+    assert len(uris) == len(set(uris)) == len(done) > queued
+    assert set(uris) == done
+    # Ogni URI è scritto da un solo worker: gli archi contati dai worker sono quelli in archivio
+    saved = sum(json.load(open(tmp_path / f'metrics_distributed_w{i}.json'))['edges'] for i in range(2))
+    stored = sum(n for n, in queue._db.execute('SELECT n_edges FROM threads'))
+    assert saved == stored == queue.n_edges()
+    queue.close()
+
+
+def test_account_rate_shares_budget():
+    assert distributed.account_rate({'username': 'other', 'requests_per_second': 6, 'processes': 2}) == 3
+    # Il coordinatore usa il primo account: la sua quota esce da quella dei worker
+    first = distributed.ACCOUNTS[0]
+    assert distributed.account_rate(first) == first['requests_per_second'] / (first.get('processes', 1) + 1)
+
+
+def test_user_task_retried_on_same_worker_keeps_its_posts(tmp_path, monkeypatch):
+    # Il primo tentativo trova i post dell'utente e poi fallisce: al secondo, sullo stesso
+    # worker, gli stessi post non devono risultare già visti
+    monkeypatch.chdir(tmp_path)
+    import script33
+    monkeypatch.setattr(script33, 'get_thread_data', lambda uri: ([], {}))
+    found = []
+    real = distributed.find_user_posts
+
+    def find_user_posts(client, selector, handle):
+        uris = real(client, selector, handle)
+        found.append(uris)
+        if len(found) == 1:
+            raise ConnectionError('risposta persa')
+        return uris
+
+    monkeypatch.setattr(distributed, 'find_user_posts', find_user_posts)
+    queue = WorkQueue(str(tmp_path / 'queue.sqlite'))
+    queue._db.execute("INSERT INTO tasks (key, kind, value, depth) VALUES ('user:u1', 'user', 'u1', 0)")
+    queue.set('coordinator_done', 1)
+    worker_main('w0', ACCOUNT, str(tmp_path / 'queue.sqlite'), threads=1, fake_server=True)
+
+    assert len(found) == 2 and found[0] and found[1] == found[0]
+    done = {key for key, in queue._db.execute("SELECT key FROM tasks WHERE kind = 'thread' AND state = 'done'")}
+    assert done == set(found[0])
+    assert queue.counts()['user'] == {'done': 1}
+    queue.close()
@@ -0,0 +1,91 @@
+import random
+import threading
+import time
+
+from fetcher import RateLimiter, fetch_all, fetch_threads
+
+
+class FlakyClient:
+    """Client finto: latenza casuale e un errore alla prima chiamata per gli item in fail_once."""
+
+    def __init__(self, fail_once=(), always_fail=()):
+        self.fail_once = set(fail_once)
+        self.always_fail = set(always_fail)
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def get(self, item):
+        with self._lock:
+            self.calls.append(item)
+            first = item in self.fail_once
+            self.fail_once.discard(item)
+        time.sleep(random.uniform(0, 0.005))
+        if first or item in self.always_fail:
+            raise ConnectionError(f'errore su {item}')
+        return item * 10
+
+
+def test_results_keep_input_order():
+    client = FlakyClient()
+    items = list(range(50))
+    assert list(fetch_threads(client.get, items, max_workers=8, requests_per_second=0)) == [i * 10 for i in items]
+
+
+def test_return_exceptions_keeps_going():
+    client = FlakyClient(always_fail={3})
+    results = list(fetch_threads(client.get, range(6), max_workers=3, requests_per_second=0,
+                                 return_exceptions=True))
+    assert isinstance(results[3], ConnectionError)
+    assert [r for i, r in enumerate(results) if i != 3] == [0, 10, 20, 40, 50]
+
+
+def test_fetch_all_retries_failures_once():
+    client = FlakyClient(fail_once={2, 7}, always_fail={5})
+    results = dict(fetch_all(client.get, range(10), max_workers=4, requests_per_second=0))
+    assert results[2] == 20 and results[7] == 70
+    assert isinstance(results[5], ConnectionError)
+    assert sorted(results) == list(range(10))
+    # Un solo giro di retry: gli item falliti vengono richiesti esattamente due volte
+    assert client.calls.count(2) == client.calls.count(5) == 2
+    assert client.calls.count(0) == 1
+
+
+def test_fetch_all_retry_keeps_input_order():
+    # Un errore transitorio non deve spostare l'item in fondo: l'ordine del GEXF dipende da questo
+    client = FlakyClient(fail_once={0, 4})
+    items = list(range(20))
+    results = list(fetch_all(client.get, items, max_workers=4, requests_per_second=0))
+    assert [item for item, _ in results] == items
+    assert [result for _, result in results] == [i * 10 for i in items]
+
+
+def test_rate_limit_spreads_tasks():
+    client = FlakyClient()
+    start = time.monotonic()
+    list(fetch_threads(client.get, range(11), max_workers=8, requests_per_second=50))
+    # 11 task a 50 al secondo: almeno 10 intervalli da 20 ms, qualunque sia il numero di worker
+    assert time.monotonic() - start >= 0.19
+
+
+def test_shared_limiter_between_calls():
+    limiter = RateLimiter(50)
+    start = time.monotonic()
+    for _ in range(2):
+        list(fetch_threads(FlakyClient().get, range(6), max_workers=4, limiter=limiter))
+    assert time.monotonic() - start >= 0.21
+
+
+def test_client_limiter_counts_every_request():
+    # Il budget vero è per richiesta: anche le chiamate extra dentro un task prendono uno slot
+    from ratelimit import AdaptiveRateLimiter
+
+    limiter = AdaptiveRateLimiter(requests_per_second=50)
+    start = time.monotonic()
+
+    def task(item):
+        for _ in range(3):   # Come un thread con due rami riscaricati
+            limiter.acquire()
+        return item
+
+    assert list(fetch_threads(task, range(4), max_workers=4, requests_per_second=0)) == [0, 1, 2, 3]
+    assert time.monotonic() - start >= 0.21
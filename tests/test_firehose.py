@@ -0,0 +1,104 @@
+import os
+
+from columnar import load_edges_frame, load_nodes_frame
+from firehose import HandleResolver, StreamGraph, StreamProcessor, iter_replay, run
+from journal import RunJournal, read_records
+
+REPLAY_PATH = os.path.join(os.path.dirname(__file__), 'data', 'jetstream_replay.jsonl')
+CONFIG = {'mode': 'firehose', 'hashtags': ['politics'], 'targets': []}
+
+A, B, C, D, E, F = (f'did:plc:{x}' for x in ('alice', 'bob', 'carol', 'dave', 'erin', 'frank'))
+EXPECTED = {(B, A), (C, B), (A, C), (F, D), (E, F)}
+
+
+def replay(tmp_path, events):
+    """Una esecuzione di firehose.py sugli eventi (con ripresa dal journal, se esiste)."""
+    journal_path = str(tmp_path / 'journal.jsonl')
+    journal = RunJournal(journal_path, CONFIG)
+    resolver = HandleResolver()
+    processor = StreamProcessor(resolver, hashtags=['politics'])
+    graph = StreamGraph(resolver, journal)
+    if journal.cursor:
+        processor.restore(read_records(journal_path))
+        graph.restore(read_records(journal_path))
+    meta = run(events, journal, processor, graph, batch_size=2, snapshot_seconds=0,
+               output_path=str(tmp_path / 'out.cols'))
+    records = list(journal.iter_thread_records())
+    journal.close()
+    return meta, records
+
+
+def journal_edges(records):
+    return [(source, target) for rec in records for source, target, _ in rec['edges']]
+
+
+def test_replay_produces_did_keyed_edges(tmp_path):
+    meta, records = replay(tmp_path, iter_replay(REPLAY_PATH))
+    # Nel journal gli archi usano i DID, anche per gli utenti con un evento 'identity'
+    assert sorted(journal_edges(records)) == sorted(EXPECTED)
+    assert meta['n_edges'] == len(EXPECTED)
+
+    # Al salvataggio i DID risolti diventano handle; bob (risolto dopo il suo primo arco) resta un nodo solo
+    nodes = set(load_nodes_frame(str(tmp_path / 'out.cols'))['handle'])
+    assert nodes == {'alice', 'bob', C, D, E, F}
+    edges = load_edges_frame(str(tmp_path / 'out.cols'))
+    assert set(zip(edges['source'].astype(str), edges['target'].astype(str))) == {
+        ('bob', 'alice'), (C, 'bob'), ('alice', C), (F, D), (E, F)}
+
+
+def test_resume_from_cursor_does_not_duplicate(tmp_path):
+    events = list(iter_replay(REPLAY_PATH))
+    replay(tmp_path, events[:6])
+    # Ripresa: lo stream riparte da prima del checkpoint (come dopo REWIND_SECONDS)
+    meta, records = replay(tmp_path, events)
+    assert sorted(journal_edges(records)) == sorted(EXPECTED)
+    assert meta['n_edges'] == len(EXPECTED)
+    replies = load_edges_frame(str(tmp_path / 'out.cols'))['reply_uri'].astype(str)
+    assert not replies.duplicated().any()
+
+
+def test_replayed_events_after_reconnect_are_skipped(tmp_path):
+    events = list(iter_replay(REPLAY_PATH))
+    meta, records = replay(tmp_path, events[:8] + events[2:])
+    assert sorted(journal_edges(records)) == sorted(EXPECTED)
+    assert meta['n_edges'] == len(EXPECTED)
+
+
+def test_snapshots_write_only_new_edges(tmp_path, monkeypatch):
+    # Uno snapshot per blocco: ogni segmento contiene solo gli archi accodati dopo il precedente
+    import firehose
+    segments = []
+    original = StreamGraph.snapshot
+
+    def snapshot(self, path):
+        meta = original(self, path)
+        if meta:
+            names = sorted(os.listdir(f"{path}.segments"))
+            segments.append(set(load_edges_frame(os.path.join(f"{path}.segments", names[-1]))['reply_uri']))
+        return meta
+
+    monkeypatch.setattr(firehose.StreamGraph, 'snapshot', snapshot)
+    journal = RunJournal(str(tmp_path / 'journal.jsonl'), CONFIG)
+    resolver = HandleResolver()
+    output = str(tmp_path / 'out.cols')
+    meta = run(iter_replay(REPLAY_PATH), journal, StreamProcessor(resolver, hashtags=['politics']),
+               StreamGraph(resolver, journal), batch_size=2, snapshot_seconds=1e-9, output_path=output)
+    journal.close()
+    seen = set().union(*segments)
+    assert sum(len(segment) for segment in segments) == len(seen) > 0
+    # A fine esecuzione i segmenti (più l'ultimo blocco) sono compattati nel dataset completo
+    assert meta['n_edges'] == len(EXPECTED)
+    assert not os.path.exists(f"{output}.segments") and not os.path.exists(f"{output}.tmp")
+    assert seen < set(load_edges_frame(output)['reply_uri'].astype(str))
+
+
+def test_reply_dedup_window_is_bounded(tmp_path):
+    journal = RunJournal(str(tmp_path / 'journal.jsonl'), CONFIG)
+    graph = StreamGraph(HandleResolver(), journal, dedup_seconds=1)
+    edge = (A, B, {'reply_uri': 'at://x/app.bsky.feed.post/1'})
+    assert graph.new_edges([edge], 1_000_000) == [edge]
+    assert graph.new_edges([edge], 1_500_000) == []
+    graph.new_edges([(A, B, {'reply_uri': 'at://x/app.bsky.feed.post/2'})], 3_000_000)
+    # Il primo hash è uscito dalla finestra: ne resta uno solo
+    assert len(graph.replies) == 1
+    journal.close()
@@ -0,0 +1,92 @@
+import os
+
+from journal import RunJournal, normalize_time, read_records
+
+CONFIG = {'mode': 'HASHTAG', 'targets': ['#politics'], 'posts_per_topic': 10}
+
+
+def edge(n):
+    return ('bob', 'alice', {'reply_uri': f'at://r/{n}', 'reply_content': f'risposta {n}',
+                             'trigger_uri': 'at://r/0', 'trigger_text': 'radice'})
+
+
+def write_run(path):
+    journal = RunJournal(path, CONFIG)
+    journal.record_page('#politics', ['t1', 't2', 't3'], 'c1', fetched=5, newest='2024-05-01T10:00:00Z')
+    journal.record_thread('t1', [edge(1)], {'bob': {}})
+    journal.record_thread('t2', [edge(2)], {'bob': {}})
+    journal.close()
+
+
+def test_resume_restores_pages_and_threads(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    write_run(path)
+    journal = RunJournal(path, CONFIG)
+    state = journal.target_state('#politics')
+    assert state['uris'] == ['t1', 't2', 't3'] and state['fetched'] == 5 and state['cursor'] == 'c1'
+    assert journal.is_done('t1') and journal.is_done('t2') and not journal.is_done('t3')
+    # I testi stanno nella tabella dei post del record, non sugli archi
+    [(uri, posts, edges, users)] = [t for t in journal.iter_threads() if t[0] == 't1']
+    assert posts['at://r/1'] == ['bob', 'risposta 1'] and 'reply_content' not in edges[0][2]
+    journal.close()
+
+
+def test_truncated_last_line_is_skipped(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    write_run(path)
+    # Crash durante la scrittura dell'ultimo record: metà riga, senza newline
+    with open(path, 'rb+') as f:
+        f.seek(-25, os.SEEK_END)
+        f.truncate()
+
+    journal = RunJournal(path, CONFIG)
+    assert journal.is_done('t1') and not journal.is_done('t2')
+    assert [uri for uri, *_ in journal.iter_threads()] == ['t1']
+    # Il nuovo record va su una riga nuova, non in coda a quella troncata
+    journal.record_thread('t2', [edge(2)], {'bob': {}})
+    assert [rec['uri'] for rec in journal.iter_thread_records()] == ['t1', 't2']
+    journal.close()
+    assert RunJournal(path, CONFIG).is_done('t2')
+
+
+def test_duplicate_thread_records_are_read_once(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    write_run(path)
+    journal = RunJournal(path, CONFIG)
+    journal.record_thread('t1', [edge(1)], {'bob': {}})   # Es. ripreso dopo un crash a metà
+    assert [uri for uri, *_ in journal.iter_threads()] == ['t1', 't2']
+    journal.close()
+
+
+def test_changed_config_archives_old_journal(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    write_run(path)
+    journal = RunJournal(path, dict(CONFIG, posts_per_topic=20))
+    assert not journal.is_done('t1') and not journal.targets
+    journal.close()
+
+    archived = [name for name in os.listdir(tmp_path) if name.endswith('.old')]
+    assert len(archived) == 1
+    # Il vecchio journal resta intatto; quello nuovo riparte dalla sola configurazione
+    old = list(read_records(str(tmp_path / archived[0])))
+    assert old[0]['config'] == CONFIG and sum(rec['type'] == 'thread' for rec in old) == 2
+    assert list(read_records(path)) == [{'type': 'config', 'config': dict(CONFIG, posts_per_topic=20)}]
+
+
+def test_newest_compares_as_time_not_text(tmp_path):
+    # Come stringhe '...10:00:00.5Z' > '...10:00:00.123456+00:00' ma anche '...Z' > '...+00:00'
+    assert normalize_time('2024-05-01T10:00:00Z') == '2024-05-01T10:00:00.000000Z'
+    assert normalize_time('2024-05-01T12:00:00.5+02:00') == '2024-05-01T10:00:00.500000Z'
+    assert normalize_time(None) is None and normalize_time('ieri') is None
+
+    path = str(tmp_path / 'journal.jsonl')
+    journal = RunJournal(path, CONFIG)
+    journal.record_page('#politics', [], 'c1', newest='2024-05-01T10:00:00.900+00:00')
+    journal.record_page('#politics', [], 'c2', newest='2024-05-01T10:00:00.12Z')
+    journal.close()
+    journal = RunJournal(path, CONFIG)
+    assert journal.target_state('#politics')['newest'] == '2024-05-01T10:00:00.900000Z'
+    journal.start_update()
+    since = journal.target_state('#politics')['since']
+    assert normalize_time('2024-05-01T10:00:01+00:00') > since > normalize_time('2024-05-01T10:00:00.5Z')
+    journal.close()
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+import sentiment
+from columnar import load_columns, save_columnar
+from dataset import Dataset
+from sentiment import score_columnar, score_texts
+
+
+@pytest.fixture
+def scored(monkeypatch):
+    """Testi passati davvero a VADER (quelli non trovati in cache)."""
+    calls = []
+    original = sentiment._score_chunk
+
+    def score_chunk(texts):
+        calls.extend(texts)
+        return original(texts)
+
+    monkeypatch.setattr(sentiment, '_score_chunk', score_chunk)
+    return calls
+
+
+def test_cache_scores_only_new_texts(tmp_path, scored):
+    cache = str(tmp_path / 'cache.sqlite')
+    first = score_texts(['good day', 'awful', 'good day'], cache_path=cache, workers=1)
+    assert scored == ['good day', 'awful']   # Ogni testo unico una volta sola
+
+    scored.clear()
+    second = score_texts(['awful', 'good day', 'great news'], cache_path=cache, workers=1)
+    assert scored == ['great news']
+    assert second[:2].tolist() == [first[1], first[0]]
+
+    scored.clear()
+    score_texts(['good day', 'great news'], cache_path=cache, workers=1)
+    assert scored == []
+
+
+def test_missing_text_is_nan(tmp_path, scored):
+    scores = score_texts(['', None, float('nan'), 'good day'], cache_path=str(tmp_path / 'cache.sqlite'), workers=1)
+    assert scores[0] == 0.0                      # Testo vuoto: esiste ed è neutro
+    assert np.isnan(scores[1]) and np.isnan(scores[2])
+    assert scores[3] > 0
+    assert 'nan' not in scored and None not in scored
+
+
+def test_score_columnar_propagates_post_scores(tmp_path):
+    dataset = Dataset()
+    dataset.add_edges([
+        ('b', 'a', {'trigger_uri': 'p1', 'trigger_text': 'I love this', 'reply_uri': 'p2',
+                    'reply_content': 'terrible idea'}),
+        ('c', 'b', {'trigger_uri': 'p2', 'trigger_text': 'terrible idea', 'reply_uri': 'p3',
+                    'reply_content': 'good day'}),
+        ('d', 'a', {'reply_uri': 'p4', 'reply_content': 'good day'}),   # Trigger assente
+    ], {})
+    path = str(tmp_path / 'data.cols')
+    save_columnar(dataset, path)
+    score_columnar(path, cache_path=str(tmp_path / 'cache.sqlite'), workers=1)
+
+    cols = load_columns(path)
+    posts = cols['posts.sentiment']
+    trigger, reply = cols['edges.trigger'], cols['edges.reply']
+    np.testing.assert_array_equal(cols['edges.sentiment_reazione'], posts[reply])
+    np.testing.assert_array_equal(cols['edges.sentiment_magnete'][trigger >= 0], posts[trigger[trigger >= 0]])
+    assert np.isnan(cols['edges.sentiment_magnete'][trigger < 0]).all()
+    assert (trigger < 0).sum() == 1
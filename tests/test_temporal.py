@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from temporal import SlidingWindow, TemporalEdgeIndex
+
+DAY = 86_400_000
+
+
+def random_index(seed=0, n=30, m=400):
+    rng = np.random.default_rng(seed)
+    times = rng.integers(0, 10 * DAY, m)
+    times[times > 6 * DAY] += 3 * DAY            # Un buco di qualche giorno: finestre vuote in mezzo
+    return TemporalEdgeIndex(times, rng.integers(0, n, m), rng.integers(0, n, m),
+                             [f'user{i}' for i in range(n)], sentiment=rng.uniform(-1, 1, m))
+
+
+def rebuilt(index, start, end):
+    """Stato della finestra ricostruito da zero, per confronto."""
+    window = SlidingWindow(index, end - start, end - start, start, end)
+    window._apply(*index.span(start, end), 1)
+    return window
+
+
+@pytest.mark.parametrize('width, step', [(DAY, DAY), (3 * DAY, DAY), (DAY, 2 * DAY)])
+def test_incremental_matches_rebuild(width, step):
+    index = random_index()
+    for window in index.windows(width, step):
+        expected = rebuilt(index, window.start, window.end)
+        assert window.n_edges == index.count(window.start, window.end)
+        assert window.active == expected.active
+        np.testing.assert_array_equal(window.in_degree, expected.in_degree)
+        np.testing.assert_array_equal(window.out_degree, expected.out_degree)
+        np.testing.assert_allclose(window.in_sentiment, expected.in_sentiment, atol=1e-9)
+
+
+def test_adjacent_windows_do_not_reset(monkeypatch):
+    index = random_index()
+    resets = []
+    original = SlidingWindow._reset
+    monkeypatch.setattr(SlidingWindow, '_reset', lambda self: (resets.append(1), original(self)))
+    windows = index.windows(DAY, DAY)
+    resets.clear()
+    assert sum(1 for _ in windows) > 1
+    assert len(resets) == 1                       # Solo all'inizio dell'iterazione
+
+
+def test_missing_sentiment_is_not_neutral():
+    # Archi senza sentiment (post mancante -> NaN) non contano come 0.0 nella media
+    index = TemporalEdgeIndex([0, 1, 2], [0, 1, 2], [3, 3, 3], [f'user{i}' for i in range(4)],
+                              sentiment=[0.5, np.nan, 0.3])
+    window = next(iter(index.windows(DAY, DAY)))
+    assert window.summary()['mean_sentiment'] == pytest.approx(0.4)
+    assert window.mean_in_sentiment()[3] == pytest.approx(0.4)
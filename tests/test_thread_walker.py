@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+
+from fetcher import fetch_all
+from thread_walker import walk_thread
+
+
+def node(uri, replies=None, reply_count=0):
+    return SimpleNamespace(post=SimpleNamespace(uri=uri, reply_count=reply_count), replies=replies)
+
+
+class ResponseError(Exception):
+    """Come le eccezioni di atproto: la risposta HTTP sta in .response."""
+
+    def __init__(self, status_code):
+        super().__init__(f'HTTP {status_code}')
+        self.response = SimpleNamespace(status_code=status_code)
+
+
+class SubtreeClient:
+    """Client finto: il thread completo è r -> a -> b -> c, ma la prima risposta si ferma
+    a b (limite di profondità) e il rifetch del sottoalbero di b fallisce le prime fail volte."""
+
+    def __init__(self, fail=0, status=503):
+        self.fail = fail
+        self.status = status
+        self.calls = []
+
+    def get_post_thread(self, uri, depth, parent_height=0):
+        self.calls.append(uri)
+        if uri == 'r':
+            return SimpleNamespace(thread=node('r', [node('a', [node('b', reply_count=1)], reply_count=1)],
+                                               reply_count=1))
+        if self.fail:
+            self.fail -= 1
+            raise ResponseError(self.status)
+        return SimpleNamespace(thread=node('b', [node('c')], reply_count=1))
+
+
+def edges(client, uri):
+    thread = client.get_post_thread(uri=uri, depth=2).thread
+    return [(reply.post.uri, parent.uri, level) for reply, parent, level in walk_thread(client, thread, depth=2)]
+
+
+FULL = [('a', 'r', 1), ('b', 'a', 2), ('c', 'b', 3)]
+
+
+def test_subtree_is_refetched():
+    client = SubtreeClient()
+    assert edges(client, 'r') == FULL
+    assert client.calls == ['r', 'b']
+
+
+def test_failed_subtree_refetch_retries_the_thread():
+    # Un 503 sul rifetch non deve produrre un thread "completo" senza il ramo di b:
+    # il thread fallisce e fetch_all lo ritenta per intero
+    client = SubtreeClient(fail=1, status=503)
+    [(uri, result)] = fetch_all(lambda uri: edges(client, uri), ['r'], max_workers=1, requests_per_second=0)
+    assert result == FULL
+    assert client.calls == ['r', 'b', 'r', 'b']
+
+
+def test_failed_subtree_refetch_is_reported():
+    client = SubtreeClient(fail=2, status=429)
+    [(uri, result)] = fetch_all(lambda uri: edges(client, uri), ['r'], max_workers=1, requests_per_second=0)
+    assert isinstance(result, ResponseError)
+
+
+def test_permanent_subtree_error_skips_the_branch():
+    # Un 4xx (es. post cancellato) non si risolve ritentando: il ramo viene saltato
+    client = SubtreeClient(fail=1, status=404)
+    assert edges(client, 'r') == FULL[:2]
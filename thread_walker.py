@@ -0,0 +1,53 @@
+from metrics import registry
+from ratelimit import is_retryable
+
+# --- CONFIGURAZIONE DI DEFAULT ---
+THREAD_DEPTH = 6          # Profondità chiesta a ogni get_post_thread
+MAX_REPLY_DEPTH = 20      # Livello massimo di risposta seguito (con rifetch dei sottoalberi)
+MAX_FANOUT = 500          # Massimo numero di risposte seguite per ogni post
+
+
+def walk_thread(client, thread, depth=THREAD_DEPTH, max_depth=MAX_REPLY_DEPTH, max_fanout=MAX_FANOUT):
+    """Visita iterativa (stack esplicito, nessun limite di ricorsione) di un albero di risposte.
+
+    Restituisce (reply_node, parent_post, level) per ogni risposta, dove parent_post è il
+    post a cui risponde direttamente. I sottoalberi troncati dal limite di profondità
+    dell'API vengono riscaricati solo se il post dichiara di avere risposte.
+    I nodi già visitati vengono staccati dall'albero, così la memoria resta proporzionale
+    allo stack (profondità x fan-out) e non all'intero thread.
+
+    Se il rifetch di un sottoalbero fallisce per un errore ritentabile (429, 5xx, rete)
+    l'eccezione si propaga: l'intero thread risulta fallito e verrà ritentato, invece di
+    finire nel journal senza quel ramo. Gli altri errori (es. post cancellato) saltano il ramo."""
+    # Ogni voce: (nodo, post genitore, livello assoluto, livello relativo all'ultimo fetch)
+    stack = [(thread, None, 0, 0)]
+    while stack:
+        node, parent_post, level, rel_level = stack.pop()
+        if parent_post is not None:
+            yield node, parent_post, level
+        if level >= max_depth:
+            continue
+
+        replies = getattr(node, 'replies', None)
+        if not replies and rel_level >= depth and (getattr(node.post, 'reply_count', 0) or 0) > 0:
+            # Sottoalbero tagliato dal limite di profondità: lo riscarichiamo da qui
+            try:
+                sub = client.get_post_thread(uri=node.post.uri, depth=min(depth, max_depth - level),
+                                             parent_height=0)
+                replies = getattr(sub.thread, 'replies', None)
+            except Exception as e:
+                registry.inc('subtree_errors', error=type(e).__name__)
+                if is_retryable(e):
+                    raise
+                replies = None
+            rel_level = 0
+        if not replies:
+            continue
+
+        children = [reply for reply in replies if hasattr(reply, 'post')][:max_fanout]
+        try:
+            node.replies = None  # Stacchiamo i figli: da ora li referenzia solo lo stack
+        except (AttributeError, TypeError, ValueError):
+            pass
+        for child in reversed(children):
+            stack.append((child, node.post, level + 1, rel_level + 1))